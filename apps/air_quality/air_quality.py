@@ -1,9 +1,45 @@
+from air_quality_startup import StartupReport, take_import_started  # First, so the report times the imports below
 import appdaemon.plugins.hass.hassapi as hass
-from datetime import datetime, timedelta, time
+import math
 import numpy as np
-import pandas as pd
+import os
+import re
+from datetime import datetime, timedelta, time
+from time import perf_counter
 import pytz
 from smarthome_global_v2 import *
+from air_quality_priority import PriorityEngine, ScoringSpec, to_float
+from air_quality_warnings import WarningThresholds
+from air_quality_commands import SERVICE_DATA_ARGS, CommandPlan
+from air_quality_cron import CronJobRun
+from air_quality_dashboard import (
+    CHART_CATEGORIES, OFF_CONDITION_ATTRIBUTES, ON_CONDITION_ATTRIBUTES, DashboardCards, apexcharts_card, condition_rows,
+    entities_card, markdown_card, rollup_apexcharts_card, room_card_id, state_switch_card, vertical_stack_card,
+)
+from air_quality_co2 import (
+    DEFAULT_FALLING, DEFAULT_REARM_INTERVAL, DEFAULT_RISING, SCOPES as CO2_SCOPES, Co2Trigger,
+)
+from air_quality_decisions import DecisionCache
+from air_quality_diffuser import DiffuserScheduler
+from air_quality_empty_tank import DEFAULT_WINDOW, EmptyTankDetector
+from air_quality_fan_curve import FanCurves
+from air_quality_forecast import DEFAULT_ALPHA, DEFAULT_BETA, DEFAULT_HORIZON, HoltForecaster
+from air_quality_history import (
+    DEFAULT_RETENTION_SECONDS, DEFAULT_SEGMENT_ROWS, DEFAULT_SEGMENT_SECONDS, HistoryStore,
+)
+from air_quality_inactivity import InactivityTracker
+from air_quality_latency import LatencyHistograms, timed_stage
+from air_quality_logging import LogGate
+from air_quality_provisioning import Provisioner
+from air_quality_publisher import RESTART_EVENTS, StatePublisher
+from air_quality_rollups import SensorRollups
+from air_quality_sensors import DEFAULT_CAPACITY, SENSOR_METRICS, SensorRingBuffer
+from air_quality_snapshot import SnapshotStore
+from air_quality_timers import DEFAULT_MAX_PER_KEY, TimerRegistry
+from air_quality_topology import REGISTRY_EVENTS, RoomTopology
+
+IMPORT_STARTED = take_import_started()  # None when AppDaemon reloads the app, which doesn't repeat the cold imports
+IMPORT_SECONDS = None if IMPORT_STARTED is None else perf_counter() - IMPORT_STARTED
 
 
 class AirQuality(Base):
@@ -13,13 +49,27 @@ class AirQuality(Base):
         """Initialize the HACS app."""
         self.app_name = "Adaptive Air Quality Priority System"
         super().initialize()  # Initialize the Base class
-        self.run_in(
-            self.generate_logging_cards,
-            delay=10,
-        )
+        self.schedule(('dashboard_cards', None), self.generate_logging_cards, delay=10)
 
     def setup(self):
+        setup_started = perf_counter()
+        self.startup_report = StartupReport(started=setup_started if IMPORT_STARTED is None else IMPORT_STARTED)
+        if IMPORT_SECONDS is not None:
+            self.startup_report.record('import', IMPORT_SECONDS)
         super().setup()
+        self.log_gate = LogGate(self.args.get('logging'))
+        self.latency_histograms = LatencyHistograms()
+        self.setup_timer_registry()
+        self.setup_topology()
+        self.decision_cache = DecisionCache(
+            deviation=self.args.get('sensor_deviation', 0.30),
+            max_age=self.args.get('priority_time', 600)
+        )
+        provisioning_config = self.args.get('provisioning', {})
+        self.provisioner = Provisioner(
+            provisioning_config['manifest'] if 'manifest' in provisioning_config
+            else self.data_path('air_quality_manifest.json')
+        )
         self.define_automation_boolean_checks()
         self.warning_thresholds = {
             'pm2_5': {'low': 0, 'high': 100},
@@ -36,6 +86,12 @@ class AirQuality(Base):
             'nox': {'low': 0, 'high': 50},  # ppm
             'air_pressure': {'low': 0, 'high': 1000}  # hPa
         }
+        self.warning_threshold_vectors = WarningThresholds(self.warning_thresholds)
+        self.warning_masks = {}
+        for entity_id in self.warning_threshold_vectors.entities:
+            self.listen_state(self.warning_threshold_callback, entity_id=entity_id)
+        self.refresh_warning_thresholds()
+
         warning_entities = {}
         group_dict = {
             "Warning Thresholds Low": [],
@@ -55,11 +111,14 @@ class AirQuality(Base):
                 group_dict[f"Warning Thresholds {threshold.title()}"].append(
                     f'input_number.warning_thresholds_{sensor}_{threshold}')
 
-        self.call_service(
+        self.provisioner.add(
+            'dashboard_group:warning_thresholds',
             service='pyscript/add_custom_dashboard_group',
             app_name=self.app_name_short,
             group_dict=group_dict
         )
+        self.schedule(('provision_entities', None), self.provision_entities, delay=self.time_to_delay_start,
+                      supersede=False)
 
         self.app_user_settings = {
             'input_numbers': {
@@ -213,22 +272,44 @@ class AirQuality(Base):
             'humidify': self.humidify_logic,
             'deodorize_and_refresh': self.deodorize_and_refresh_logic,
         }
-        self.diffuser_cycle_thread = {}
+        self.diffuser_scheduler = DiffuserScheduler()
         self.user_room_auto = False
         self.master_air_quality_thread = {}
-        self.empty_tank_listener = {}
+        self.cron_job_runs = {}
         self.priority_devices = {}
         self.master_off_kwargs = dict(
             include_priority=True,
             check_for_occupancy=True
         )
+        self.scoring_spec = ScoringSpec.compile(
+            self.args.get('scoring', {}),
+            rooms=[room_config['area_id'] for room_config in self.areas]
+        )
+        self.priority_engine = PriorityEngine(self.scoring_spec)
+        self.inactivity_tracker = InactivityTracker()
+        publisher_config = self.args.get('state_publisher', {})
+        self.state_publisher = StatePublisher(tolerances=publisher_config.get('tolerances'))
+        self.state_flush_interval = publisher_config.get('flush_interval', 1)
+        for event in RESTART_EVENTS:
+            self.listen_event(self.republish_states, event)
+        self.setup_fan_curves()
+        self.setup_sensor_history()
+        self.setup_rollups()
+        self.setup_forecasts()
+        self.setup_mode_listeners()
+        self.setup_empty_tank_detector()
+        self.setup_latency_metrics()
+        self.setup_history_store()
+        self.setup_snapshot()
         self.monitor_co2_levels()
-
+        self.startup_report.record('setup', perf_counter() - setup_started)
+        self.publish_startup_report()
 
     def define_automation_boolean_checks(self):
         """Define the dynamic conditions for the automation"""
         self.automation_boolean_checks = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(dict))))
         self.room_automation_booleans = {}
+        self.room_log_sensors = {}  # room -> {(device_type, master_onoff): conditions binary_sensor}
         # Iterate through every area
         for room_config in self.areas:
             room_id = room_config['area_id']
@@ -237,10 +318,10 @@ class AirQuality(Base):
             for master_onoff in ['on', 'off']:
                 # Create Latency variable for research
                 sensor_name = f"{room_name.title()} {self.app_name_short.replace('_', ' ').title()} {master_onoff.title()} Latency"
-                self.run_in(
-                    self.call_service,
-                    delay=self.time_to_delay_start,
+                self.provisioner.add(
+                    f'template_sensor:{sensor_name}',
                     service='pyscript/create_template_sensor',
+                    entity_id=f'sensor.{room_id}_{self.app_name_short}_{master_onoff}_latency',
                     sensor_name=sensor_name,
                     state='',
                     app_name=self.app_name_short,
@@ -303,10 +384,10 @@ class AirQuality(Base):
                     })
 
                     # Send YAML template to pyscript for creation
-                    self.run_in(
-                        self.call_service,
-                        delay=self.time_to_delay_start,
+                    self.provisioner.add(
+                        f'binary_sensor:{entity_id}',
                         service='pyscript/create_binary_sensor',
+                        entity_id=entity_id,
                         binary_sensor_name=entity_id,
                         associated_sensors=boolean_check[master_onoff],
                         device_type='occupancy',
@@ -317,69 +398,179 @@ class AirQuality(Base):
                         logic=' and ',
                     )
                     self.room_automation_booleans[entity_id] = room_id
+                    self.room_log_sensors.setdefault(room_id, {})[(device_type, master_onoff)] = entity_id
+
+    def now(self):
+        """Current local time. Every timestamp the app takes comes from here, so a replay can run it on a virtual
+        clock.
+        """
+        return datetime.now(self.timezone)
+
+    def publish_startup_report(self):
+        """Publish the startup timing breakdown in seconds. The state is the time to the first decision."""
+        summary = self.startup_report.summary()
+        self.publish_state(
+            f'sensor.{self.app_name_short}_startup',
+            state=summary.get('first_decision', 'starting'),
+            attributes={'unit_of_measurement': 'seconds', **summary}
+        )
+
+    def provision_entities(self, *args, **kwargs):
+        """Send only the new or changed entity definitions, all from this one callback, and persist the manifest.
+
+        pyscript creates one entity per service call, so changed definitions are still sent one call each.
+        """
+        provisioning_started = perf_counter()
+        pending = self.provisioner.pending(exists=lambda entity_id: self.get_state(entity_id) is not None)
+        for key, service, service_kwargs in pending:
+            self.call_service(service, **service_kwargs)
+        self.provisioner.commit([key for key, service, service_kwargs in pending])
+        self.startup_report.record('provisioning', perf_counter() - provisioning_started)
+        self.publish_startup_report()
+
+        self.log_lazy(
+            message=lambda: f"""
+                In provision_entities:
+                Provisioning Stats: {self.provisioner.stats}
+            """,
+            level='DEBUG',
+            function_name='provision_entities'
+        )
+
+    def setup_topology(self):
+        """Create the room topology index and drop it whenever an HA registry changes."""
+        self.topology = RoomTopology(
+            load_devices=lambda room: {
+                device_type: list((devices.get('all') or {}).keys())
+                for device_type, devices in self.controllable.get(room, {}).items()
+            },
+            load_patterns=lambda device_type: self.get_patterns(device_type, 'devices'),
+            load_domain=lambda room, domain: self.controller.get_matching_entities(area=room, domain=domain).keys()
+        )
+        self.dashboard_cards = DashboardCards()
+        for event in REGISTRY_EVENTS:
+            self.listen_event(self.topology_callback, event)
+
+    def topology_callback(self, *args, **kwargs):
+        self.topology.invalidate()
+        self.inactivity_tracker.seeded.clear()  # Pick up new devices on the next decision
+        self.subscribe_sensor_history()
+        self.schedule(('dashboard_cards', None), self.generate_logging_cards, delay=10)  # Coalesces event bursts
+        self.log_lazy(
+            message=lambda: f"""
+                In topology_callback:
+                {args[0] if args else 'Registry'} event received. Rebuilding room topology on next lookup.
+                Topology Stats: {self.topology.stats}
+            """,
+            level='DEBUG',
+            function_name='topology_callback'
+        )
+
+    def get_room_devices(self, room, device_type):
+        """Indexed entity_ids of the room's controllable devices of a (plural) device type."""
+        return self.topology.devices(room).get(device_type) or []
+
+    def get_device_patterns(self, device_type):
+        """Indexed get_patterns(device_type, 'devices')."""
+        return self.topology.device_patterns(device_type)
+
+    def get_diffuser_lights(self, room):
+        """Lights that belong to the room's oil diffusers."""
+        return self.topology.match(room, 'light', 'oil_diffuser')
+
+    def get_hvac_fans(self):
+        return self.topology.match(None, 'fan', 'hvac_fan$')
+
+    def log_lazy(self, message, level='INFO', log_room=None, function_name=None, message_args=None, **kwargs):
+        """log_info that skips all formatting when the level is gated out for the room and function.
 
+        message is either a callable returning the text or a str.format template filled from message_args.
+        """
+        if not self.log_gate.enabled(level, log_room, function_name):
+            return
+        if callable(message):
+            message = message()
+        elif message_args:
+            message = message.format(**message_args)
+        self.log_info(message=message, level=level, log_room=log_room, function_name=function_name, **kwargs)
+
+    @timed_stage('master_on')
     def master_on(self, *args, **kwargs):
 
         room = kwargs.get('room')
         override = kwargs.get('override', False)
-        controllable = kwargs.get('controllable', self.get_entities(room))
-        occupancy_sensors = kwargs.get('occupancy', self.room_sensor_entities[room]['occupancy'])
+        occupancy_sensors = kwargs.get('occupancy') or self.room_sensor_entities[room]['occupancy']
         master_conditions =  kwargs.get('master_conditions')
 
         priority_devices = self.decide_device_activation(room)
+        if self.startup_report.mark('first_decision'):
+            self.publish_startup_report()
         if not priority_devices:
             return
         priority_devices = priority_devices if isinstance(priority_devices, list) else [priority_devices]
 
-        for priority_device in priority_devices:
-            priority_device_plural = pluralize(priority_device)
+        turn_on_devices = []
+        with self.latency_histograms.stage(room, 'dispatch'):
+            for priority_device in priority_devices:
+                priority_device_plural = pluralize(priority_device)
 
-            if master_conditions.get(f"{priority_device_plural}_on") == 'off':
-                self.log_success_block(
-                    booleans={},
-                    room=room,
-                    success=False,
-                    master_on_off='on_conditions',
-                )
-                continue
+                if master_conditions.get(f"{priority_device_plural}_on") == 'off':
+                    self.log_success_block(
+                        booleans={},
+                        room=room,
+                        success=False,
+                        master_on_off='on_conditions',
+                    )
+                    continue
 
-            # Check mode and set device accordingly
-            continue_with_automation = self.continue_logic.get(priority_device, lambda x: False)(room)
-            if continue_with_automation:  # If mode behavior was triggered. Don't continue air quality logic
+                # Check mode and set device accordingly
+                continue_with_automation = self.continue_logic.get(priority_device, lambda x: False)(room)
+                if continue_with_automation:  # If mode behavior was triggered. Don't continue air quality logic
 
-                self.log_info(
-                    message=f"""
-                        In air_quality_logic - {room}:
-                        The priority device is {priority_device}.
-                        Turning on all {priority_device}s.
-                    """,
-                    level='INFO',
-                    log_room=room,
-                    function_name='master_on'
-                )
-                self.log_success_block(
-                    booleans={},
-                    room=room,
-                    success=True,
-                    master_on_off='on_conditions',
-                )
+                    self.log_lazy(
+                        message=lambda: f"""
+                            In air_quality_logic - {room}:
+                            The priority device is {priority_device}.
+                            Turning on all {priority_device}s.
+                        """,
+                        level='INFO',
+                        log_room=room,
+                        function_name='master_on'
+                    )
+                    self.log_success_block(
+                        booleans={},
+                        room=room,
+                        success=True,
+                        master_on_off='on_conditions',
+                    )
 
-                # Turn on the device
-                self.run_in(
-                    self.turn_on_logic[priority_device],
-                    delay=0,
-                    room=room,
-                )
+                    # Turn on the device
+                    turn_on_devices.append(priority_device)
 
-        # Turn off other devices
-        self.run_in(
-            self._master_off,
-            delay=0,
-            **kwargs,
-            include_priority=False
-        )
+            # Turn on the priority devices and turn off the others in one callback
+            self.schedule(
+                ('room_decision', room),
+                self.execute_room_decision,
+                delay=0,
+                **kwargs,
+                turn_on_devices=turn_on_devices
+            )
         return True
 
+    @timed_stage('commands')
+    def execute_room_decision(self, *args, **kwargs):
+        """Plan every command of a room decision and issue them as merged service calls."""
+        room = kwargs.get('room')
+        turn_on_devices = kwargs.pop('turn_on_devices', [])
+        plan = CommandPlan()
+        for device in turn_on_devices:
+            self.turn_on_logic[device](room=room, plan=plan)
+
+        # Turn off other devices
+        self._master_off(**kwargs, include_priority=False, plan=plan)
+        self.execute_command_plan(room, plan)
+
+    @timed_stage('master_off')
     def master_off(self, *args, **kwargs):
         room = kwargs.get('room')
         check_for_occupancy = kwargs.get('check_for_occupancy', False)
@@ -387,32 +578,39 @@ class AirQuality(Base):
         priority_device = self.priority_devices.get(room, {}).get('device', 'purifier')
         priority_device = priority_device if isinstance(priority_device, list) else [priority_device]
         master_conditions =  kwargs.get('master_conditions')
+        plan = kwargs.get('plan')
+        own_plan = plan is None
+        if own_plan:
+            plan = CommandPlan()
 
         # Turn off devices
-        for other_device, other_func in self.turn_off_logic.items():
-            other_device_plural = pluralize(other_device)
-            conditions = {
-                'include_priority': include_priority and other_device in priority_device,
-                'automation_boolean_checks': master_conditions.get(f"{other_device_plural}_off") == 'on',
-                'not_include_priority': not include_priority and other_device not in priority_device
-            }
-            if (conditions['automation_boolean_checks'] and
-                    (conditions['include_priority'] or conditions['not_include_priority'])):
-                self.turn_off_logic[other_device](room=room)
-                self.log_success_block(
-                    booleans={},
-                    room=room,
-                    success=True,
-                    master_on_off='off_conditions',
-                )
+        with self.latency_histograms.stage(room, 'dispatch'):
+            for other_device, other_func in self.turn_off_logic.items():
+                other_device_plural = pluralize(other_device)
+                conditions = {
+                    'include_priority': include_priority and other_device in priority_device,
+                    'automation_boolean_checks': master_conditions.get(f"{other_device_plural}_off") == 'on',
+                    'not_include_priority': not include_priority and other_device not in priority_device
+                }
+                if (conditions['automation_boolean_checks'] and
+                        (conditions['include_priority'] or conditions['not_include_priority'])):
+                    self.turn_off_logic[other_device](room=room, plan=plan)
+                    self.log_success_block(
+                        booleans={},
+                        room=room,
+                        success=True,
+                        master_on_off='off_conditions',
+                    )
 
-            elif not conditions['automation_boolean_checks']:
-                self.log_success_block(
-                    booleans={},
-                    room=room,
-                    success=False,
-                    master_on_off='off_conditions',
-                )
+                elif not conditions['automation_boolean_checks']:
+                    self.log_success_block(
+                        booleans={},
+                        room=room,
+                        success=False,
+                        master_on_off='off_conditions',
+                    )
+        if own_plan:
+            self.execute_command_plan(room, plan)
         return True
 
     def turn_off_diffuser(self, room, **kwargs):
@@ -420,17 +618,29 @@ class AirQuality(Base):
         if self.should_debounce(debounce_key):
             return
 
-        if self.diffuser_cycle_thread.get(room):
-            self.cancel_sequence(self.diffuser_cycle_thread[room])
-            self.diffuser_cycle_thread[room] = None
+        key = self.diffuser_scheduler.group(room)
+        if key is None:
+            return
+
+        if self.diffuser_scheduler.phase(key) == 'on':
+            own_plan = kwargs.get('plan') is None
+            plan = CommandPlan() if own_plan else kwargs['plan']
+            self.plan_diffuser_phase(plan, [room], 'off')
+            if own_plan:
+                self.execute_command_plan(room, plan)
+
+        self.diffuser_scheduler.leave(room)
+        if not self.diffuser_scheduler.rooms(key):
+            self.cancel_scheduled(('diffuser_cycle', f'{key[0]}/{key[1]}'))
 
     def turn_off_humidifier(self, room, **kwargs):
         debounce_key = f'{room}_turn_off_humidifier'
         if self.should_debounce(debounce_key):
             return
 
-        include_patterns, use_groups = self.get_patterns('humidifiers', 'devices')
-        response = self.controller.command_matching_entities(
+        include_patterns, use_groups = self.get_device_patterns('humidifiers')
+        response = self.command_devices(
+            plan=kwargs.get('plan'),
             identity_kwargs=self.app_name_short,
             hacs_commands='turn_off',
             area=room,
@@ -439,8 +649,8 @@ class AirQuality(Base):
 
         )
         if response:
-            self.log_info(
-                message=f"""
+            self.log_lazy(
+                message=lambda: f"""
                     In air_quality_logic - {room}:
                     Turning off humidifier.
                     {response}
@@ -456,9 +666,10 @@ class AirQuality(Base):
         if self.should_debounce(debounce_key):
             return
 
-        include_patterns, exclude_patterns = self.get_patterns('purifiers', 'devices')
+        include_patterns, exclude_patterns = self.get_device_patterns('purifiers')
 
-        response = self.controller.command_matching_entities(
+        response = self.command_devices(
+            plan=kwargs.get('plan'),
             identity_kwargs=self.app_name_short,
             hacs_commands='turn_off',
             area=room,
@@ -467,8 +678,8 @@ class AirQuality(Base):
         )
         if response:
             # Set fan percentage
-            self.log_info(
-                message=f"""
+            self.log_lazy(
+                message=lambda: f"""
                     In air_quality_logic - {room}:
                     Turning off purifier.
                     {response}
@@ -483,8 +694,9 @@ class AirQuality(Base):
         if self.should_debounce(debounce_key):
             return
 
-        include_patterns, use_groups = self.get_patterns('fans', 'devices')
-        response = self.controller.command_matching_entities(
+        include_patterns, use_groups = self.get_device_patterns('fans')
+        response = self.command_devices(
+            plan=kwargs.get('plan'),
             identity_kwargs=self.app_name_short,
             hacs_commands='turn_off',
             area=room,
@@ -494,8 +706,8 @@ class AirQuality(Base):
         )
 
         if response:
-            self.log_info(
-                message=f"""
+            self.log_lazy(
+                message=lambda: f"""
                     In air_quality_logic - {room}:
                     Turning off fan.
                     {response}
@@ -505,6 +717,71 @@ class AirQuality(Base):
                 function_name='turn_off_fan'
             )
 
+    def command_devices(self, hacs_commands, area, domain, plan=None, device_state=None, **kwargs):
+        """command_matching_entities, or add the commands to plan when one is given. Returns the same
+        {domain: {'entities': [...]}} response either way.
+        """
+        if plan is None:
+            if device_state is not None:
+                kwargs['device_state'] = device_state
+            return self.controller.command_matching_entities(
+                hacs_commands=hacs_commands,
+                area=area,
+                domain=domain,
+                **kwargs
+            )
+
+        identity_kwargs = kwargs.pop('identity_kwargs', None)
+        service_data = {key: kwargs.pop(key) for key in SERVICE_DATA_ARGS if key in kwargs}
+        if kwargs.get('include_only'):
+            entities = list(kwargs.get('include_manual_entities') or [])
+        elif set(kwargs) <= {'pattern'}:
+            entities = self.topology.match(area, domain, kwargs.get('pattern'))
+        else:
+            entities = list(self.controller.get_matching_entities(area=area, domain=domain, **kwargs).keys())
+        if device_state is not None:  # Planned commands count as already applied, as if the calls were made in order
+            entities = [
+                entity_id for entity_id in entities
+                if (plan.planned_state(entity_id) or self.get_state(entity_id)) in device_state
+            ]
+        if not entities:
+            return {}
+
+        commands = hacs_commands if isinstance(hacs_commands, dict) else {hacs_commands: {}}
+        for service, params in commands.items():
+            plan.add(domain, service, entities, identity_kwargs=identity_kwargs, **params, **service_data)
+        return {domain: {'entities': entities}}
+
+    def execute_command_plan(self, room, plan):
+        """Issue a plan's merged service calls in order. Calls planned with identity_kwargs go through the controller
+        like unplanned commands do, limited to the planned entities.
+        """
+        service_calls = list(plan.service_calls())
+        for domain, service, entities, params, identity_kwargs in service_calls:
+            if identity_kwargs is None:
+                self.call_service(f'{domain}/{service}', entity_id=entities, **params)
+                continue
+            self.controller.command_matching_entities(
+                identity_kwargs=identity_kwargs,
+                hacs_commands={service: params},
+                area=room,
+                domain=domain,
+                include_only=True,
+                include_manual_entities=entities,
+            )
+
+        self.log_lazy(
+            message=lambda: f"""
+                In execute_command_plan - {room}:
+                Merged {plan.planned} commands into {len(service_calls)} service calls.
+                {service_calls}
+            """,
+            level='DEBUG_1',
+            log_room=room,
+            function_name='execute_command_plan'
+        )
+        return len(service_calls)
+
     def execute_turn_off_command(self, room, debounce_key, check_for_occupancy=False):
 
         if self.should_debounce(debounce_key):
@@ -514,8 +791,8 @@ class AirQuality(Base):
             return False
 
         if self.manager.is_room_occupied(room) and check_for_occupancy:
-            self.log_info(
-                message=f"{room.title()} is still in use. Exiting...",
+            self.log_lazy(
+                message=lambda: f"{room.title()} is still in use. Exiting...",
                 level='INFO',
                 log_room=room,
                 function_name='execute_turn_off_command'
@@ -525,67 +802,109 @@ class AirQuality(Base):
         return True
 
     def turn_on_diffuser(self, room, **kwargs):
-        bad_states = ['None', None, 'unknown','unavailable']
         debounce_key = f'{room}_turn_on_diffuser'
-        master_conditions = self.get_master_conditions(room, master_onoff='on')
-        master_conditions = master_conditions.get('oil_diffusers_on') == 'on'
-        current_priority = self.priority_devices.get(room).get('device')
-
-        # Only de-bounces non-cycling (non-recursive calls)
-        if self.should_debounce(debounce_key) and kwargs.get('cycling') is None:
+        if self.should_debounce(debounce_key):
             return
 
         # Only proceed with function if oil diffuser is still the priority device and if conditions are still valid
-        if current_priority != 'oil_diffuser' or not master_conditions:
+        if not self.diffuser_is_active(room):
             return
 
-        # If this is a recursive-call, clear the sequence handle (since it is complete)
-        if kwargs.get('cycling'):
-            self.diffuser_cycle_thread[room] =  None
-
-
-        oil_diffusers = list(self.controllable[room]['oil_diffusers']['all'].keys())
-        lights = list(self.controller.get_matching_entities(
-            area=room,
-            domain='light',
-            pattern='oil_diffuser'
-        ).keys())
-
-        time_off = self.get_state(f'input_number.{room}_oil_diffuser_time_off')  # On for x seconds
-        time_on = self.get_state(f'input_number.{room}_oil_diffuser_time_on')  # On for x seconds
-        time_on = int(float(time_on)) if time_on not in bad_states else 10  # On for x seconds
-        time_off = int(float(time_off)) if time_off not in bad_states else 10  # On for x seconds
-
-
-        oil_diffuser_sequence = [
-                {'humidifier/turn_on': {'entity_id': oil_diffusers}},
-                {'humidifier/set_humidity': {'entity_id': oil_diffusers, 'humidity': 100}},
-                {'light/turn_on': {'entity_id': lights, 'color_name': 'green', 'brightness_pct': 100}},
-                {'sleep': time_on},
-                {'light/turn_on': {'entity_id': lights, 'color_name': 'red', 'brightness_pct': 100}},
-                {'humidifier/turn_off': {'entity_id': oil_diffusers}},
-                {'sleep': time_off},
-        ]
-
-        if self.diffuser_cycle_thread.get(room) is None:
-            self.log_info(
-                message=f"{room.title()} Diffuser cycle is Run",
+        if self.diffuser_scheduler.group(room) == self.get_diffuser_times(room):
+            self.log_lazy(
+                message=lambda: f"{room.title()} Diffuser cycle is already running. Exiting...",
                 level='DEBUG_3',
                 log_room=room,
                 function_name='diffuser_cycle_logic'
             )
-            self.diffuser_cycle_thread[room] = self.run_sequence(sequence=oil_diffuser_sequence)
-            self.run_in(self.turn_on_diffuser, delay=time_on+time_off+1, room=room, cycling=True)
+            return
 
-        elif self.diffuser_cycle_thread[room]:
-            self.log_info(
-                message=f"{room.title()} Diffuser cycle is already running. Exiting...",
-                level='DEBUG_3',
-                log_room=room,
-                function_name='diffuser_cycle_logic'
-            )
+        self.log_lazy(
+            message=lambda: f"{room.title()} Diffuser cycle is Run",
+            level='DEBUG_3',
+            log_room=room,
+            function_name='diffuser_cycle_logic'
+        )
+        self.start_diffuser(room, plan=kwargs.get('plan'))
+
+    def get_diffuser_times(self, room):
+        """The room's (time_on, time_off) duty cycle in seconds."""
+        bad_states = ['None', None, 'unknown','unavailable']
+        time_on = self.get_state(f'input_number.{room}_oil_diffuser_time_on')  # On for x seconds
+        time_off = self.get_state(f'input_number.{room}_oil_diffuser_time_off')  # Off for x seconds
+        time_on = int(float(time_on)) if time_on not in bad_states else 10
+        time_off = int(float(time_off)) if time_off not in bad_states else 10
+        return time_on, time_off
+
+    def diffuser_is_active(self, room):
+        """True while the oil diffuser is the room's priority device and its on conditions hold."""
+        current_priority = self.priority_devices.get(room, {}).get('device')
+        current_priority = current_priority if isinstance(current_priority, list) else [current_priority]
+        master_conditions = self.get_master_conditions(room, master_onoff='on')
+        return 'oil_diffuser' in current_priority and master_conditions.get('oil_diffusers_on') == 'on'
+
+    def start_diffuser(self, room, plan=None):
+        """Add the room to the group for its duty cycle. A new group starts ticking right away, otherwise the room
+        joins the group's current on phase or waits for its next one.
+        """
+        oil_diffusers = list(self.controllable[room]['oil_diffusers']['all'].keys())
+        lights = self.get_diffuser_lights(room)
+        key, is_new_group = self.diffuser_scheduler.join(room, *self.get_diffuser_times(room), oil_diffusers, lights)
+        if is_new_group:
+            self.diffuser_tick(group=key, phase='on')
+        elif self.diffuser_scheduler.phase(key) == 'on':
+            own_plan = plan is None
+            plan = CommandPlan() if own_plan else plan
+            self.plan_diffuser_phase(plan, [room], 'on')  # Switches off with the rest of the group
+            if own_plan:
+                self.execute_command_plan(room, plan)
+
+    def plan_diffuser_phase(self, plan, rooms, phase):
+        """Add one batched call per service that switches the rooms' diffusers and lights to the phase. The off phase
+        leaves out entities the plan already turns on, since those belong to a command the caller planned.
+        """
+        oil_diffusers, lights = self.diffuser_scheduler.room_entities(rooms)
+        if phase == 'on':
+            plan.add('humidifier', 'turn_on', oil_diffusers)
+            plan.add('humidifier', 'set_humidity', oil_diffusers, humidity=100)
+            plan.add('light', 'turn_on', lights, color_name='green', brightness_pct=100)
+        else:
+            oil_diffusers = [entity_id for entity_id in oil_diffusers if plan.planned_state(entity_id) != 'on']
+            lights = [entity_id for entity_id in lights if plan.planned_state(entity_id) != 'on']
+            plan.add('light', 'turn_on', lights, color_name='red', brightness_pct=100)
+            plan.add('humidifier', 'turn_off', oil_diffusers)
+
+    def diffuser_tick(self, *args, **kwargs):
+        """Switch every room of a duty cycle group to the phase and schedule the group's next tick."""
+        key = kwargs.get('group')
+        phase = kwargs.get('phase')
+        time_on, time_off = key
+
+        if phase == 'on':
+            # Rooms are re-checked once per cycle. Rooms whose duty cycle changed move to their new group.
+            for room in self.diffuser_scheduler.rooms(key):
+                if not self.diffuser_is_active(room):
+                    self.diffuser_scheduler.leave(room)
+                elif self.get_diffuser_times(room) != key:
+                    self.diffuser_scheduler.leave(room)
+                    self.start_diffuser(room)
+
+        rooms = self.diffuser_scheduler.rooms(key)
+        if not rooms:
             return
 
+        plan = CommandPlan()
+        self.plan_diffuser_phase(plan, rooms, phase)
+        self.execute_command_plan(None, plan)
+        self.diffuser_scheduler.set_phase(key, phase, since=self.now().timestamp())
+        self.schedule(
+            ('diffuser_cycle', f'{time_on}/{time_off}'),
+            self.diffuser_tick,
+            delay=time_on if phase == 'on' else time_off,
+            group=key,
+            phase='off' if phase == 'on' else 'on'
+        )
+
     def turn_on_humidifier(self, room, **kwargs):
         debounce_key = f'{room}_turn_on_humidifier'
         if self.should_debounce(debounce_key):
@@ -593,11 +912,12 @@ class AirQuality(Base):
 
         humidity_tolerance = float(self.get_state(f"input_number.{room}_humidity_tolerance"))
         humidity_target = float(self.get_state(f"input_number.{room}_humidity_tolerance"))
-        humidity = self.room_sensor_data[room]['humidity']
+        humidity = self.get_sensor_data(room)['humidity']
 
         if humidity <= humidity_tolerance:
-            include_patterns, use_groups = self.get_patterns('humidifiers', 'devices')
-            response = self.controller.command_matching_entities(
+            include_patterns, use_groups = self.get_device_patterns('humidifiers')
+            response = self.command_devices(
+                plan=kwargs.get('plan'),
                 hacs_commands={
                     'turn_on': {},
                     'set_mode': {'mode': 'manual'},
@@ -609,12 +929,10 @@ class AirQuality(Base):
                 device_state=['off', 'unavailable']
             )
             if response:
-                entities = response['humidifier'].get('entities')
-                for entity in entities:
-                    self.run_in(self.is_empty, 0, device=entity, room=room)
+                self.arm_empty_tank_detector(response['humidifier'].get('entities'))
 
-                self.log_info(
-                    message=f"""
+                self.log_lazy(
+                    message=lambda: f"""
                         In humidifier_logic - {room}:
                         Turning on humidifier.
                         {response}
@@ -625,8 +943,8 @@ class AirQuality(Base):
                 )
 
             else:
-                self.log_info(
-                    message=f"""
+                self.log_lazy(
+                    message=lambda: f"""
                         In humidifier_logic - {room}:
                         Humidifier is already on.
                     """,
@@ -640,11 +958,12 @@ class AirQuality(Base):
         if self.should_debounce(debounce_key):
             return
 
-        pm2_5 = self.room_sensor_data[room]['pm2_5']
+        pm2_5 = self.get_sensor_data(room)['pm2_5']
         fan_percentage = self.get_fan_percentage(room, pm2_5)  # Get fan percentage based on pm2.5 value
-        include_patterns, use_groups = self.get_patterns('purifiers', 'devices')
+        include_patterns, use_groups = self.get_device_patterns('purifiers')
 
-        response = self.controller.command_matching_entities(
+        response = self.command_devices(
+            plan=kwargs.get('plan'),
             identity_kwargs=self.app_name_short,
             hacs_commands={
                 'turn_on': {},
@@ -658,8 +977,8 @@ class AirQuality(Base):
 
         if response:
             # Set fan percentage
-            self.log_info(
-                message=f"""
+            self.log_lazy(
+                message=lambda: f"""
                     In air_quality_logic - {room}:
                     Setting fan percentage to {fan_percentage}%
                     {response}
@@ -674,8 +993,9 @@ class AirQuality(Base):
         if self.should_debounce(debounce_key):
             return
 
-        include_patterns, use_groups = self.get_patterns('fans', 'devices')
-        response = self.controller.command_matching_entities(
+        include_patterns, use_groups = self.get_device_patterns('fans')
+        response = self.command_devices(
+            plan=kwargs.get('plan'),
             identity_kwargs=self.app_name_short,
             hacs_commands='turn_on',
             area=room,
@@ -685,8 +1005,8 @@ class AirQuality(Base):
         )
 
         if response:
-            self.log_info(
-                message=f"""
+            self.log_lazy(
+                message=lambda: f"""
                     In air_quality_logic - {room}:
                     Turning on fan.
                     {response}
@@ -697,6 +1017,16 @@ class AirQuality(Base):
             )
 
             # Make sure to turn on oscillation if fan has oscillation feature
+            plan = kwargs.get('plan')
+            if plan is not None:
+                oscillating = [
+                    entity_id for entity_id in response['fan']['entities']
+                    if self.get_state(entity_id, attribute='oscillating') is not None
+                ]
+                if oscillating:
+                    plan.add('fan', 'oscillate', oscillating, identity_kwargs=self.app_name_short, oscillating=True)
+                return
+
             response = self.controller.command_matching_entities(
                 identity_kwargs=self.app_name_short,
                 hacs_commands='oscillate',
@@ -709,113 +1039,69 @@ class AirQuality(Base):
                 oscillating=True
             )
 
-    def is_empty(self, *args, **kwargs):
-        device = kwargs.get('device')
-        room = kwargs.get('room')
-        # Check if device has 'water_lacks' attribute and if it's True
-        device_state = self.controller.get_matching_entities(
-            domain='humidifier',
-            include_only=True,
-            include_manual_entities=[device],
-            get_attribute='water_lacks',
-        )
-        water_lacks = device_state[device].get('water_lacks', False)
-        if not pd.isna(water_lacks) and water_lacks:
-            self.log_info(
-                message=f"""
-                    In is_empty - {device}:
-                    Humidifier is empty. Informing User.
-                    {device_state}
-                """,
-                level='INFO',
-                log_room=room,
-                function_name='humidifier_empty_callback'
-            )
+    def setup_empty_tank_detector(self):
+        """Watch every humidifier with one listener and feed the per-device empty-tank state machines."""
+        self.empty_tank_detector = EmptyTankDetector(window=self.args.get('empty_tank_window', DEFAULT_WINDOW))
+        self.listen_state(self.humidifier_state_callback, 'humidifier', attribute='all')
+
+    def get_humidifier_rooms(self):
+        """{humidifier entity_id: room} for every room's humidifiers."""
+        return self.topology.rooms_of('humidifiers', [room_config['area_id'] for room_config in self.areas])
+
+    def arm_empty_tank_detector(self, entities):
+        """Start the empty-tank window for humidifiers that were just commanded."""
+        now = self.now().timestamp()
+        for entity_id in entities:
+            self.empty_tank_detector.commanded(entity_id, now)
+
+    def humidifier_state_callback(self, *args, **kwargs):
+        entity_id = args[0]
+        room = self.get_humidifier_rooms().get(entity_id)
+        if room is None:  # Oil diffusers share the humidifier domain
             return
 
-        # Otherwise, rely on the existing logic of checking if device turns off within 3 seconds of being turned on.
-        self.empty_tank_listener[device] = self.listen_state(
-            self.humidifier_empty_callback,
-            entity_id=device,
-            old='on',
-            new='off',
-            oneshot=True,
-            room=room
-        )
-        self.run_in(self._cancel_listen_state, 5, entity_id=device)
-
-    def humidifier_empty_callback(self, *args, **kwargs):
-        room = kwargs.get('room')
-        self.log_info(
-            message=f"""
-                In humidifier_empty_callback - {args[0]}:
+        old, new = args[2] or {}, args[3] or {}
+        now = self.now().timestamp()
+        if self.empty_tank_detector.transition(entity_id, old.get('state'), new.get('state'), now):
+            self.report_empty_tank(entity_id, room, 'Turned off right after being turned on')
+        elif self.empty_tank_detector.water_lacks(entity_id, new.get('attributes', {}).get('water_lacks')):
+            self.report_empty_tank(entity_id, room, 'Reports water_lacks')
+
+    def report_empty_tank(self, entity_id, room, reason):
+        """Fire one air_quality_humidifier_empty event per empty tank."""
+        self.fire_event('air_quality_humidifier_empty', entity_id=entity_id, room=room, reason=reason)
+        self.log_lazy(
+            message=lambda: f"""
+                In humidifier_empty_callback - {entity_id}:
                 Humidifier is empty. Informing User.
+                {reason}
+                Empty Tank Stats: {self.empty_tank_detector.stats}
             """,
             level='INFO',
             log_room=room,
             function_name='humidifier_empty_callback'
         )
 
-    def _cancel_listen_state(self, *args, **kwargs):
-        entity_id = kwargs.get('entity_id')
-        debounce_key = f'{entity_id}_cancel_listener'
-        if self.should_debounce(debounce_key):
-            return
-
-        if self.empty_tank_listener[entity_id] is not None:
-            self.cancel_listen_state(self.empty_tank_listener[entity_id])
-            self.empty_tank_listener[entity_id] = None
-
     def humidify_logic(self, *args, **kwargs):
         debounce_key = f'air_quality_humidify'
         if self.should_debounce(debounce_key):
             return
 
-        master_key = 'humidify'
-        self.master_air_quality_thread[master_key] = True
         app_settings = self.get_current_app_settings()
-
-        rooms = {
-                room_config['area_id']: room_config['name']      # Iterate through every area
-                for room_config in self.areas
-            }
         # All boolean must be true in order to run Air Circulation Automation
         automation_boolean_checks = {
             'humidify': self.get_state("input_boolean.automatic_humidify") == 'on',
         }
+        include_patterns, use_groups = self.get_device_patterns('humidifiers')
 
-        for area in rooms:
-            self.set_state(
-                entity_id=f"sensor.{area}_{self.app_name_short}_humidify",
-                state='Running'
-            )
-
-            self.log_success_block(
-                booleans=automation_boolean_checks,
-                room=area,
-                success=all(automation_boolean_checks.values()),
-                master_on_off='on_conditions'
-            )
-            self.run_in(
-                self.set_state,
-                15 * 60,
-                entity_id=f"sensor.{area}_{self.app_name_short}_humidify",
-                state='Not Running'
-            )
-
-            self.priority_devices[area] = {'device': 'humidifier', 'time': datetime.now(self.timezone)}
-            try:
-                humidity_tolerance = float(self.get_state(f"input_number.{area}_humidity_tolerance"))
-            except TypeError:
-                humidity_tolerance = app_settings.get(f"input_number.{area}_humidity_tolerance", 60)
-
+        room_commands = {}
+        for room_config in self.areas:  # Iterate through every area
+            area = room_config['area_id']
             try:
                 humidity_target = float(self.get_state(f"input_number.{area}_humidity_target"))
             except TypeError:
                 humidity_target = app_settings.get(f"input_number.{area}_humidity_target", 60)
 
-            include_patterns, use_groups = self.get_patterns('humidifiers', 'devices')
-
             commands = [
                 dict(
                     hacs_commands={
@@ -837,55 +1123,32 @@ class AirQuality(Base):
                     area=area
                 )
             ]
-            self.run_in(self._master_off, 0, room=area, include_priority=False)
-            self.master_automation_logic(
-                app_name='air_quality',
-                task_id=f'humidify_{area}',
-                master_name='humidify',
-                boolean_checks=automation_boolean_checks,
-                commands=commands,
-                final_commands=final_commands,
-                default_wait=15 * 60,
-                **kwargs
-            )
+            room_commands[area] = (commands, final_commands)
+
+        self.run_cron_job(
+            job='humidify',
+            master_key='humidify',
+            status='humidify',
+            priority_device='humidifier',
+            boolean_checks=automation_boolean_checks,
+            room_commands=room_commands,
+            include_priority=False,
+        )
 
     def deodorize_and_refresh_logic(self, *args, **kwargs):
         debounce_key = f'air_quality_deodorize_and_refresh'
         if self.should_debounce(debounce_key):
             return
-        master_key = 'deodorize_and_refresh'
-        self.master_air_quality_thread[master_key] = True
 
-        current_time = datetime.now(self.timezone)
-        rooms = {
-                room_config['area_id']: room_config['name']      # Iterate through every area
-                for room_config in self.areas
-            }        # All boolean must be true in order to run Air Circulation Automation
+        # All boolean must be true in order to run Air Circulation Automation
         automation_boolean_checks = {
             'deodorize_and_refresh': self.get_state("input_boolean.automatic_deodorize_and_refresh") == 'on',
         }
+        include_patterns, use_groups = self.get_device_patterns('oil_diffusers')
 
-        for area in rooms:
-            self.set_state(
-                entity_id=f"sensor.{area}_{self.app_name_short}_deodorize_and_refresh",
-                state='Running'
-            )
-
-            self.log_success_block(
-                booleans=automation_boolean_checks,
-                room=area,
-                success=all(automation_boolean_checks.values()),
-                master_on_off='on_conditions'
-            )
-            self.run_in(
-                self.set_state,
-                15 * 60,
-                entity_id=f"sensor.{area}_{self.app_name_short}_deodorize_and_refresh",
-                state='Not Running'
-            )
-
-            self.priority_devices[area] = {'device': 'oil_diffuser', 'time': current_time}
-            include_patterns, use_groups = self.get_patterns('oil_diffusers', 'devices')
+        room_commands = {}
+        for room_config in self.areas:  # Iterate through every area
+            area = room_config['area_id']
             commands = [
                 dict(
                     hacs_commands={
@@ -921,62 +1184,40 @@ class AirQuality(Base):
                     area=area
                 )
             ]
-
-            self.run_in(self._master_off, 0, room=area, include_priority=True)
-            self.master_automation_logic(
-                app_name='air_quality',
-                task_id=f'deodorize_and_refresh_{area}',
-                master_name='deodorize_and_refresh',
-                boolean_checks=automation_boolean_checks,
-                commands=commands,
-                final_commands=final_commands,
-                default_wait=15 * 60,
-                **kwargs
-            )
-        self.run_in(self.end_master_air_quality_thread, 15 * 60, master_key=master_key)
+            room_commands[area] = (commands, final_commands)
+
+        self.run_cron_job(
+            job='deodorize_and_refresh',
+            master_key='deodorize_and_refresh',
+            status='deodorize_and_refresh',
+            priority_device='oil_diffuser',
+            boolean_checks=automation_boolean_checks,
+            room_commands=room_commands,
+            include_priority=True,
+        )
 
     def circulate_air_logic(self, *args, **kwargs):
+        target = kwargs.get('target')  # A floor or room from the CO2 trigger. None runs the whole house.
+        target_rooms = kwargs.get('rooms')
 
-        debounce_key = f'air_quality_circulate_air'
-        master_key = 'circulate_air'
+        debounce_key = f'air_quality_circulate_air' if target is None else f'air_quality_circulate_air_{target}'
         if self.should_debounce(debounce_key):
             return
 
-        self.master_air_quality_thread[master_key] = True
-
         # Any boolean must be true to run Air Circulation quietly
         sleep_mode_boolean_checks = self.check_air_quality_mode_penalties('purifier')
         # All boolean must be true in order to run Air Circulation Automation
         automation_boolean_checks = {
             'circulate_air': self.get_state("input_boolean.automatic_air_circulation") == 'on',
         }
+        include_patterns, use_groups = self.get_device_patterns('purifiers')
+        include_fan_patterns, use_fan_groups = self.get_device_patterns('fans')
 
-        rooms = {
-                room_config['area_id']: room_config['name']      # Iterate through every area
-                for room_config in self.areas
-            }
-
-        for area in rooms:
-            self.priority_devices[area] = {'device': 'purifier', 'time': datetime.now(self.timezone)}
-            self.log_success_block(
-                booleans=automation_boolean_checks,
-                room=area,
-                success=all(automation_boolean_checks.values()),
-                master_on_off='on_conditions'
-            )
-            self.set_state(
-                entity_id=f"sensor.{area}_{self.app_name_short}_circulate_air",
-                state='Running'
-            )
-            self.run_in(
-                self.set_state,
-                15 * 60,
-                entity_id=f"sensor.{area}_{self.app_name_short}_circulate_air",
-                state='Not Running'
-            )
-            include_patterns, use_groups = self.get_patterns('purifiers', 'devices')
-            include_fan_patterns, use_fan_groups = self.get_patterns('fans', 'devices')
-
+        room_commands = {}
+        for room_config in self.areas:  # Iterate through every area
+            area = room_config['area_id']
+            if target_rooms is not None and area not in target_rooms:
+                continue
             commands = [
                 dict(
                     hacs_commands='turn_on',
@@ -1031,47 +1272,439 @@ class AirQuality(Base):
                     area=area
                 )
             ]
+            room_commands[area] = (commands, final_commands)
+
+        hvac_fans = self.get_hvac_fans()
+        self.run_cron_job(
+            job='air_circulation' if target is None else f'air_circulation_{target}',
+            master_key='circulate_air' if target is None else f'circulate_air_{target}',
+            status='circulate_air',
+            priority_device='purifier',
+            boolean_checks=automation_boolean_checks,
+            room_commands=room_commands,
+            include_priority=False,
+            house_commands=[('fan', 'turn_on', hvac_fans, {})],
+            house_final_commands=[('fan', 'turn_off', hvac_fans, {})],
+        )
 
-            self.run_in(self._master_off, 0, room=area, include_priority=False)
-            self.master_automation_logic(
-                app_name='air_quality',
-                task_id=f'air_circulation_{area}',
-                master_name='air_circulation',
-                boolean_checks=automation_boolean_checks,
-                commands=commands,
-                final_commands=final_commands,
-                default_wait=15 * 60,
-                **kwargs
+    def run_cron_job(self, job, master_key, status, priority_device, boolean_checks, room_commands, include_priority,
+                     house_commands=(), house_final_commands=(), duration=15 * 60):
+        """Run a house-wide cron job for every room in one pass.
+
+        room_commands maps each room to its (commands, final_commands), given as command_devices kwargs. The start
+        commands of all rooms are issued as one merged plan, after the master off of the other devices. A single
+        completion timer per job resets the status sensors and issues the final commands. house_commands are
+        (domain, service, entity_ids, params) that run whether or not the boolean checks pass.
+        """
+        self.master_air_quality_thread[master_key] = True
+        now = self.now()
+        success = all(boolean_checks.values())
+
+        replaced = self.cron_job_runs.get(job)
+        run = self.cron_job_runs[job] = CronJobRun(
+            job=job,
+            master_key=master_key,
+            status=status,
+            rooms=room_commands,
+            final_commands=[
+                command
+                for commands, final_commands in room_commands.values()
+                for command in final_commands
+            ] if success else [],
+            house_final_commands=house_final_commands,
+        )
+        if replaced is not None and not replaced.finished:
+            run.carry(replaced)  # Its completion timer is superseded below
+
+        # The master off of the other devices runs first and on its own, so it cannot cancel the job's start commands
+        off_plan = CommandPlan()
+        for room in room_commands:
+            self.priority_devices[room] = {'device': priority_device, 'time': now}
+            self._master_off(room=room, include_priority=include_priority, plan=off_plan)
+        off_calls = self.execute_command_plan(None, off_plan)
+
+        plan = CommandPlan()
+        for room, (commands, final_commands) in room_commands.items():
+            self.publish_state(entity_id=f"sensor.{room}_{self.app_name_short}_{status}", state='Running')
+            self.log_success_block(
+                booleans=boolean_checks,
+                room=room,
+                success=success,
+                master_on_off='on_conditions'
             )
-        hvac_fans = self.controller.get_matching_entities(
-            domain='fan',
-            pattern='hvac_fan$',
+            if success:
+                for command in commands:
+                    self.command_devices(plan=plan, **command)
+
+        for domain, service, entity_ids, params in house_commands:
+            if entity_ids:
+                plan.add(domain, service, entity_ids, **params)
+
+        run.record(off_plan, off_calls)
+        run.record(plan, self.execute_command_plan(None, plan))
+        self.schedule((job, None), self.finish_cron_job, duration, job=job)  # Supersedes an unfinished run
+        run.stats['timers'] = 1
+        self.report_cron_job(run)
+
+    def finish_cron_job(self, *args, **kwargs):
+        """Issue a cron job's final commands for every room and reset its status sensors."""
+        run = self.cron_job_runs.get(kwargs.get('job'))
+        if run is None or run.finished:
+            return
+        run.finished = True
+
+        plan = CommandPlan()
+        for command in run.final_commands:
+            self.command_devices(plan=plan, **command)
+        for domain, service, entity_ids, params in run.house_final_commands:
+            if entity_ids:
+                plan.add(domain, service, entity_ids, **params)
+        run.record(plan, self.execute_command_plan(None, plan))
+
+        for room in run.rooms:
+            self.publish_state(entity_id=f"sensor.{room}_{self.app_name_short}_{run.status}", state='Not Running')
+        self.end_master_air_quality_thread(master_key=run.master_key)
+        self.report_cron_job(run)
+
+    def report_cron_job(self, run):
+        """Publish the fan-out cost of a cron job run."""
+        self.publish_state(
+            f'sensor.{self.app_name_short}_{run.job}_fan_out',
+            state=run.stats['service_calls'],
+            attributes=dict(run.stats)
+        )
+        self.log_lazy(
+            message=lambda: f"""
+                In run_cron_job - {run.job}:
+                Fan-out: {run.stats}
+            """,
+            level='DEBUG',
+            function_name='run_cron_job'
         )
-
-        self.run_in(self.call_service, delay=0, service='fan/turn_on', entity_id=list(hvac_fans.keys()))
-        self.run_in(self.call_service, delay=15 * 60, service='fan/turn_off', entity_id=list(hvac_fans.keys()))
-        self.run_in(self.end_master_air_quality_thread, 15 * 60, master_key=master_key)
 
     def monitor_co2_levels(self):
-        # Create automation that monitors Home CO2 levels
+        """Run air circulation when CO2 rises over the co2_trigger threshold, for the whole house or only the floor
+        or room whose sensors crossed it.
+        """
+        co2_config = self.args.get('co2_trigger', {})
+        scope = co2_config.get('scope', 'house')
+        if scope not in CO2_SCOPES:
+            raise ValueError(f"co2_trigger scope must be one of {CO2_SCOPES}, got {scope!r}")
+        self.co2_trigger = Co2Trigger(
+            rising=co2_config.get('rising', DEFAULT_RISING),
+            falling=co2_config.get('falling', DEFAULT_FALLING),
+            rearm_interval=co2_config.get('rearm_interval', DEFAULT_REARM_INTERVAL)
+        )
+
+        # Rooms by longest area_id first, so a sensor is matched to the most specific room
+        areas = sorted(self.areas, key=lambda room_config: len(room_config['area_id']), reverse=True)
+        self.co2_target_rooms = {'house': None}
         group_co2 = self.controller.get_matching_entities(
             domain='sensor',
             pattern='co2s$',
         )
-        for entity_id, entity_state in group_co2.items():
-            self.listen_state(
-                self.circulate_air_logic,
-                entity_id=entity_id,
-                new=lambda x: x not in ['unavailable', 'unknown', None, 'None'] and float(x) > 1100,
+        for entity_id in group_co2:
+            object_id = entity_id.split('.', 1)[1]
+            room_config = next((area for area in areas if object_id.startswith(f"{area['area_id']}_")), None)
+            if scope == 'house' or room_config is None:
+                target = 'house'
+            elif scope == 'floor':
+                target = room_config['floor_id']
+                self.co2_target_rooms[target] = [
+                    area['area_id'] for area in self.areas if area['floor_id'] == target
+                ]
+            else:
+                target = room_config['area_id']
+                self.co2_target_rooms[target] = [target]
+
+            self.co2_trigger.add_sensor(entity_id, target, to_float(self.get_state(entity_id)))
+            self.listen_state(self.co2_callback, entity_id=entity_id)
+        self.schedule(('co2_startup_check', None), self.co2_startup_check, delay=self.time_to_delay_start,
+                      supersede=False)
+
+    def co2_startup_check(self, *args, **kwargs):
+        """Circulate air once for targets whose CO2 was already over the rising threshold at startup."""
+        now = self.now().timestamp()
+        for target in self.co2_trigger.fire_high(now):
+            self.co2_circulate(target, f"CO2 was above {self.co2_trigger.rising} ppm at startup", 'co2_startup_check')
+        for target in self.co2_trigger.targets:
+            self.schedule_co2_rearm(target, now)
+
+    def co2_callback(self, *args, **kwargs):
+        entity_id, new = args[0], args[3]
+        now = self.now().timestamp()
+        target = self.co2_trigger.update(entity_id, to_float(new), now)
+        if target is None:
+            self.schedule_co2_rearm(self.co2_trigger.sensor_targets.get(entity_id), now)
+            return
+        self.co2_circulate(target, f"CO2 rose above {self.co2_trigger.rising} ppm", 'co2_callback')
+
+    def schedule_co2_rearm(self, target, now):
+        """Check a rate-limited target again when its re-arm interval expires, since a steady reading sends no
+        further updates.
+        """
+        rearm_at = self.co2_trigger.rearm_at(target)
+        if rearm_at is None:
+            return
+        self.schedule(('co2_rearm', target), self.co2_rearm_check, delay=max(rearm_at - now, 0), target=target)
+
+    def co2_rearm_check(self, *args, **kwargs):
+        target = kwargs.get('target')
+        if self.co2_trigger.fire_pending(target, self.now().timestamp()):
+            self.co2_circulate(
+                target, f"CO2 stayed above {self.co2_trigger.rising} ppm past the re-arm interval", 'co2_rearm_check'
             )
 
+    def co2_circulate(self, target, reason, function_name):
+        self.log_lazy(
+            message=lambda: f"""
+                In {function_name}:
+                {reason}. Circulating air for {target}.
+                CO2 Trigger Stats: {self.co2_trigger.stats}
+            """,
+            level='INFO',
+            log_room=target if self.co2_target_rooms[target] == [target] else None,
+            function_name=function_name
+        )
+        self.circulate_air_logic(
+            target=None if target == 'house' else target,
+            rooms=self.co2_target_rooms[target]
+        )
+
     def end_master_air_quality_thread(self, *args, **kwargs):
         master_key = kwargs.get('master_key')
         self.master_air_quality_thread[master_key] = False
 
+    def setup_sensor_history(self):
+        """Subscribe to every matched sensor entity so decisions read sensor data from memory."""
+        history_config = self.args.get('sensor_history', {})
+        self.sensor_history_capacity = history_config.get('capacity', DEFAULT_CAPACITY)
+        self.sensor_snapshot_ttl = history_config.get('snapshot_ttl', 300)
+        self.sensor_history = {}
+        self.sensor_entity_values = {}
+        self.sensor_data_snapshots = {}  # room -> (timestamp, _get_sensor_data snapshot)
+        self.sensor_history_handles = {}  # (room, metric, entity_id) -> listen_state handle
+        for room_config in self.areas:
+            self.sensor_history[room_config['area_id']] = SensorRingBuffer(capacity=self.sensor_history_capacity)
+        self.subscribe_sensor_history()
+
+    def subscribe_sensor_history(self):
+        """Listen to the current sensors of every room and metric, dropping sensors that left the room. Runs again
+        on every registry change so group membership changes are picked up.
+        """
+        subscriptions = {
+            (room_config['area_id'], metric, entity_id)
+            for room_config in self.areas
+            for metric, entities in self.room_sensor_entities.get(room_config['area_id'], {}).items()
+            if metric in SENSOR_METRICS
+            for entity_id in entities
+        }
+        for key in set(self.sensor_history_handles) - subscriptions:
+            room, metric, entity_id = key
+            self.cancel_listen_state(self.sensor_history_handles.pop(key))
+            self.sensor_entity_values[(room, metric)].pop(entity_id, None)
+        for key in subscriptions - set(self.sensor_history_handles):
+            room, metric, entity_id = key
+            self.sensor_entity_values.setdefault((room, metric), {})
+            self.sensor_history_handles[key] = self.listen_state(
+                self.sensor_history_callback, entity_id=entity_id, room=room, metric=metric
+            )
+
+        subscribed = {(room, metric) for room, metric, entity_id in subscriptions}
+        for key in set(self.sensor_entity_values) - subscribed:
+            del self.sensor_entity_values[key]  # Read from the snapshot again
+        self.sensor_data_snapshots.clear()
+
+    def sensor_history_callback(self, *args, **kwargs):
+        """Append the room's aggregated metric value whenever one of its sensors reports."""
+        room = kwargs.get('room')
+        metric = kwargs.get('metric')
+        entity_id, new = args[0], args[3]
+
+        entity_values = self.sensor_entity_values.get((room, metric))
+        if entity_values is None:
+            return
+        entity_values[entity_id] = to_float(new)
+        readings = [value for value in entity_values.values() if not math.isnan(value)]
+        timestamp = self.now().timestamp()
+        if not readings:
+            # Every sensor of this type is unavailable, so the metric reads NaN until one reports again
+            self.sensor_history[room].append(metric, math.nan, timestamp)
+            return
+
+        value = sum(readings) / len(readings)  # Average across the room's sensors of this type
+        self.sensor_history[room].append(metric, value, timestamp)
+        self.sensor_rollups[room].add(metric, value, timestamp)
+        self.sensor_forecasts[room].update(metric, value, timestamp)
+
+    def setup_rollups(self):
+        """Keep 1-minute, 5-minute and 1-hour min/mean/max rollups per room and metric and publish them on an
+        interval for the dashboard charts.
+        """
+        self.sensor_rollups = {room_config['area_id']: SensorRollups() for room_config in self.areas}
+        interval = self.args.get('rollups', {}).get('publish_interval', 60)
+        self.run_every(self.publish_rollups, f"now+{interval}", interval)
+
+    def setup_forecasts(self):
+        """Track a Holt trend per room for each forecast metric. Their projections replace the current readings as
+        scoring inputs.
+        """
+        forecast_config = self.args.get('forecast', {})
+        self.forecast_metrics = forecast_config.get('metrics', [])
+        unknown = [metric for metric in self.forecast_metrics if metric not in SENSOR_METRICS]
+        if unknown:
+            raise ValueError(f"forecast metrics must be among {SENSOR_METRICS}, got {unknown}")
+        self.forecast_horizon = forecast_config.get('horizon', DEFAULT_HORIZON)
+        self.sensor_forecasts = {
+            room_config['area_id']: HoltForecaster(
+                self.forecast_metrics,
+                alpha=forecast_config.get('alpha', DEFAULT_ALPHA),
+                beta=forecast_config.get('beta', DEFAULT_BETA)
+            )
+            for room_config in self.areas
+        }
+
+    def forecast_sensor_data(self, room, sensor_data):
+        """sensor_data with every forecast metric that has a reading replaced by its projection over the horizon."""
+        forecaster = self.sensor_forecasts.get(room)
+        if not self.forecast_metrics or forecaster is None:
+            return sensor_data
+
+        now = self.now().timestamp()
+        projected = dict(sensor_data)
+        for metric in self.forecast_metrics:
+            if math.isnan(to_float(projected.get(metric))):
+                continue
+            value = forecaster.forecast(metric, self.forecast_horizon, now)
+            if not math.isnan(value):
+                projected[metric] = max(value, 0.0)  # A falling trend does not project below zero
+        return projected
+
+    def publish_rollups(self, *args, **kwargs):
+        """Publish each room's rollups of every metric with samples to sensor.<room>_air_quality_<metric>_rollup.
+        The state is the current 5-minute mean and each resolution is an attribute of compact arrays.
+        """
+        now = self.now().timestamp()
+        for room, rollups in self.sensor_rollups.items():
+            for metric in rollups.metrics:
+                if not rollups.has_samples(metric):
+                    continue
+                series = {name: rollups.series(metric, name, now) for name in rollups.resolutions}
+                self.publish_state(
+                    f'sensor.{room}_{self.app_name_short}_{metric}_rollup',
+                    state=next((value for value in reversed(series['5m']['mean']) if value is not None), 'unknown'),
+                    attributes=series
+                )
+
+    @timed_stage('sensor_fetch')
+    def get_sensor_data(self, room):
+        """Latest sensor data for a room.
+
+        Metrics with subscribed sensors are read from the room's ring buffer. The rest come from a snapshot fetched
+        through _get_sensor_data, which is fetched again once it is older than sensor_history snapshot_ttl. The
+        snapshot also seeds subscribed metrics that have not reported yet.
+        """
+        history = self.sensor_history.get(room)
+        if history is None:
+            history = self.sensor_history[room] = SensorRingBuffer(capacity=self.sensor_history_capacity)
+
+        now = self.now().timestamp()
+        fetched, snapshot = self.sensor_data_snapshots.get(room, (None, None))
+        if snapshot is None or now - fetched >= self.sensor_snapshot_ttl:
+            snapshot = self._get_sensor_data(room)
+            self.sensor_data_snapshots[room] = (now, snapshot)
+            for metric, value in snapshot.items():
+                value = to_float(value)
+                if ((room, metric) in self.sensor_entity_values and not history.has_samples(metric)
+                        and not math.isnan(value)):
+                    history.append(metric, value, now)
+
+        sensor_data = dict(snapshot)
+        for metric in sensor_data:
+            if (room, metric) in self.sensor_entity_values and history.has_samples(metric):
+                sensor_data[metric] = history.latest(metric)
+        return sensor_data
+
     def decide_device_activation(self, room):
+        """Return the room's priority device(s).
+
+        The last decision is reused while the room's readings (or projections, for forecast metrics) stay inside
+        their sensor_deviation deadband, no warning threshold is crossed, the overrides, modes and priority device
+        are unchanged, and the priority_time window has not expired.
+        """
         # Get Room Status
-        sensor_data = self._get_sensor_data(room)
+        sensor_data = self.get_sensor_data(room)
+        with self.latency_histograms.stage(room, 'overrides'):
+            user_overrides = self.get_user_overrides()
+            master_overrides = self.get_master_overrides()
+        # Forecast metrics are scored on their projection, so the deadband follows the projection too
+        values = self.decision_cache.sensor_vector(self.forecast_sensor_data(room, sensor_data))
+        warning_mask = self.get_warning_mask(sensor_data)
+        now = self.now().timestamp()
+
+        # The override and mode context is only built once the cheaper checks pass, and at most once per trigger
+        base_context = []
+
+        def decision_context():
+            if not base_context:
+                base_context.append(self.get_decision_context(room, user_overrides, master_overrides))
+            return base_context[0], self.get_priority_context(room)
+
+        hit, decision = self.decision_cache.lookup(room, values, warning_mask, now, decision_context)
+        if hit:
+            self.log_lazy(
+                message=lambda: f"""
+                    In decide_device_activation - {room}:
+                    Readings are within the deadband. Reusing decision: {decision}
+                    Decision Cache Stats: {self.decision_cache.stats}
+                """,
+                level='DEBUG',
+                log_room=room,
+                function_name='decide_device_activation'
+            )
+            return decision
+
+        decision = self.evaluate_device_activation(room, sensor_data, user_overrides, master_overrides)
+        self.decision_cache.store(
+            room,
+            values,
+            warning_mask,
+            decision_context(),  # Includes the new priority device
+            decision,
+            now
+        )
+        return decision
+
+    def get_decision_context(self, room, user_overrides, master_overrides):
+        """The overrides and modes a decision depends on, as a comparable tuple."""
+        disabled_by_user = tuple(sorted(
+            entity_id
+            for entities in user_overrides.values()
+            for entity_id, entity_state in entities.items()
+            if room in entity_id and entity_state.get('state') == 'off'
+        ))
+        disabled_by_master = tuple(sorted(
+            entity_id
+            for entities in master_overrides.values()
+            for entity_id, entity_state in entities.items()
+            if entity_state.get('state') == 'off'
+        ))
+        modes = tuple(
+            tuple(sorted(self.check_air_quality_mode_penalties(device_type).items()))
+            for device_type in ['purifier', 'humidifier', 'fan']
+        )
+        return disabled_by_user, disabled_by_master, modes
+
+    def get_priority_context(self, room):
+        priority_device = self.priority_devices.get(room, {})
+        return str(priority_device.get('device')), priority_device.get('time')
+
+    def get_warning_mask(self, sensor_data):
+        """The warning threshold violation bitmask of the readings, as check_warnings would compute it."""
+        thresholds = self.warning_threshold_vectors
+        return int(thresholds.bitmask(thresholds.sensor_vector(sensor_data)))
+
+    def evaluate_device_activation(self, room, sensor_data, user_overrides, master_overrides):
         # Air Particulate Data
         pm2_5 = sensor_data['pm2_5']
 
@@ -1090,8 +1723,8 @@ class AirQuality(Base):
         hydrogen = sensor_data['hydrogen']
         ammonia = sensor_data['ammonia']
 
-        self.log_info(
-            message=f"""
+        self.log_lazy(
+            message=lambda: f"""
                 In decide_device_activation - {room}:
                 PM2.5: {pm2_5}
                 Humidity: {humidity}
@@ -1112,40 +1745,34 @@ class AirQuality(Base):
         )
         warnings = self.check_warnings(room, sensor_data)
 
-        device_statuses = self.get_entities(room)
+        device_statuses = self.get_entities(room)  # Read live, membership depends on device states
 
         remove_priority = [device for device, status in device_statuses.items() if not bool(status)]
 
         # Get last priority device
         last_priority_device = self.priority_devices.get(room, {}).get('device', 'purifier')
-        last_priority_time = self.priority_devices.get(room, {}).get('time', datetime.now(self.timezone))
+        last_priority_time = self.priority_devices.get(room, {}).get('time', self.now())
 
-        # Check if app just initialized
+        # Check if app just initialized. A priority restored from the snapshot was decided before the restart.
+        restored = room in self.restored_priority_devices and (
+            self.restored_priority_devices[room] is self.priority_devices.get(room))
         app_initialized = self.get_time_until_ready()
-        app_initialized = (last_priority_time - app_initialized) < timedelta(
+        app_initialized = not restored and (last_priority_time - app_initialized) < timedelta(
             seconds=self.args.get('priority_time', 600))
 
 
         # Check if priority device has been on for less than 10 minutes
-        time_check = (datetime.now(self.timezone) - last_priority_time) < timedelta(
+        time_check = (self.now() - last_priority_time) < timedelta(
             seconds=self.args.get('priority_time', 600))
 
-        # Get Priority Device Activation Data
-        priority_device = self.controller.get_matching_entities(
-            area=room,
-            domain='input_text',
-            pattern=f'air_quality_priority_device$',
-            get_attribute='timedelta',
-            device_state=f'{last_priority_device}'
-        )
         try:
             exceptions = {
                 'purifier': pm2_5 > 100,
                 'humidifier': humidity < 25 or humidity > 75,
             }
         except Exception as e:
-            self.log_info(
-                message=f"""
+            self.log_lazy(
+                message=lambda: f"""
                     In decide_device_activation - {room}:
                     Error: {e}
                     PM2.5: {pm2_5}
@@ -1169,9 +1796,6 @@ class AirQuality(Base):
             weighting='weighted'
         )
 
-        user_overrides = self.get_user_overrides()
-        master_overrides = self.get_master_overrides()
-
         entity_overrides_user = []
         entity_overrides_master = []
         for priority in priorities:
@@ -1188,8 +1812,8 @@ class AirQuality(Base):
                     entity_overrides_master.append(entity_id)
 
             if entity_overrides_user or entity_overrides_master:
-                self.log_info(
-                    message=f"""
+                self.log_lazy(
+                    message=lambda: f"""
                         In decide_device_activation - {room}:
                         {priority.title()} is disabled by user. Skipping Logic...
 
@@ -1210,13 +1834,13 @@ class AirQuality(Base):
 
 
             if last_priority_device != highest_priority_device:
-                self.priority_devices[room] = {'device': highest_priority_device, 'time': datetime.now(self.timezone)}
+                self.priority_devices[room] = {'device': highest_priority_device, 'time': self.now()}
 
             if time_check and not app_initialized:
                 # If all warnings return as 'OK', then return the last priority device
                 if all(warning['msg'] == 'OK' for warning in warnings.values()):
-                    self.log_info(
-                        message=f"""
+                    self.log_lazy(
+                        message=lambda: f"""
                             In decide_device_activation - {room}:
                             Priority Device {last_priority_device} has been on for less than 10 minutes. Not resetting
                             priority.
@@ -1226,7 +1850,7 @@ class AirQuality(Base):
                         log_room=room,
                         function_name='decide_device_activation'
                     )
-                    self.set_state(
+                    self.publish_state(
                         entity_id=f"sensor.{room}_{self.app_name_short}_warning",
                         state='OK'
                     )
@@ -1252,8 +1876,8 @@ class AirQuality(Base):
                             # If particulate matter, CO2, or gases are high, return 'purifier'
                             if sensor in ['pm10', 'pm2_5', 'pm1', 'pm4', 'co2', 'carbon_monoxide', 'voc', 'methane',
                                           'nitrogen_dioxide', 'ammonia'] and (fans or purifiers):
-                                self.log_info(
-                                    message=f"""
+                                self.log_lazy(
+                                    message=lambda: f"""
                                         In decide_device_activation - {room}:
                                         {sensor.title()} exceeded threshold. Activating purifier and fan.
                                         {warning}
@@ -1270,7 +1894,7 @@ class AirQuality(Base):
                                 )
 
                                 self.priority_devices[room] = {'device': ['purifier', 'fan'],
-                                                               'time': datetime.now(self.timezone)}
+                                                               'time': self.now()}
                                 self.update_air_quality_entities_for_room(
                                     room,
                                     ['purifier', 'fan'],
@@ -1278,12 +1902,12 @@ class AirQuality(Base):
                                     priorities,
                                     999
                                 )
-                                self.set_state(
+                                self.publish_state(
                                     entity_id=f"sensor.{room}_{self.app_name_short}_warning",
                                     state=f'{warnings_filtered}'
                                 )
-                                self.log_info(
-                                    message=f"Overridden Returning highest priority device: ['purifier', 'fan']",
+                                self.log_lazy(
+                                    message=lambda: f"Overridden Returning highest priority device: ['purifier', 'fan']",
                                     level='DEBUG',
                                     log_room=room,
                                     function_name='decide_device_activation'
@@ -1294,8 +1918,8 @@ class AirQuality(Base):
                             # If humidity is high, return 'humidifier'
                             elif sensor == 'humidity' and humidifiers:
                                 if warning['high']:
-                                    self.log_info(
-                                        message=f"""
+                                    self.log_lazy(
+                                        message=lambda: f"""
                                             In decide_device_activation - {room}:
                                             Humidity exceeded threshold. Activating humidifier.
                                             {warning}
@@ -1310,12 +1934,12 @@ class AirQuality(Base):
                                         success=True,
                                         master_on_off='on_conditions'
                                     )
-                                    self.set_state(
+                                    self.publish_state(
                                         entity_id=f"sensor.{room}_{self.app_name_short}_warning",
                                         state=f'{warnings_filtered}'
                                     )
                                     self.priority_devices[room] = {'device': 'humidifier',
-                                                                   'time': datetime.now(self.timezone)}
+                                                                   'time': self.now()}
                                     self.update_air_quality_entities_for_room(
                                         room,
                                         'humidifier',
@@ -1324,8 +1948,8 @@ class AirQuality(Base):
                                         999
                                     )
 
-                                    self.log_info(
-                                        message=f"Overridden Returning highest priority device: humidifier",
+                                    self.log_lazy(
+                                        message=lambda: f"Overridden Returning highest priority device: humidifier",
                                         level='DEBUG',
                                         log_room=room,
                                         function_name='decide_device_activation'
@@ -1336,8 +1960,8 @@ class AirQuality(Base):
                             # If temperature is high, return 'fan'
                             elif sensor == 'temperature' and fans:
                                 if warning['high']:
-                                    self.log_info(
-                                        message=f"""
+                                    self.log_lazy(
+                                        message=lambda: f"""
                                             In decide_device_activation - {room}:
                                             Temperature exceeded threshold. Activating fan.
                                             {warning}
@@ -1352,12 +1976,12 @@ class AirQuality(Base):
                                         success=True,
                                         master_on_off='on_conditions'
                                     )
-                                    self.set_state(
+                                    self.publish_state(
                                         entity_id=f"sensor.{room}_{self.app_name_short}_warning",
                                         state=f'{warnings_filtered}'
                                     )
                                     self.priority_devices[room] = {'device': 'fan',
-                                                                   'time': datetime.now(self.timezone)}
+                                                                   'time': self.now()}
 
                                     self.update_air_quality_entities_for_room(
                                         room,
@@ -1367,8 +1991,8 @@ class AirQuality(Base):
                                         999
                                     )
 
-                                    self.log_info(
-                                        message=f"Overridden Returning highest priority device: fan",
+                                    self.log_lazy(
+                                        message=lambda: f"Overridden Returning highest priority device: fan",
                                         level='DEBUG',
                                         log_room=room,
                                         function_name='decide_device_activation'
@@ -1378,11 +2002,11 @@ class AirQuality(Base):
                     return last_priority_device
 
             else:
-                self.log_info(
-                    message=f"""
+                self.log_lazy(
+                    message=lambda: f"""
                         In decide_device_activation - {room}:
                         Priority Device {last_priority_device} has been on for more than 10 minutes. Resetting priority.
-                        {priority_device}
+                        Last Changed: {self.get_state(f"input_text.{room}_air_quality_priority_device", attribute='last_changed')}
                     """,
                     level='DEBUG',
                     log_room=room,
@@ -1395,7 +2019,7 @@ class AirQuality(Base):
                 success=True,
                 master_on_off='on_conditions'
             )
-            self.set_state(
+            self.publish_state(
                 entity_id=f"sensor.{room}_{self.app_name_short}_warning",
                 state='OK'
             )
@@ -1407,8 +2031,8 @@ class AirQuality(Base):
                 priorities[highest_priority_device]
             )
 
-            self.log_info(
-                message=f"Returning highest priority device: {highest_priority_device}",
+            self.log_lazy(
+                message=lambda: f"Returning highest priority device: {highest_priority_device}",
                 level='DEBUG',
                 log_room=room,
                 function_name='decide_device_activation'
@@ -1416,8 +2040,8 @@ class AirQuality(Base):
 
             return highest_priority_device
 
-        self.log_info(
-            message=f"""
+        self.log_lazy(
+            message=lambda: f"""
                 In decide_device_activation - {room}:
                 NOTHING TO ACTIVATE
                 Priorities: {priorities}
@@ -1429,62 +2053,125 @@ class AirQuality(Base):
 
         return None
 
+    @timed_stage('calculate_dynamic_priority')
     def calculate_dynamic_priority(self, room, sensor_data, weighting='sum'):
-        priorities = {'purifier': 0, 'humidifier': 0, 'oil_diffuser': 0.5, 'fan': 0}
-
-        # Define device metrics mapping
-        device_metrics = {
-            'purifier': [
-                'pm2_5',
-                'co2',
-                'voc',
-                'methane',
-                'carbon_monoxide',
-                'nitrogen_dioxide',
-                'ammonia'
-            ],
-            'humidifier': [
-                'humidity'
-            ],
-            'fan': [
-                'temperature',
-                'co2',
-                'voc',
-                'carbon_monoxide',
-            ],
-            'oil_diffuser': []  # Assuming oil diffuser doesn't depend on air quality metrics
+        """Calculate the device priorities for a single room. During a house-wide re-evaluation, the room's row of
+        the batched pass is used as long as its readings have not changed since.
+        """
+        batch = self.priority_batch
+        if batch is not None and batch['weighting'] == weighting and room in batch['priorities'] and np.array_equal(
+                batch['values'][room], self.decision_cache.sensor_vector(sensor_data), equal_nan=True):
+            return batch['priorities'][room]
+        return self.calculate_dynamic_priorities({room: sensor_data}, weighting=weighting)[room]
+
+    def setup_mode_listeners(self):
+        """Re-evaluate the house whenever a house mode or a custom mode entity changes."""
+        self.priority_batch = None
+        mode_entities = {'input_select.house_mode', 'input_boolean.entertainment_mode'}
+        for conditions in (self.args.get('modes') or {}).values():
+            mode_entities.update(
+                condition.get('entity_id') for condition in conditions or [] if condition.get('entity_id')
+            )
+        for entity_id in sorted(mode_entities):
+            self.listen_state(self.mode_callback, entity_id=entity_id)
+
+    def mode_callback(self, *args, **kwargs):
+        self.schedule(('reevaluate_rooms', None), self.reevaluate_rooms, delay=1)  # Coalesces mode changes
+
+    def reevaluate_rooms(self, *args, **kwargs):
+        """Re-decide every occupied room. Their priorities are scored in one pass of the priority engine and each
+        room's decision then reads its row.
+        """
+        rooms = [
+            room_config['area_id'] for room_config in self.areas
+            if self.manager.is_room_occupied(room_config['area_id'])
+        ]
+        sensor_data = {room: self.get_sensor_data(room) for room in rooms}
+        self.priority_batch = {
+            'weighting': 'weighted',  # As evaluate_device_activation scores
+            'values': {room: self.decision_cache.sensor_vector(data) for room, data in sensor_data.items()},
+            'priorities': self.calculate_dynamic_priorities(sensor_data, weighting='weighted'),
         }
+        try:
+            for room in rooms:
+                self.master_on(room=room, master_conditions=self.get_master_conditions(room, 'on'))
+        finally:
+            self.priority_batch = None
+
+        self.log_lazy(
+            message=lambda: f"""
+                In reevaluate_rooms:
+                Re-decided {len(rooms)} occupied rooms from one batched priority pass.
+            """,
+            level='DEBUG',
+            function_name='reevaluate_rooms'
+        )
 
-        # Define optimal values and conditions for each metric
-        optimal_values = {
-            'pm2_5': 50,
-            'co2': 1000,
-            'voc': 500,
-            'methane': 5,
-            'carbon_monoxide': 9,
-            'nitrogen_dioxide': 0.053,
-            'ammonia': 0.25,
-            'humidity': (40, 60),  # Optimal humidity range
-            'temperature': (35, 80),  # Optimal temperature range in Fahrenheit
-        }
+    def calculate_dynamic_priorities(self, sensor_data=None, weighting='sum'):
+        """Calculate the device priorities for several rooms in one pass of the priority engine.
 
-        conditions = {
-            'pm2_5': 'lower',
-            'co2': 'lower',
-            'voc': 'lower',
-            'methane': 'lower',
-            'carbon_monoxide': 'lower',
-            'nitrogen_dioxide': 'lower',
-            'ammonia': 'lower',
-            'humidity': 'range',
-            'temperature': 'range',
-        }
+        sensor_data maps room -> sensor data. If omitted, every area is fetched and scored.
+        """
+        if sensor_data is None:
+            sensor_data = {
+                room_config['area_id']: self.get_sensor_data(room_config['area_id'])
+                for room_config in self.areas
+            }
+        rooms = list(sensor_data)
+        engine = self.priority_engine
 
         # Time-weighted priority
-        include_fans_regex, use_groups = self.get_patterns('fans', 'devices')
-        include_humidifiers_regex, use_groups = self.get_patterns('humidifiers', 'devices')
-        include_purifiers_regex, use_groups = self.get_patterns('purifiers', 'devices')
-        include_oil_diffusers_regex, use_groups = self.get_patterns('oil_diffusers', 'devices')
+        for room in rooms:
+            if room not in self.inactivity_tracker.seeded:
+                self.seed_inactivity_tracker(room)
+        hours, device_index, room_index = self.inactivity_tracker.time_inputs(
+            rooms,
+            self.now().timestamp()
+        )
+
+        # Sensor-based priority, combined with the time-based scores. Forecast metrics are scored on their projection.
+        values = engine.sensor_matrix([self.forecast_sensor_data(room, sensor_data[room]) for room in rooms])
+        time_scores = engine.time_scores(hours, device_index, room_index, len(rooms))
+        rows = self.scoring_spec.rows(rooms)
+        priorities, time_scores, sensor_scores = engine.priorities(values, rows, time_scores, weighting)
+
+        priorities = dict(zip(rooms, engine.to_dicts(priorities)))
+        time_scores = dict(zip(rooms, engine.to_dicts(time_scores)))
+        sensor_scores = dict(zip(rooms, engine.to_dicts(sensor_scores)))
+
+        # Logging for debugging
+        for room in rooms:
+            self.log_lazy(
+                message=lambda: f"""
+                    Dynamic Priority Scores for {room.title()}:
+                    Sensor Data:
+                        {', '.join([f"{metric.upper()}: {sensor_data[room].get(metric, 'N/A')}" for metric in sensor_data[room]])}
+
+                    Sensor Scores:
+                        {', '.join([f"{device.title()}: {score:.2f}" for device, score in sensor_scores[room].items()])}
+
+                    Time Scores:
+                        {', '.join([f"{device.title()}: {score:.2f}" for device, score in time_scores[room].items()])}
+
+                    Final Priorities:
+                        {', '.join([f"{device.title()}: {score:.2f}" for device, score in priorities[room].items()])}
+                    """,
+                level='DEBUG',
+                log_room=room,
+                function_name='calculate_dynamic_priority'
+            )
+
+        return priorities
+
+    def seed_inactivity_tracker(self, room):
+        """Query how long every fan, humidifier, purifier and diffuser in the room has been off, once.
+
+        After seeding, the tracker is kept current by inactivity_callback.
+        """
+        include_fans_regex, use_groups = self.get_device_patterns('fans')
+        include_humidifiers_regex, use_groups = self.get_device_patterns('humidifiers')
+        include_purifiers_regex, use_groups = self.get_device_patterns('purifiers')
+        include_oil_diffusers_regex, use_groups = self.get_device_patterns('oil_diffusers')
 
         last_fan_inactive_times = self.controller.get_matching_entities(
             area=room,
@@ -1529,125 +2216,39 @@ class AirQuality(Base):
             **last_oil_diffuser_inactive_times
         }
 
+        now = self.now().timestamp()
         for device, last_active in last_inactive_times.items():
-            time_weight = last_active['timedelta'].total_seconds() / 3600  # Time since being off in hours
             is_device_still_off = last_active['persist']  # Check if device is still off
-            time_weight = time_weight if is_device_still_off else 0
+            off_since = now - last_active['timedelta'].total_seconds() if is_device_still_off else math.nan
 
-            if 'purifier' in device:
-                priorities['purifier'] += calculate_individual_score(
-                    current_value=time_weight,
-                    optimal_value=1,
-                    condition='greater'
-                )
-
-            elif 'humidifier' in device:
-                priorities['humidifier'] += calculate_individual_score(
-                    current_value=time_weight,
-                    optimal_value=1,
-                    condition='greater'
-                )
-            elif 'fan' in device:
-                priorities['fan'] += calculate_individual_score(
-                    current_value=time_weight,
-                    optimal_value=1,
-                    condition='greater'
-                )
-            elif 'oil_diffuser' in device:
-                priorities['oil_diffuser'] += calculate_individual_score(
-                    current_value=time_weight,
-                    optimal_value=1,
-                    condition='greater'
-                )
+            for device_type in ['purifier', 'humidifier', 'fan', 'oil_diffuser']:
+                if device_type in device:
+                    device_index = self.priority_engine.device_index[device_type]
+                    if self.inactivity_tracker.track(device, room, device_index, off_since):
+                        self.listen_state(self.inactivity_callback, entity_id=device)
+                    break
 
-        # Sensor-based priority
-        device_sensor_scores = {}
-        for device, metrics in device_metrics.items():
-            scores = []
-            for metric in metrics:
-                current_value = sensor_data.get(metric)
-                optimal_value = optimal_values.get(metric)
-                condition = conditions.get(metric)
-                if (current_value is not None
-                        and optimal_value is not None
-                        and condition
-                        and not pd.isna(current_value)
-                ):
-                    score = calculate_individual_score(
-                        current_value=current_value,
-                        optimal_value=optimal_value,
-                        condition=condition
-                    )
-                    self.log_info(f"Sensor Score for {device} - {metric}: {score}")
-                    scores.append(score)
-            # Calculate average score for the device
-            device_sensor_scores[device] = sum(scores) / len(scores) if scores else 0
-
-        # Combine time-based and sensor-based scores
-        for device in priorities.keys():
-            sensor_score = device_sensor_scores.get(device, 0)
-            time_score = priorities[device]
-
-            if weighting == 'sum':
-                priorities[device] += sensor_score
-            elif weighting == 'mean':
-                priorities[device] = (time_score + sensor_score) / 2
-            elif weighting == 'weighted':
-                priorities[device] = time_score * 0.4 + sensor_score * 0.6
-
-            priorities[device] *= -1  # Invert the scores to prioritize the highest score
-            self.log_info(f"Final Priority for {device}: {priorities[device]}")
+        self.inactivity_tracker.seeded.add(room)
 
-        # Logging for debugging
-        self.log_info(
-            message=f"""
-                Dynamic Priority Scores for {room.title()}:
-                Sensor Data:
-                    {', '.join([f"{metric.upper()}: {sensor_data.get(metric, 'N/A')}" for metric in sensor_data])}
+    def inactivity_callback(self, *args, **kwargs):
+        entity_id, new = args[0], args[3]
+        self.inactivity_tracker.transition(entity_id, new == 'off', self.now().timestamp())
 
-                Sensor Scores:
-                    {', '.join([f"{device.title()}: {device_sensor_scores[device]:.2f}" for device in device_sensor_scores])}
-
-                Time Scores:
-                    {', '.join([f"{device.title()}: {priorities[device]:.2f}" for device in priorities])}
-
-                Final Priorities:
-                    {', '.join([f"{device.title()}: {priorities[device]:.2f}" for device in priorities])}
-                """,
-            level='DEBUG',
-            log_room=room,
-            function_name='calculate_dynamic_priority'
-        )
+    def get_fan_percentage(self, room, pm2_5):
+        """Look up the purifier fan percentage for a pm2.5 reading in the room's compiled fan curve."""
+        return self.fan_curves.percentage(room, pm2_5)
 
-        return priorities
+    def setup_fan_curves(self):
+        """Seed every room's fan curve and recompile it whenever one of its input_numbers changes."""
+        self.fan_curves = FanCurves(interpolate=self.args.get('fan_curve_interpolation', False))
+        for room_config in self.areas:
+            room = room_config['area_id']
+            for entity_id, (kind, step) in FanCurves.entities(room).items():
+                self.fan_curves.set_value(room, kind, step, self.get_state(entity_id))
+                self.listen_state(self.fan_curve_callback, entity_id=entity_id, room=room, kind=kind, step=step)
 
-    def get_fan_percentage(self, room, pm2_5):
-        # Create Purifier Settings:
-        iterate = {
-            "pm25_low",
-            "pm25_medium_low",
-            "pm25_medium_high",
-            "pm25_high"
-        }
-        thresholds = []
-        percentage = []
-        for key in iterate:
-            percent = self.get_state(f'input_number.{room}_percentage_{key}')
-            percent = float(percent) if percent else None
-            threshold = self.get_state(f'input_number.{room}_thresholds_{key}')
-            threshold = float(threshold) if threshold else None
-            if percent and threshold:
-                thresholds.append(threshold)
-                percentage.append(percent)
-
-        for threshold, percentage in zip(thresholds, percentage):  # Iterate through thresholds and percentages
-            if pm2_5 < threshold:  # If pm2.5 value is less than threshold, return percentage
-                return percentage  # This will be the first percentage that is less than the pm2.5 value
-
-        if thresholds and percentage:
-            return 100
-        else:
-            return 0
+    def fan_curve_callback(self, *args, **kwargs):
+        self.fan_curves.set_value(kwargs.get('room'), kwargs.get('kind'), kwargs.get('step'), args[3])
 
     def check_air_quality_mode_penalties(self, device_type, penalties=None):
         """Check if there are any penalties for the air quality mode."""
@@ -1681,12 +2282,12 @@ class AirQuality(Base):
 
     def set_purifier_mode(self, room):
         app_name = 'air_quality'
-        purifier_entity = self.get_entities(room).get('purifier')
+        purifier_entities = self.get_room_devices(room, 'purifiers')
         fan_penalties = self.check_air_quality_mode_penalties('purifier')
 
         if any(fan_penalties.values()):
-            self.log_info(
-                message=f"""
+            self.log_lazy(
+                message=lambda: f"""
                     In set_purifier_mode - {room}:
                     The priority device is purifier.
                     Encountered penalties for the purifier.
@@ -1698,7 +2299,7 @@ class AirQuality(Base):
                 log_room=room,
                 function_name='set_purifier_mode'
             )
-            self.call_service("fan/set_preset_mode", entity_id=list(purifier_entity.keys()), preset_mode='sleep')
+            self.call_service("fan/set_preset_mode", entity_id=purifier_entities, preset_mode='sleep')
             return
 
         else:
@@ -1706,7 +2307,7 @@ class AirQuality(Base):
 
     def set_fan_mode(self, room):
         app_name = 'air_quality'
-        purifier_entity = self.get_entities(room).get('fan')
+        fan_entities = self.get_room_devices(room, 'fans')
         fan_penalties = self.check_air_quality_mode_penalties('fan')
 
         if any(fan_penalties.values()):
@@ -1717,7 +2318,7 @@ class AirQuality(Base):
                 area=room,
                 domain='fan',
                 include_only=True,
-                include_manual_entities=list(purifier_entity.keys()),
+                include_manual_entities=fan_entities,
                 get_attribute='oscillating',
                 device_state=lambda x: x['oscillating'] is not None,
                 oscillating=True
@@ -1729,7 +2330,7 @@ class AirQuality(Base):
                 area=room,
                 domain='fan',
                 include_only=True,
-                include_manual_entities=list(purifier_entity.keys()),
+                include_manual_entities=fan_entities,
                 get_attribute='preset_modes',
                 device_state=lambda x: x['preset_modes'] is not None and 'sleep' in x['preset_modes'],
                 preset_mode='sleep'
@@ -1739,8 +2340,8 @@ class AirQuality(Base):
             if not response2:
                 return True
 
-            self.log_info(
-                message=f"""
+            self.log_lazy(
+                message=lambda: f"""
                     In set_fan_mode - {room}:
                     The priority device is fan.
                     Encountered penalties for the fan.
@@ -1764,12 +2365,12 @@ class AirQuality(Base):
 
     def set_humidifier_mode(self, room):
         app_name = 'air_quality'
-        humidifier_entities = self.get_entities(room).get('humidifier')
+        humidifier_entities = self.get_room_devices(room, 'humidifiers')
         humidifier_penalties = self.check_air_quality_mode_penalties('humidifier')
 
         if any(humidifier_penalties.values()) and room != 'bedroom':
-            self.log_info(
-                message=f"""
+            self.log_lazy(
+                message=lambda: f"""
                     In set_humidifier_mode - {room}:
                     The priority device is humidifier.
                     Encountered penalties for the humidifier.
@@ -1780,14 +2381,13 @@ class AirQuality(Base):
                 log_room=room,
                 function_name='set_humidifier_mode'
             )
-            self.call_service("humidifier/set_mode", entity_id=list(humidifier_entities.keys()), mode='sleep')
+            self.call_service("humidifier/set_mode", entity_id=humidifier_entities, mode='sleep')
 
-            for entity in humidifier_entities:
-                self.run_in(self.is_empty, 0, device=entity, room=room)
+            self.arm_empty_tank_detector(humidifier_entities)
             return
         elif any(humidifier_penalties.values()) and room == 'bedroom':
-            self.log_info(
-                message=f"""
+            self.log_lazy(
+                message=lambda: f"""
                     In set_humidifier_mode - {room}:
                     The priority device is humidifier.
                     Encountered penalties for the humidifier.
@@ -1798,96 +2398,333 @@ class AirQuality(Base):
                 log_room=room,
                 function_name='set_humidifier_mode'
             )
-            self.call_service("humidifier/set_mode", entity_id=list(humidifier_entities.keys()), mode='baby')
-            for entity in humidifier_entities:
-                self.run_in(self.is_empty, 0, device=entity, room=room)
+            self.call_service("humidifier/set_mode", entity_id=humidifier_entities, mode='baby')
+            self.arm_empty_tank_detector(humidifier_entities)
 
             return
 
         else:
-            self.call_service("humidifier/set_mode", entity_id=list(humidifier_entities.keys()), mode='manual')
+            self.call_service("humidifier/set_mode", entity_id=humidifier_entities, mode='manual')
             return True
 
     def set_diffuser_mode(self, room):
         return True
 
+    @timed_stage('check_warnings')
     def check_warnings(self, room, sensor_data):
+        """Compare the room's readings against every warning threshold at once.
+
+        Only sensors in violation are returned. The room's violation bitmask is kept in self.warning_masks.
+        """
+        thresholds = self.warning_threshold_vectors
+        values = thresholds.sensor_vector(sensor_data)
+        bitmask = int(thresholds.bitmask(values))
+        self.warning_masks[room] = bitmask
+
+        warnings = thresholds.warnings(bitmask, values)
+        for sensor, warning in warnings.items():
+            self.log_lazy(
+                message=lambda: f"""
+                    In Air Quality check_warnings - {room}:
+                    {warning['msg']}
+
+                    Current {sensor.title()}: {warning['value']}
+                """,
+                level='INFO',
+                log_room=room,
+                function_name='check_warnings',
+                # notify_device='everyone',
+            )
 
-        warning_thresholds = {}
-        # Get UI Warning Thresholds
-        for sensor, thresholds in self.warning_thresholds.items():
-            ui_thresholds = {}
-            for threshold, value in thresholds.items():
-                try:
-                    ui_sensor = f'input_number.warning_thresholds_{sensor}_{threshold}'
-                    ui_thresholds[threshold] = float(self.get_state(ui_sensor))
-                except Exception as e:
-                    self.log_info(
-                        message=f"""
-                            In check_warnings - {room}:
-                            Error: {e}
-                            Sensor: {sensor}
-                            Threshold: {threshold}
-                        """,
-                        level='INFO',
-                        log_room=room,
-                        function_name='check_warnings'
-                    )
-                    ui_thresholds[threshold] = value
-            warning_thresholds[sensor] = ui_thresholds
+        return warnings
 
-        # Check Current Sensor Data for Warnings
-        warnings = {}
-        for sensor, value in sensor_data.items():
-            if sensor not in warning_thresholds:
-                continue
-            warn_dict = {'high': '', 'low': '', 'msg': ''}
-            warnings[sensor] = warn_dict
-            for threshold, threshold_value in warning_thresholds[sensor].items():
-                if float(value) >= threshold_value and threshold == 'high':
-                    warning = f"{sensor.title()} is above {threshold} threshold of {threshold_value}."
-                    warn_bool = True
-                    self.log_info(
-                        message=f"""
-                            In Air Quality check_warnings - {room}:
-                            {warning}
-                            
-                            Current {sensor.title()}: {value}
-                        """,
-                        level='INFO',
-                        log_room=room,
-                        function_name='check_warnings',
-                        # notify_device='everyone',
-                    )
+    def refresh_warning_thresholds(self, *args, **kwargs):
+        """Read every warning threshold entity once. Later changes arrive through warning_threshold_callback."""
+        for entity_id in self.warning_threshold_vectors.entities:
+            self.set_warning_threshold(entity_id, self.get_state(entity_id))
+
+    def warning_threshold_callback(self, *args, **kwargs):
+        entity_id, new = args[0], args[3]
+        self.set_warning_threshold(entity_id, new)
+
+    def set_warning_threshold(self, entity_id, value):
+        sensor, threshold = self.warning_threshold_vectors.entities[entity_id]
+        self.decision_cache.invalidate()
+        if not self.warning_threshold_vectors.set_threshold(sensor, threshold, value):
+            self.log_lazy(
+                message=lambda: f"""
+                    In set_warning_threshold:
+                    {entity_id} is not numeric ({value}). Keeping {threshold} threshold of
+                    {self.warning_threshold_vectors.threshold(sensor, threshold)} for {sensor}.
+                """,
+                level='DEBUG',
+                function_name='check_warnings'
+            )
 
-                elif float(value) < threshold_value and threshold == 'low':
-                    warning = f"{sensor.title()} is below {threshold} threshold of {threshold_value}."
-                    warn_bool = True
-                    self.log_info(
-                        message=f"""
-                            In Air Quality check_warnings - {room}:
-                            {warning}
-                            
-                            Current {sensor.title()}: {value}
-                        """,
-                        level='INFO',
-                        log_room=room,
-                        function_name='check_warnings',
-                        # notify_device='everyone',
-                    )
-                else:
-                    warning = 'OK'
-                    warn_bool = False
+    def publish_state(self, entity_id, state, attributes=None, tolerance=None, **kwargs):
+        """Queue a set_state through the diff-only publisher. Unchanged writes are dropped."""
+        if self.state_publisher.publish(entity_id, state, attributes, tolerance):
+            self.schedule_flush()
+
+    def republish_states(self, event_name, data, **kwargs):
+        """Rewrite every published state after Home Assistant restarts, since set_state entities are not persisted."""
+        if self.state_publisher.invalidate(resend=True):
+            self.schedule_flush()
+        self.log_lazy(
+            message=lambda: f"""
+                In republish_states:
+                {event_name} fired. Rewriting {len(self.state_publisher.pending)} states.
+            """,
+            level='DEBUG',
+            function_name='flush_states'
+        )
 
-                warnings[sensor][threshold] = warn_bool
-                warnings[sensor]['msg'] = warning
+    def schedule_flush(self):
+        """Flush the pending states after flush_interval, unless a flush is already scheduled."""
+        if ('flush_states', None) not in self.timer_registry.live:
+            self.schedule(('flush_states', None), self.flush_states, delay=self.state_flush_interval, supersede=False)
+
+    def flush_states(self, *args, **kwargs):
+        """Write every pending state in one callback."""
+        writes = self.state_publisher.drain()
+        for entity_id, state, attributes in writes:
+            if attributes is None:
+                self.set_state(entity_id, state=state)
+            else:
+                self.set_state(entity_id, state=state, attributes=attributes)
 
-        return warnings
+        self.log_lazy(
+            message=lambda: f"""
+                In flush_states:
+                Wrote {len(writes)} states.
+                Publisher Stats: {self.state_publisher.stats}
+            """,
+            level='DEBUG_3',
+            function_name='flush_states'
+        )
+
+    def setup_timer_registry(self):
+        """Track every scheduled callback under a (job, room) key and report live counts on an interval."""
+        timers_config = self.args.get('timers', {})
+        self.timer_registry = TimerRegistry(max_per_key=timers_config.get('max_per_key', DEFAULT_MAX_PER_KEY))
+        interval = timers_config.get('report_interval', 300)
+        self.run_every(self.report_timers, f"now+{interval}", interval)
+
+    def schedule(self, key, callback, delay=0, supersede=True, **kwargs):
+        """run_in registered under key, a (job, room) tuple. Unless supersede is False, the key's pending timers are
+        cancelled first. One-shots that must all run pass supersede=False, and a key whose timers then pile up is
+        reported as a leak.
+        """
+        if supersede:
+            for handle in self.timer_registry.supersede(key):
+                self.cancel_timer(handle)
+
+        token = self.timer_registry.token()
+        handle = self.run_in(
+            self.run_scheduled,
+            delay,
+            timer_key=key,
+            timer_token=token,
+            timer_callback=callback,
+            **kwargs
+        )
+        if self.timer_registry.add(key, token, handle):
+            self.log_lazy(
+                message=lambda: f"""
+                    In schedule - {key}:
+                    {len(self.timer_registry.live[key])} timers are pending for this key. Possible timer leak.
+                    Timer Stats: {self.timer_registry.stats}
+                """,
+                level='WARNING',
+                log_room=key[1],
+                function_name='schedule'
+            )
+        return handle
+
+    def run_scheduled(self, *args, **kwargs):
+        """Drop a fired timer from the registry and run its callback."""
+        callback = kwargs.pop('timer_callback')
+        self.timer_registry.fired(kwargs.pop('timer_key'), kwargs.pop('timer_token'))
+        return callback(*args, **kwargs)
+
+    def cancel_scheduled(self, key):
+        for handle in self.timer_registry.supersede(key):
+            self.cancel_timer(handle)
+
+    def report_timers(self, *args, **kwargs):
+        """Publish live timer counts per (job, room) key."""
+        self.publish_state(
+            f'sensor.{self.app_name_short}_timers',
+            state=len(self.timer_registry),
+            attributes={**self.timer_registry.counts(), **self.timer_registry.stats}
+        )
+
+    def data_path(self, name):
+        """Default path of a data file, in data_dir or else <AppDaemon config dir>/data/<app>. Data is kept out of the
+        app directory, which HACS replaces on every update.
+        """
+        data_dir = self.args.get('data_dir') or os.path.join(self.config_dir, 'data', self.app_name_short)
+        os.makedirs(data_dir, exist_ok=True)
+        return os.path.join(data_dir, name)
+
+    def setup_latency_metrics(self):
+        """Publish the per-stage latency histograms on a fixed interval."""
+        latency_config = self.args.get('latency_metrics', {})
+        self.latency_metrics_path = latency_config['path'] if 'path' in latency_config \
+            else self.data_path('air_quality_latency.prom')
+        interval = latency_config.get('interval', 60)
+        self.run_every(self.publish_latency, f"now+{interval}", interval)
+
+    def publish_latency(self, *args, **kwargs):
+        """Publish the master on/off pipeline percentiles to each room's latency percentile sensors and write the
+        per-stage histograms to the OpenMetrics file. The provisioned latency sensors are left to the Base class.
+        """
+        for room_config in self.areas:
+            room = room_config['area_id']
+            summary = self.latency_histograms.summary(room)
+            for master_onoff in ['on', 'off']:
+                pipeline = summary.get(f'master_{master_onoff}')
+                if pipeline is None:
+                    continue
+                self.publish_state(
+                    f'sensor.{room}_{self.app_name_short}_{master_onoff}_latency_percentiles',
+                    state=round(pipeline['p50'], 5),
+                    attributes={
+                        'unit_of_measurement': 'seconds',
+                        'p99': round(pipeline['p99'], 5),
+                        'count': pipeline['count'],
+                    }
+                )
+
+        if self.latency_metrics_path:
+            with open(self.latency_metrics_path, 'w') as metrics_file:
+                metrics_file.write(self.latency_histograms.openmetrics())
+
+    def setup_history_store(self):
+        """Append every decision to the local columnar history store and flush it on an interval."""
+        history_config = self.args.get('history_store', {})
+        self.history_store = HistoryStore(
+            path=history_config['path'] if 'path' in history_config else self.data_path('air_quality_history'),
+            metrics=SENSOR_METRICS,
+            devices=self.scoring_spec.devices,
+            segment_seconds=history_config.get('segment_hours', DEFAULT_SEGMENT_SECONDS / 3600) * 3600,
+            retention_seconds=history_config.get('retention_days', DEFAULT_RETENTION_SECONDS / 86400) * 86400,
+            segment_rows=history_config.get('segment_rows', DEFAULT_SEGMENT_ROWS)
+        )
+        interval = history_config.get('flush_interval', 300)
+        self.run_every(self.flush_history, f"now+{interval}", interval)
+
+    def flush_history(self, *args, **kwargs):
+        self.history_store.flush()
+
+    def query_history(self, start, end, rooms=None, columns=None):
+        """Decision rows between two datetimes (or timestamps) from the history store. See HistoryStore.query."""
+        start = start.timestamp() if isinstance(start, datetime) else start
+        end = end.timestamp() if isinstance(end, datetime) else end
+        return self.history_store.query(start, end, rooms=rooms, columns=columns)
+
+    def setup_snapshot(self):
+        """Restore the decision state saved by the previous instance and keep saving it on an interval."""
+        snapshot_config = self.args.get('snapshot', {})
+        self.snapshot_store = SnapshotStore(
+            snapshot_config['path'] if 'path' in snapshot_config else self.data_path('air_quality_snapshot.json')
+        )
+        self.restored_priority_devices = {}
+        self.restored_diffuser_groups = []
+        self.restore_snapshot()
+        interval = snapshot_config.get('interval', 60)
+        self.run_every(self.save_snapshot, f"now+{interval}", interval)
+
+    def terminate(self):
+        """Save a final snapshot and flush the history store when AppDaemon stops or reloads the app."""
+        self.save_snapshot()
+        self.history_store.flush()
+        parent_terminate = getattr(super(), 'terminate', None)
+        if parent_terminate is not None:  # The Base class may have its own cleanup
+            parent_terminate()
+
+    def save_snapshot(self, *args, **kwargs):
+        state = {
+            'priority_devices': self.priority_devices,
+            'decisions': self.decision_cache.entries,
+            'diffuser_groups': [
+                (key, group['phase'], group['since'], group['rooms'])
+                for key, group in self.diffuser_scheduler.groups.items()
+                if group['since'] is not None
+            ],
+            'dashboard_digests': self.dashboard_cards.digests,
+        }
+        self.snapshot_store.save(state, saved_at=self.now().timestamp())
 
+    def restore_snapshot(self):
+        """Load the rooms' priority devices and cached decisions. Diffuser groups resume once the app is ready."""
+        state, saved_at = self.snapshot_store.load()
+        if state is None:
+            return
+
+        rooms = {room_config['area_id'] for room_config in self.areas}
+        for room, priority_device in state.get('priority_devices', {}).items():
+            if room in rooms:
+                self.priority_devices[room] = priority_device
+                self.restored_priority_devices[room] = priority_device
+        for room, entry in state.get('decisions', {}).items():
+            if room in rooms and len(entry[0]) == len(self.decision_cache.metrics):
+                self.decision_cache.entries[room] = entry
+        # Every card id sent before, so cards of rooms removed while the app was down are cleared too
+        self.dashboard_cards.digests = state.get('dashboard_digests', self.dashboard_cards.digests)
+        self.restored_diffuser_groups = [
+            (key, phase, since, [room for room in group_rooms if room in rooms])
+            for key, phase, since, group_rooms in state.get('diffuser_groups', [])
+        ]
+        if self.restored_diffuser_groups:
+            self.schedule(('resume_diffusers', None), self.resume_diffusers, delay=self.time_to_delay_start,
+                          supersede=False)
+
+        self.log_lazy(
+            message=lambda: f"""
+                In restore_snapshot:
+                Restored {len(self.restored_priority_devices)} priority devices,
+                {len(self.decision_cache.entries)} decisions and {len(self.restored_diffuser_groups)} diffuser groups
+                saved {self.now().timestamp() - saved_at:.0f} seconds ago.
+            """,
+            level='INFO',
+            function_name='restore_snapshot'
+        )
+
+    def resume_diffusers(self, *args, **kwargs):
+        """Rejoin restored diffuser groups at the point of the duty cycle they would be at now, without switching
+        their devices again. Rooms whose diffuser is no longer active or whose duty cycle changed are left out.
+        """
+        now = self.now().timestamp()
+        for key, phase, since, group_rooms in self.restored_diffuser_groups:
+            key = tuple(key)
+            if key in self.diffuser_scheduler.groups:
+                continue  # Already restarted by turn_on_diffuser
+            for room in group_rooms:
+                if room in self.diffuser_scheduler or not self.diffuser_is_active(room):
+                    continue
+                if self.get_diffuser_times(room) == key:
+                    oil_diffusers = list(self.controllable[room]['oil_diffusers']['all'].keys())
+                    self.diffuser_scheduler.join(room, *key, oil_diffusers, self.get_diffuser_lights(room))
+            if not self.diffuser_scheduler.rooms(key):
+                continue
+
+            phase, elapsed = self.diffuser_scheduler.resume_phase(key, phase, since, now)
+            self.diffuser_scheduler.set_phase(key, phase, since=now - elapsed)
+            self.schedule(
+                ('diffuser_cycle', f'{key[0]}/{key[1]}'),
+                self.diffuser_tick,
+                delay=(key[0] if phase == 'on' else key[1]) - elapsed,
+                group=key,
+                phase='off' if phase == 'on' else 'on'
+            )
+        self.restored_diffuser_groups = []
+
+    @timed_stage('update_entities')
     def update_air_quality_entities_for_room(self, room, priority_device, sensor_data, time_scores, weight_score):
         """Update the Air Quality entities in Home Assistant for a specific room."""
-        self.log_info(
-            message=f"""
+        self.log_lazy(
+            message=lambda: f"""
                 Entering update_air_quality_entities_for_room - {room}
                 The priority device is {priority_device}
                 Sensor Data:
@@ -1904,264 +2741,106 @@ class AirQuality(Base):
             viewable_string += f"{device}: {score:.2f}\t"
 
         # Update input_text entities for priority device and sensor data
-        self.set_state(f"input_text.{room}_air_quality_priority_device", state=priority_device)
+        self.publish_state(f"input_text.{room}_air_quality_priority_device", state=priority_device)
 
         # Set sensor data states
         for metric, value in sensor_data.items():
-            if isinstance(value, (int, float)):
-                self.set_state(f"input_text.{room}_air_quality_{metric}", state=f"{value}")
-                self.set_state(f"input_number.{room}_air_quality_{metric}", state=f"{value:.2f}")
+            if isinstance(value, (int, float)) and not math.isnan(value):
+                self.publish_state(f"input_text.{room}_air_quality_{metric}", state=f"{value}")
+                self.publish_state(f"input_number.{room}_air_quality_{metric}", state=f"{value:.2f}")
 
         # Update time and weight scores
-        self.set_state(f"input_text.{room}_air_quality_time_score", state=viewable_string)
-        self.set_state(f"input_text.{room}_air_quality_weight_score", state=f"{weight_score:.2f}")
+        self.publish_state(f"input_text.{room}_air_quality_time_score", state=viewable_string)
+        self.publish_state(f"input_text.{room}_air_quality_weight_score", state=f"{weight_score:.2f}")
 
         # Update priority scores for each device
         for device in ['purifier', 'humidifier', 'fan', 'oil_diffuser']:
             device_score = time_scores.get(device, 0)
-            self.set_state(
+            self.publish_state(
                 f"input_number.{room}_air_quality_{device}_score",
                 state=f"{device_score:.2f}"
             )
 
-    def generate_logging_cards(self, **kwargs):
-        """Generates cards representing all occupancy binary sensors in the home"""
-
-        def add_glance_card(title, entities):
-            """Creates a Home Assistant 'glance' card with the given title and list of entities"""
-            return {
-                "type": "glance",
-                "title": title,
-                "entities": entities,
-                "show_name": True,
-                "show_icon": True,
-                "show_state": True
-            }
-
-        def add_entities_card(title, entities):
-            """Creates a Home Assistant 'entities' card with the given title and list of entities"""
-            return {
-                "type": "entities",
-                "title": title,
-                "entities": entities,
-            }
-
-        def add_markdown_card(content):
-            """Creates a Home Assistant 'markdown' card with the given content"""
-            return {
-                "type": "markdown",
-                "content": content
-            }
-
-        def add_vertical_stack_card(cards):
-            """Creates a Home Assistant 'vertical-stack' card with the given list of cards"""
-            return {
-                "type": "vertical-stack",
-                "cards": cards
-            }
-
-        def add_state_switch_card(states):
-            return {
-                "type": "custom:state-switch",
-                "entity": f'input_select.{self.app_name_short}_device_type',
-                "states": states
-            }
-
-        def add_apexcharts_card(title, entity_id, series_name):
-            """Creates a 'custom:apexcharts-card' for visualizing sensor data"""
-            return {
-                "type": "custom:apexcharts-card",
-                "header": {
-                    "show": True,
-                    "title": title,
-                },
-                "graph_span": "24h",
-                "span": {
-                    "start": "day",
-                },
-                "now": {
-                    "show": True,
-                    "label": "Now",
-                },
-                "series": [
-                    {
-                        "entity": entity_id,
-                        "name": series_name,
-                        "type": "line",
-                        # Customize additional series options as needed
-                    }
-                ],
-                # Add any additional customization here
-            }
+        self.history_store.append(
+            room,
+            self.now().timestamp(),
+            sensor_data,
+            time_scores,
+            priority_device,
+            weight_score
+        )
 
-        on_booleans = {
-            "master_and_user_overrides": None,
-            "is_room_occupied": None,
-            "is_anyone_home": None,
-            "humidifier": None,
-            "purifier": None,
-            "oil_diffuser": None,
-            "fan": None,
-            "priority_device": None,
-            "warnings": None,
-            "air_circulation": None,
-            "deodorize_and_refresh": None,
-            "humidify": None,
-            'latency': None,
-            'last_triggered': None,
-        }
-        off_booleans = {
-            "master_and_user_overrides": None,
-            "is_room_not_occupied": None,
-            'latency': None,
-            'last_triggered': None,
-        }
-        cards = []
-
-        glance_entities = {}
-        room_automation_boolean_checks = {}
-        room_details = {}
-        for log_sensor, room in self.room_automation_booleans.items():
-            log_sensor_str = log_sensor.replace(" ", "_").lower()
-            if room not in room_automation_boolean_checks:
-                room_automation_boolean_checks[room] = {}
-                room_details[room] = {
-                    'master_on': {
-                        'attributes_cache': {device_type: {} for device_type in self.device_types},
-                        'entity_details': {device_type: [] for device_type in self.device_types}
-                    },
-                    'master_off': {
-                        'attributes_cache': {device_type: {} for device_type in self.device_types},
-                        'entity_details': {device_type: [] for device_type in self.device_types}
-                    }
-                }
+    def generate_logging_cards(self, *args, **kwargs):
+        """Send the dashboard cards of every room whose card subtree changed since it was last sent.
 
-            if 'on_conditions' in log_sensor_str:
-                attributes_cache = room_details[room]['master_on']['attributes_cache']
-                entity_details = room_details[room]['master_on']['entity_details']
-
-                for device_type in self.device_types:
-                    if device_type in log_sensor_str:
-                        for attr in on_booleans:
-                            if attr not in attributes_cache[device_type]:
-                                attributes_cache[device_type][attr] = True
-                            else:
-                                continue
-                            entity_details[device_type].append({
-                                "type": "attribute",
-                                "entity": f'{log_sensor.replace(" ", "_").lower()}',
-                                "name": f"{attr.replace('_', ' ').title()}",
-                                "attribute": attr,
-                                "icon": "mdi:account"  # Customize the icon as needed
-                            })
-
-                        entity_details[device_type].append({
-                            "entity": f'{log_sensor.replace(" ", "_").lower()}',
-                            "name": "Current Status",
-                        })
-
-                room_automation_boolean_checks[room]['master_on'] = {'log_sensor': log_sensor,
-                                                                     'entity_details': entity_details}
-            elif 'off_conditions' in log_sensor_str:
-                attributes_cache = room_details[room]['master_off']['attributes_cache']
-                entity_details = room_details[room]['master_off']['entity_details']
-
-                for device_type in self.device_types:
-                    if device_type in log_sensor_str:
-                        for attr in off_booleans:
-                            if attr not in attributes_cache:
-                                attributes_cache[device_type][attr] = True
-                            else:
-                                continue
-                            entity_details[device_type].append({
-                                "type": "attribute",
-                                "entity": f'{log_sensor.replace(" ", "_").lower()}',
-                                "name": f"{attr.replace('_', ' ').title()}",
-                                "attribute": attr,
-                                "icon": "mdi:account"  # Customize the icon as needed
-                            })
-                        entity_details[device_type].append({
-                            "entity": f'{log_sensor.replace(" ", "_").lower()}',
-                            "name": "Current Status",
-                        })
-                room_automation_boolean_checks[room]['master_off'] = {'log_sensor': log_sensor,
-                                                                      'entity_details': entity_details}
-
-        for room, room_details in room_automation_boolean_checks.items():
-            state_cards = {}
-            for device_type in self.device_types:
-                state_cards.update(
-                    {
-                        device_type: add_vertical_stack_card(
-                            [
-                                add_entities_card(
-                                    f"{room.replace('_', ' ').title()} - {device_type.replace('_', ' ').title()} Master On",
-                                    room_details['master_on']['entity_details'][device_type]
-                                ),
-                                add_entities_card(
-                                    f"{room.replace('_', ' ').title()} - {device_type.replace('_', ' ').title()} Master Off",
-                                    room_details['master_off']['entity_details'][device_type]
-                                ),
-                            ]
-                        )
-                    }
-                )
-            cards.append(add_state_switch_card(state_cards))
-
-        # --- New code to add organized charts for aggregated sensors ---
-        # Define sensor types and their categories
-        sensor_categories = {
-            'Particulate Matter': ['pm2_5', 'pm10', 'pm1', 'pm4'],
-            'Gases': ['nox', 'co2', 'voc', 'methane', 'carbon_monoxide', 'nitrogen_dioxide', 'ethanol', 'hydrogen',
-                      'ammonia'],
-            'Environmental Factors': ['temperature', 'humidity', 'air_pressure'],
+        Each room's cards go to pyscript under their own custom_card_id, so an unchanged room costs a hash and no
+        service call. Rooms no longer in Home Assistant have their cards cleared.
+        """
+        rooms = {room_config['area_id'] for room_config in self.areas}
+        cards_by_id = {
+            room_card_id(room): self.build_room_cards(room) for room in self.room_log_sensors if room in rooms
         }
+        changed = self.dashboard_cards.changed(cards_by_id)
+        for card_id, cards in changed.items():
+            self.call_service(
+                service='pyscript/receive_custom_dashboard_cards',
+                app_name=self.app_name_short,
+                cards=cards,
+                custom_card_id=card_id
+            )
 
-        rooms = set(self.room_automation_booleans.values())
+        self.log_lazy(
+            message=lambda: f"""
+                In generate_logging_cards:
+                Sent the cards of {sorted(changed)}.
+                Dashboard Card Stats: {self.dashboard_cards.stats}
+            """,
+            level='DEBUG',
+            function_name='generate_logging_cards'
+        )
 
-        for room in rooms:
-            room_name_formatted = room.replace('_', ' ').title()
-            category_cards = []
-
-            for category_name, sensor_types in sensor_categories.items():
-                sensor_cards = []
-                for sensor_type in sensor_types:
-                    if sensor_type.endswith('y'):
-                        sensor_type = sensor_type[:-1] + 'ies'
-                        entity_id = f'sensor.{room}_{sensor_type}'
-                    else:
-                        entity_id = f'sensor.{room}_{sensor_type}s'
-
-                    if self.get_state(entity_id):
-                        chart_title = f"{sensor_type.upper()} Levels"
-                        chart_card = add_apexcharts_card(chart_title, entity_id, sensor_type.upper())
-                        sensor_cards.append(chart_card)
-
-                if sensor_cards:
-                    # Group sensor charts in a vertical stack within the category
-                    category_stack = add_vertical_stack_card(sensor_cards)
-                    # Add a markdown card for the category title
-                    category_title_card = {
-                        "type": "markdown",
-                        "content": f"## {category_name}"
-                    }
-                    # Combine title and charts
-                    category_cards.append(add_vertical_stack_card([category_title_card, category_stack]))
-
-            if category_cards:
-                # Add a markdown card for the room title
-                room_title_card = {
-                    "type": "markdown",
-                    "content": f"# {room_name_formatted}"
-                }
-                # Group all category cards for the room
-                room_stack = add_vertical_stack_card([room_title_card] + category_cards)
-                cards.append(room_stack)
-        # --- End of new code ---
+    def build_room_cards(self, room):
+        """A room's automation conditions per device type, then its sensor charts by category."""
+        room_name = room.replace('_', ' ').title()
+        log_sensors = self.room_log_sensors[room]
+        state_cards = {}
+        for device_type in self.device_types:
+            device_name = device_type.replace('_', ' ').title()
+            stacked_cards = []
+            for master_onoff, attributes in [('on', ON_CONDITION_ATTRIBUTES), ('off', OFF_CONDITION_ATTRIBUTES)]:
+                log_sensor = log_sensors.get((device_type, master_onoff))
+                stacked_cards.append(entities_card(
+                    f"{room_name} - {device_name} Master {master_onoff.title()}",
+                    condition_rows(log_sensor, attributes) if log_sensor else []
+                ))
+            state_cards[device_type] = vertical_stack_card(stacked_cards)
+        cards = [state_switch_card(f'input_select.{self.app_name_short}_device_type', state_cards)]
+
+        category_cards = []
+        for category_name, metrics in CHART_CATEGORIES.items():
+            sensor_cards = [card for card in (self.sensor_chart_card(room, metric) for metric in metrics) if card]
+            if sensor_cards:
+                category_cards.append(vertical_stack_card([
+                    markdown_card(f"## {category_name}"),
+                    vertical_stack_card(sensor_cards)
+                ]))
+        if category_cards:
+            cards.append(vertical_stack_card([markdown_card(f"# {room_name}")] + category_cards))
+        return cards
+
+    def sensor_chart_card(self, room, metric):
+        """Chart of the room's rollups of the metric if its sensors feed them, otherwise of the raw group sensor if
+        it exists in the entity registry.
+        """
+        if (room, metric) in self.sensor_entity_values:
+            return rollup_apexcharts_card(
+                f"{metric.upper()} Levels",
+                f'sensor.{room}_{self.app_name_short}_{metric}_rollup',
+                metric.upper()
+            )
 
-        self.call_service(
-            service='pyscript/receive_custom_dashboard_cards',
-            app_name=self.app_name_short,
-            cards=cards,
-            custom_card_id='windows_automation_boolean_checks'
-        )
+        sensor_type = metric[:-1] + 'ies' if metric.endswith('y') else f'{metric}s'
+        entity_id = f'sensor.{room}_{sensor_type}'
+        if not self.topology.match(None, 'sensor', f'^{re.escape(entity_id)}$'):
+            return None
+        return apexcharts_card(f"{sensor_type.upper()} Levels", entity_id, sensor_type.upper())
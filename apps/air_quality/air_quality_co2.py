@@ -0,0 +1,100 @@
+"""CO2 threshold-crossing trigger for the Air Quality app.
+
+CO2 sensors are aggregated per target (the whole house, a floor or a room) by
+their highest reading. A target fires once when it rises over the rising
+threshold, re-arms only after falling back under the falling threshold, and
+never fires twice within the re-arm interval. A crossing inside the re-arm
+interval is kept pending and fires once the interval expires if the target is
+still high.
+"""
+import math
+
+DEFAULT_RISING = 1100
+DEFAULT_FALLING = 1000
+DEFAULT_REARM_INTERVAL = 1800  # Seconds
+
+SCOPES = ('house', 'floor', 'room')
+
+
+class Co2Trigger:
+    """Hysteresis and rate limit per target over the highest CO2 reading of its sensors."""
+
+    def __init__(self, rising=DEFAULT_RISING, falling=DEFAULT_FALLING, rearm_interval=DEFAULT_REARM_INTERVAL):
+        if falling > rising:
+            raise ValueError(f"co2_trigger falling threshold {falling} is above the rising threshold {rising}")
+        self.rising = rising
+        self.falling = falling
+        self.rearm_interval = rearm_interval
+        self.sensor_targets = {}  # entity_id -> target
+        self.values = {}  # entity_id -> latest reading
+        self.targets = {}  # target -> {'sensors': [...], 'high': bool, 'pending': bool, 'last_fired': timestamp}
+        self.stats = {'updates': 0, 'fired': 0, 'rate_limited': 0}
+
+    def add_sensor(self, entity_id, target, value=math.nan):
+        """Assign a sensor to a target. A starting value above the rising threshold marks the target high without
+        firing. fire_high then fires it once the app is ready.
+        """
+        self.sensor_targets[entity_id] = target
+        self.values[entity_id] = value
+        state = self.targets.setdefault(
+            target, {'sensors': [], 'high': False, 'pending': False, 'last_fired': -math.inf}
+        )
+        state['sensors'].append(entity_id)
+        if self.level(target) >= self.rising:
+            state['high'] = True
+
+    def level(self, target):
+        """Highest current reading of the target's sensors, NaN if none has a reading."""
+        readings = [self.values[entity_id] for entity_id in self.targets[target]['sensors']]
+        readings = [value for value in readings if not math.isnan(value)]
+        return max(readings) if readings else math.nan
+
+    def _fire(self, state, now):
+        """Fire unless the target fired within the re-arm interval, in which case the fire is kept pending."""
+        if now - state['last_fired'] < self.rearm_interval:
+            if not state['pending']:
+                self.stats['rate_limited'] += 1
+            state['pending'] = True
+            return False
+        state['pending'] = False
+        state['last_fired'] = now
+        self.stats['fired'] += 1
+        return True
+
+    def fire_high(self, now):
+        """Fire every target that is currently high, subject to the re-arm interval. Returns the fired targets."""
+        return [target for target, state in self.targets.items() if state['high'] and self._fire(state, now)]
+
+    def rearm_at(self, target):
+        """Timestamp at which the target's pending fire is due, None if it has none."""
+        state = self.targets.get(target)
+        if state is None or not state['pending']:
+            return None
+        return state['last_fired'] + self.rearm_interval
+
+    def fire_pending(self, target, now):
+        """Fire the target's pending fire if it is still high and its re-arm interval has expired."""
+        state = self.targets.get(target)
+        return state is not None and state['high'] and state['pending'] and self._fire(state, now)
+
+    def update(self, entity_id, value, now):
+        """Feed a reading. Returns the sensor's target if this reading makes it fire, otherwise None."""
+        target = self.sensor_targets.get(entity_id)
+        if target is None:
+            return None
+        self.values[entity_id] = value
+        self.stats['updates'] += 1
+
+        state = self.targets[target]
+        level = self.level(target)
+        if state['high']:
+            if level <= self.falling:
+                state['high'] = False
+                state['pending'] = False
+                return None
+            return target if state['pending'] and self._fire(state, now) else None
+        if not level >= self.rising:  # Also covers NaN
+            return None
+
+        state['high'] = True
+        return target if self._fire(state, now) else None
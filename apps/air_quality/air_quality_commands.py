@@ -0,0 +1,68 @@
+"""Command planning for the Air Quality app.
+
+The turn on/off functions of one room decision add their commands to a plan
+instead of calling services one by one. The plan merges them into a single
+service call per (domain, service, params, identity) with an entity_id list,
+which is then issued from one callback. A command is only merged into an
+earlier call if no call in between touches the same entities, so every entity
+still receives its commands in the order they were added.
+"""
+
+OPPOSITE_SERVICES = {'turn_on': 'turn_off', 'turn_off': 'turn_on'}
+
+# Command kwargs that are service data rather than entity matching arguments
+SERVICE_DATA_ARGS = (
+    'brightness', 'brightness_pct', 'color_name', 'humidity', 'mode', 'oscillating', 'percentage',
+    'preset_mode',
+)
+
+
+class CommandPlan:
+    """Service calls of one room decision or cron job, merged by (domain, service, params, identity)."""
+
+    def __init__(self):
+        self.calls = []  # [((domain, service, params, identity_kwargs), [entity_id, ...]), ...] in call order
+        self.planned = 0
+
+    def __len__(self):
+        return len(self.calls)
+
+    def add(self, domain, service, entity_ids, identity_kwargs=None, **params):
+        """Queue a service for the entities. A later turn_on/turn_off overrides an earlier opposite command, the
+        way it would have if the calls were made in order.
+        """
+        entity_ids = [entity_ids] if isinstance(entity_ids, str) else list(entity_ids)
+        opposite = OPPOSITE_SERVICES.get(service)
+        if opposite is not None:
+            for (call_domain, call_service, _, _), entities in self.calls:
+                if call_domain == domain and call_service == opposite:
+                    entities[:] = [entity_id for entity_id in entities if entity_id not in entity_ids]
+
+        key = (domain, service, tuple(sorted(params.items())), identity_kwargs)
+        entities = None
+        for call_key, call_entities in reversed(self.calls):
+            if call_key == key:
+                entities = call_entities
+                break
+            if any(entity_id in call_entities for entity_id in entity_ids):
+                break  # Merging further back would move this command before one the entities already got
+        if entities is None:
+            entities = []
+            self.calls.append((key, entities))
+        entities.extend(entity_id for entity_id in entity_ids if entity_id not in entities)
+        self.planned += 1
+
+    def planned_state(self, entity_id):
+        """'on' or 'off' if the plan turns the entity on or off, otherwise None."""
+        for (domain, service, _, _), entities in reversed(self.calls):
+            if service in OPPOSITE_SERVICES and entity_id in entities:
+                return 'on' if service == 'turn_on' else 'off'
+        return None
+
+    def service_calls(self):
+        """Yield (domain, service, entity_ids, params, identity_kwargs) for every merged call that still has
+        entities, in order.
+        """
+        for (domain, service, params, identity_kwargs), entities in self.calls:
+            if entities:
+                yield domain, service, list(entities), dict(params), identity_kwargs
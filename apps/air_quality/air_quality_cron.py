@@ -0,0 +1,37 @@
+"""House-wide cron job runs for the Air Quality app.
+
+A cron job (humidify, deodorize and refresh, air circulation) is evaluated for
+every room in one pass. Its start commands are issued as one merged plan and a
+single completion timer per job issues the final commands for all rooms.
+"""
+
+
+class CronJobRun:
+    """One firing of a house-wide cron job and its fan-out cost."""
+
+    def __init__(self, job, master_key, status, rooms, final_commands, house_final_commands=()):
+        self.job = job
+        self.master_key = master_key
+        self.status = status
+        self.rooms = list(rooms)
+        self.final_commands = list(final_commands)  # Command kwargs for command_devices, issued on completion
+        self.house_final_commands = list(house_final_commands)  # (domain, service, entity_ids, params)
+        self.finished = False
+        self.stats = {'rooms': len(self.rooms), 'commands': 0, 'service_calls': 0, 'timers': 0, 'carried_commands': 0}
+
+    def carry(self, replaced):
+        """Take over the pending final commands and rooms of an unfinished run this one replaces, so the devices it
+        started are still stopped.
+        """
+        carried = [command for command in replaced.final_commands if command not in self.final_commands]
+        self.final_commands.extend(carried)
+        self.house_final_commands.extend(
+            command for command in replaced.house_final_commands if command not in self.house_final_commands
+        )
+        self.rooms.extend(room for room in replaced.rooms if room not in self.rooms)
+        self.stats['carried_commands'] += len(carried)
+
+    def record(self, plan, service_calls):
+        """Add an executed plan to the run's cost."""
+        self.stats['commands'] += plan.planned
+        self.stats['service_calls'] += service_calls
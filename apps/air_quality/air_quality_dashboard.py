@@ -0,0 +1,179 @@
+"""Dashboard card generation for the Air Quality app.
+
+Cards are built per room and each room's subtree is hashed, so only rooms
+whose cards changed since they were last sent go to pyscript again. Card ids
+that are no longer built, such as rooms removed from Home Assistant or the
+single card id used before cards were split per room, are sent empty once.
+"""
+import hashlib
+import json
+
+ON_CONDITION_ATTRIBUTES = (
+    'master_and_user_overrides',
+    'is_room_occupied',
+    'is_anyone_home',
+    'humidifier',
+    'purifier',
+    'oil_diffuser',
+    'fan',
+    'priority_device',
+    'warnings',
+    'air_circulation',
+    'deodorize_and_refresh',
+    'humidify',
+    'latency',
+    'last_triggered',
+)
+
+OFF_CONDITION_ATTRIBUTES = (
+    'master_and_user_overrides',
+    'is_room_not_occupied',
+    'latency',
+    'last_triggered',
+)
+
+CHART_CATEGORIES = {
+    'Particulate Matter': ['pm2_5', 'pm10', 'pm1', 'pm4'],
+    'Gases': ['nox', 'co2', 'voc', 'methane', 'carbon_monoxide', 'nitrogen_dioxide', 'ethanol', 'hydrogen', 'ammonia'],
+    'Environmental Factors': ['temperature', 'humidity', 'air_pressure'],
+}
+
+CARD_ID_PREFIX = 'windows_automation_boolean_checks'
+LEGACY_CARD_ID = CARD_ID_PREFIX  # Every room's cards went under this id before they were split per room
+
+
+def room_card_id(room):
+    return f'{CARD_ID_PREFIX}_{room}'
+
+
+def entities_card(title, entities):
+    """Creates a Home Assistant 'entities' card with the given title and list of entities"""
+    return {
+        "type": "entities",
+        "title": title,
+        "entities": entities,
+    }
+
+
+def markdown_card(content):
+    """Creates a Home Assistant 'markdown' card with the given content"""
+    return {
+        "type": "markdown",
+        "content": content
+    }
+
+
+def vertical_stack_card(cards):
+    """Creates a Home Assistant 'vertical-stack' card with the given list of cards"""
+    return {
+        "type": "vertical-stack",
+        "cards": cards
+    }
+
+
+def state_switch_card(entity_id, states):
+    """Creates a 'custom:state-switch' card showing the card of the entity's current state"""
+    return {
+        "type": "custom:state-switch",
+        "entity": entity_id,
+        "states": states
+    }
+
+
+def condition_rows(log_sensor, attributes):
+    """Entities card rows for each attribute of a master on/off conditions sensor, then its current status"""
+    rows = [
+        {
+            "type": "attribute",
+            "entity": log_sensor,
+            "name": f"{attr.replace('_', ' ').title()}",
+            "attribute": attr,
+            "icon": "mdi:account"  # Customize the icon as needed
+        }
+        for attr in attributes
+    ]
+    rows.append({
+        "entity": log_sensor,
+        "name": "Current Status",
+    })
+    return rows
+
+
+def apexcharts_card(title, entity_id, series_name, series=None):
+    """Creates a 'custom:apexcharts-card' for visualizing sensor data"""
+    return {
+        "type": "custom:apexcharts-card",
+        "header": {
+            "show": True,
+            "title": title,
+        },
+        "graph_span": "24h",
+        "span": {
+            "start": "day",
+        },
+        "now": {
+            "show": True,
+            "label": "Now",
+        },
+        "series": series or [
+            {
+                "entity": entity_id,
+                "name": series_name,
+                "type": "line",
+                # Customize additional series options as needed
+            }
+        ],
+        # Add any additional customization here
+    }
+
+
+def rollup_apexcharts_card(title, entity_id, series_name, resolution='5m'):
+    """Creates a 'custom:apexcharts-card' drawn from a rollup sensor's min/mean/max arrays instead of the recorder
+    history
+    """
+    return apexcharts_card(title, entity_id, series_name, series=[
+        {
+            "entity": entity_id,
+            "name": f"{series_name} {stat.title()}",
+            "type": "line",
+            "opacity": 1 if stat == 'mean' else 0.3,
+            "data_generator": (
+                f"const rollup = entity.attributes['{resolution}'];"
+                f" return rollup.{stat}.map((value, i) => [(rollup.start + i * rollup.step) * 1000, value]);"
+            ),
+        }
+        for stat in ['min', 'mean', 'max']
+    ])
+
+
+class DashboardCards:
+    """Digest of the card subtree last sent under each custom card id."""
+
+    def __init__(self):
+        self.digests = {LEGACY_CARD_ID: None}  # Unknown cards an older version may have sent
+        self.stats = {'runs': 0, 'sent': 0, 'unchanged': 0, 'cleared': 0}
+
+    @staticmethod
+    def digest(cards):
+        return hashlib.sha256(json.dumps(cards, sort_keys=True).encode()).hexdigest()
+
+    def changed(self, cards_by_id):
+        """{card_id: cards} of the card ids whose cards differ from what was last sent, recorded as sent. A card id
+        that was never sent counts as having had no cards, and one that was sent but is missing now is cleared with
+        no cards.
+        """
+        empty = self.digest([])
+        changed = {}
+        for card_id, cards in cards_by_id.items():
+            digest = self.digest(cards)
+            if self.digests.get(card_id, empty) != digest:
+                self.digests[card_id] = digest
+                changed[card_id] = cards
+        self.stats['unchanged'] += len(cards_by_id) - len(changed)
+        for card_id in [card_id for card_id in self.digests if card_id not in cards_by_id]:
+            if self.digests.pop(card_id) != empty:
+                changed[card_id] = []
+                self.stats['cleared'] += 1
+        self.stats['runs'] += 1
+        self.stats['sent'] += len(changed)
+        return changed
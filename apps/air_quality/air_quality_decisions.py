@@ -0,0 +1,74 @@
+"""Deadband decision cache for the Air Quality app.
+
+A room's last decision is reused while every sensor reading stays within its
+relative deadband (``sensor_deviation``), the readings cross no warning
+threshold, the override and mode context is unchanged and the
+``priority_time`` window has not expired.
+"""
+import numpy as np
+
+from air_quality_priority import to_float
+from air_quality_sensors import SENSOR_METRICS
+
+
+class DecisionCache:
+    """Last decision per room, keyed on the sensor vector and decision context it was made with."""
+
+    def __init__(self, deviation=0.30, max_age=600, metrics=SENSOR_METRICS):
+        self.deviation = deviation
+        self.max_age = max_age
+        self.metrics = tuple(metrics)
+        self.entries = {}  # room -> (values, warning_mask, context, decision, timestamp)
+        self.stats = {
+            'hits': 0, 'misses': 0, 'expired': 0, 'warning_changes': 0, 'sensor_changes': 0, 'context_changes': 0
+        }
+
+    def sensor_vector(self, sensor_data):
+        return np.array([to_float(sensor_data.get(metric)) for metric in self.metrics])
+
+    def within_deadband(self, values, cached_values):
+        """True if no reading moved more than deviation x its cached value. Appearing or vanishing readings count
+        as a move.
+        """
+        missing, cached_missing = np.isnan(values), np.isnan(cached_values)
+        if np.any(missing != cached_missing):
+            return False
+        with np.errstate(invalid='ignore'):
+            moved = np.abs(values - cached_values) > self.deviation * np.abs(cached_values)
+        return not np.any(moved & ~missing)
+
+    def lookup(self, room, values, warning_mask, now, context):
+        """Return (True, decision) if the cached decision still holds, otherwise (False, None).
+
+        context is a callable, only called once the age, warning bitmask and readings still match.
+        """
+        entry = self.entries.get(room)
+        if entry is None:
+            self.stats['misses'] += 1
+            return False, None
+
+        cached_values, cached_warning_mask, cached_context, decision, timestamp = entry
+        if now - timestamp >= self.max_age:
+            reason = 'expired'
+        elif warning_mask != cached_warning_mask:
+            reason = 'warning_changes'  # A threshold was crossed either way, so the warning overrides apply
+        elif not self.within_deadband(values, cached_values):
+            reason = 'sensor_changes'
+        elif context() != cached_context:
+            reason = 'context_changes'
+        else:
+            self.stats['hits'] += 1
+            return True, decision
+
+        self.stats['misses'] += 1
+        self.stats[reason] += 1
+        return False, None
+
+    def store(self, room, values, warning_mask, context, decision, now):
+        self.entries[room] = (values, warning_mask, context, decision, now)
+
+    def invalidate(self, room=None):
+        if room is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(room, None)
@@ -0,0 +1,80 @@
+"""Phase-aligned oil diffuser duty cycles for the Air Quality app.
+
+Every room whose oil diffuser is cycling belongs to a group keyed by its
+(time_on, time_off) duty cycle. A group shares one tick timer, so all of its
+rooms switch phase together and each phase is a single batched service call.
+"""
+
+
+class DiffuserScheduler:
+    """Diffuser rooms grouped by duty cycle, with each room's diffuser and light entities cached."""
+
+    def __init__(self):
+        self.groups = {}  # (time_on, time_off) -> {'rooms': [room, ...], 'phase': 'on' | 'off', 'since': timestamp}
+        self.room_groups = {}  # room -> (time_on, time_off)
+        self.entities = {}  # room -> (diffusers, lights)
+
+    def __contains__(self, room):
+        return room in self.room_groups
+
+    def group(self, room):
+        return self.room_groups.get(room)
+
+    def join(self, room, time_on, time_off, diffusers, lights):
+        """Add a room to the group for its duty cycle. Returns (key, is_new_group). A room moving to another duty
+        cycle leaves its old group first.
+        """
+        key = (time_on, time_off)
+        self.entities[room] = (list(diffusers), list(lights))
+        if self.room_groups.get(room) == key:
+            return key, False
+        self.leave(room, keep_entities=True)
+
+        is_new_group = key not in self.groups
+        group = self.groups.setdefault(key, {'rooms': [], 'phase': 'on', 'since': None})
+        group['rooms'].append(room)
+        self.room_groups[room] = key
+        return key, is_new_group
+
+    def leave(self, room, keep_entities=False):
+        """Remove a room. Returns the key of the group it left, or None."""
+        key = self.room_groups.pop(room, None)
+        if not keep_entities:
+            self.entities.pop(room, None)
+        if key is None:
+            return None
+
+        group = self.groups[key]
+        group['rooms'].remove(room)
+        if not group['rooms']:
+            del self.groups[key]
+        return key
+
+    def rooms(self, key):
+        group = self.groups.get(key)
+        return list(group['rooms']) if group else []
+
+    def phase(self, key):
+        group = self.groups.get(key)
+        return group['phase'] if group else None
+
+    def set_phase(self, key, phase, since=None):
+        self.groups[key]['phase'] = phase
+        self.groups[key]['since'] = since
+
+    def resume_phase(self, key, phase, since, now):
+        """The phase a group that entered phase at since is in now, as (phase, seconds since that phase began)."""
+        time_on, time_off = key
+        position = ((now - since) + (0 if phase == 'on' else time_on)) % (time_on + time_off)
+        if position < time_on:
+            return 'on', position
+        return 'off', position - time_on
+
+    def room_entities(self, rooms):
+        """(diffusers, lights) of all the rooms, merged for one batched call."""
+        diffusers, lights = [], []
+        for room in rooms:
+            room_diffusers, room_lights = self.entities.get(room, ([], []))
+            diffusers.extend(room_diffusers)
+            lights.extend(room_lights)
+        return diffusers, lights
@@ -0,0 +1,70 @@
+"""Humidifier empty-tank detection for the Air Quality app.
+
+A humidifier with an empty tank either reports ``water_lacks`` or turns itself
+off right after being commanded on. Each device runs a small state machine fed
+by one long-lived listener, and an empty tank is reported once until the
+device shows it has water again.
+"""
+import math
+
+DEFAULT_WINDOW = 5  # Seconds after a command in which an on -> off transition means an empty tank
+
+IDLE = 'idle'
+ARMED = 'armed'
+EMPTY = 'empty'
+
+
+class EmptyTankDetector:
+    """Per-device idle -> armed -> empty state machine."""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.states = {}  # entity_id -> IDLE | ARMED | EMPTY
+        self.commanded_at = {}  # entity_id -> timestamp of the last turn on / mode command
+        self.stats = {'commands': 0, 'empty_events': 0, 'refills': 0}
+
+    def state(self, entity_id):
+        return self.states.get(entity_id, IDLE)
+
+    def commanded(self, entity_id, timestamp):
+        """A turn on or mode command was sent. An empty device stays empty so it is not reported twice."""
+        self.commanded_at[entity_id] = timestamp
+        if self.state(entity_id) != EMPTY:
+            self.states[entity_id] = ARMED
+        self.stats['commands'] += 1
+
+    def transition(self, entity_id, old, new, timestamp):
+        """Feed a state change. Returns True if it reveals an empty tank that has not been reported yet."""
+        if old == new:
+            return False
+
+        within_window = timestamp - self.commanded_at.get(entity_id, -math.inf) <= self.window
+        if old == 'on' and new == 'off':
+            if within_window:
+                return self._empty(entity_id)
+            if self.state(entity_id) == EMPTY:
+                self._refill(entity_id)  # Ran past the window, so it has water again
+            else:
+                self.states[entity_id] = IDLE
+        return False
+
+    def water_lacks(self, entity_id, value):
+        """Feed the water_lacks attribute. Returns True if it reveals an empty tank that has not been reported."""
+        if value is None:
+            return False
+        if value:
+            return self._empty(entity_id)
+        if self.state(entity_id) == EMPTY:
+            self._refill(entity_id)
+        return False
+
+    def _empty(self, entity_id):
+        if self.state(entity_id) == EMPTY:
+            return False
+        self.states[entity_id] = EMPTY
+        self.stats['empty_events'] += 1
+        return True
+
+    def _refill(self, entity_id):
+        self.states[entity_id] = IDLE
+        self.stats['refills'] += 1
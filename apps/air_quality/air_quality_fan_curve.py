@@ -0,0 +1,80 @@
+"""Compiled purifier fan curves for the Air Quality app.
+
+Each room's ``thresholds_pm25_*`` / ``percentage_pm25_*`` input_numbers are
+compiled into a breakpoint table sorted by threshold. Lookups are a binary
+search with no I/O, and a table is only recompiled after one of its input_numbers
+changes.
+"""
+import bisect
+
+import numpy as np
+
+from air_quality_priority import to_float
+
+FAN_CURVE_STEPS = (
+    'pm25_low',
+    'pm25_medium_low',
+    'pm25_medium_high',
+    'pm25_high',
+)
+
+MAX_PERCENTAGE = 100
+
+
+class FanCurves:
+    """Per-room pm2.5 -> fan percentage tables.
+
+    Below the highest threshold, the default step curve returns the percentage of the first threshold above
+    the reading. Above it, the curve returns 100. With interpolate=True, percentages are interpolated linearly
+    between breakpoints. A room without usable breakpoints returns 0.
+    """
+
+    def __init__(self, interpolate=False):
+        self.interpolate = interpolate
+        self.raw = {}  # room -> {('thresholds' | 'percentage', step): value}
+        self.tables = {}  # room -> (thresholds, percentages), compiled on demand
+
+    @staticmethod
+    def entities(room):
+        """Map each input_number the room's curve depends on to its (kind, step) key."""
+        return {
+            f'input_number.{room}_{kind}_{step}': (kind, step)
+            for step in FAN_CURVE_STEPS
+            for kind in ('thresholds', 'percentage')
+        }
+
+    def set_value(self, room, kind, step, value):
+        """Record a new input_number value and invalidate the room's compiled table."""
+        self.raw.setdefault(room, {})[(kind, step)] = to_float(value)
+        self.tables.pop(room, None)
+
+    def table(self, room):
+        """The room's breakpoints as (thresholds, percentages), sorted by threshold."""
+        table = self.tables.get(room)
+        if table is None:
+            raw = self.raw.get(room, {})
+            breakpoints = []
+            for step in FAN_CURVE_STEPS:
+                threshold = raw.get(('thresholds', step), np.nan)
+                percent = raw.get(('percentage', step), np.nan)
+                # Zero and non-numeric values disable a step
+                if threshold and percent and not np.isnan(threshold) and not np.isnan(percent):
+                    breakpoints.append((threshold, percent))
+            breakpoints.sort(key=lambda breakpoint: breakpoint[0])
+            table = self.tables[room] = (
+                [threshold for threshold, percent in breakpoints],
+                [percent for threshold, percent in breakpoints],
+            )
+        return table
+
+    def percentage(self, room, pm2_5):
+        """Fan percentage for a single pm2.5 reading."""
+        thresholds, percentages = self.table(room)
+        if not thresholds:
+            return 0
+
+        if self.interpolate:
+            return float(np.interp(pm2_5, thresholds, percentages, right=MAX_PERCENTAGE))
+
+        i = bisect.bisect_right(thresholds, pm2_5)  # First threshold above the reading
+        return percentages[i] if i < len(thresholds) else MAX_PERCENTAGE
@@ -0,0 +1,57 @@
+"""Short-horizon trend forecasts for the Air Quality app.
+
+Each room runs Holt's linear exponential smoothing over the samples of the
+forecast metrics. An update is O(1), and the trend is kept per second so
+irregular sampling intervals are handled. The value projected over a horizon
+can stand in for the current reading as a scoring input, so devices start
+before a rising metric crosses its threshold.
+"""
+import math
+
+import numpy as np
+
+DEFAULT_ALPHA = 0.3  # Level smoothing
+DEFAULT_BETA = 0.1  # Trend smoothing
+DEFAULT_HORIZON = 600  # Seconds
+
+
+class HoltForecaster:
+    """Level, per-second trend and last update time per metric."""
+
+    def __init__(self, metrics, alpha=DEFAULT_ALPHA, beta=DEFAULT_BETA):
+        if not 0 < alpha <= 1 or not 0 < beta <= 1:
+            raise ValueError(f"forecast alpha and beta must be in (0, 1], got {alpha} and {beta}")
+        self.metrics = tuple(metrics)
+        self.metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+        self.alpha = alpha
+        self.beta = beta
+        self.level = np.full(len(self.metrics), np.nan)
+        self.trend = np.zeros(len(self.metrics))
+        self.updated = np.full(len(self.metrics), np.nan)
+
+    def update(self, metric, value, timestamp):
+        m = self.metric_index.get(metric)
+        if m is None or math.isnan(value):
+            return
+        level = self.level[m]
+        if math.isnan(level):
+            self.level[m], self.trend[m], self.updated[m] = value, 0.0, timestamp
+            return
+
+        elapsed = timestamp - self.updated[m]
+        if elapsed <= 0:  # Several samples at once only move the level
+            self.level[m] = self.alpha * value + (1 - self.alpha) * level
+            return
+        self.level[m] = self.alpha * value + (1 - self.alpha) * (level + self.trend[m] * elapsed)
+        self.trend[m] = self.beta * (self.level[m] - level) / elapsed + (1 - self.beta) * self.trend[m]
+        self.updated[m] = timestamp
+
+    def forecast(self, metric, horizon, now):
+        """Projected value horizon seconds from now, NaN without samples. A metric that has not reported within the
+        horizon is projected flat, since sensors that only report changes go quiet when readings are steady.
+        """
+        m = self.metric_index[metric]
+        since_update = now - self.updated[m]
+        if since_update > horizon:
+            return self.level[m].item()
+        return (self.level[m] + self.trend[m] * (since_update + horizon)).item()
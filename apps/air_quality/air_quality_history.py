@@ -0,0 +1,225 @@
+"""Local columnar decision history for the Air Quality app.
+
+Every decision appends one row: the room, its sensor vector, the device
+scores, the weight score and the chosen device(s). Rows go to fixed-width
+NumPy columns in memory-mapped segment files, so appending is a few array
+writes and range queries read only the columns and segments they need.
+
+A segment covers one ``segment_seconds`` window, or less if it fills up.
+Segments that end before the retention period are deleted whenever a new
+segment is opened.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from air_quality_priority import to_float
+
+DEFAULT_SEGMENT_SECONDS = 86400
+DEFAULT_RETENTION_SECONDS = 30 * 86400
+DEFAULT_SEGMENT_ROWS = 65536
+
+BASE_COLUMNS = {'timestamp': 'f8', 'room': 'u2', 'device': 'u2', 'weight_score': 'f4'}
+
+
+def decode_devices(bitmasks, devices):
+    """Object array of device type tuples for an array of device bitmasks."""
+    decoded = np.empty(len(bitmasks), dtype=object)
+    for i, bits in enumerate(bitmasks.tolist()):
+        decoded[i] = tuple(device for d, device in enumerate(devices) if bits >> d & 1)
+    return decoded
+
+
+class HistoryStore:
+    """Append-only store of decision rows in time-rotated segments of memory-mapped .npy columns.
+
+    The chosen device is stored as a bitmask over the segment's device types, and the room as an index into the
+    store's room list, so every column has a fixed width.
+    """
+
+    def __init__(self, path, metrics, devices, segment_seconds=DEFAULT_SEGMENT_SECONDS,
+                 retention_seconds=DEFAULT_RETENTION_SECONDS, segment_rows=DEFAULT_SEGMENT_ROWS):
+        if len(devices) > 16:
+            raise ValueError(f"The history store encodes at most 16 device types, got {len(devices)}")
+        self.path = path
+        self.metrics = tuple(metrics)
+        self.devices = tuple(devices)
+        self.device_bits = {device: 1 << i for i, device in enumerate(self.devices)}
+        self.columns = {
+            **BASE_COLUMNS,
+            **{metric: 'f4' for metric in self.metrics},
+            **{f'{device}_score': 'f4' for device in self.devices},
+        }
+        self.segment_seconds = segment_seconds
+        self.retention_seconds = retention_seconds
+        self.segment_rows = segment_rows
+        self.segment = None  # {'name', 'start', 'sequence', 'columns': {column: memmap}, 'rows'}
+        self.rooms = self.load_rooms()
+        self.room_index = {room: i for i, room in enumerate(self.rooms)}
+        self.stats = {'appended': 0, 'segments': 0, 'expired': 0}
+
+    def load_rooms(self):
+        if not self.path or not os.path.exists(os.path.join(self.path, 'rooms.json')):
+            return []
+        with open(os.path.join(self.path, 'rooms.json')) as rooms_file:
+            return json.load(rooms_file)
+
+    def room_id(self, room):
+        """Index of the room, appending it to the persisted room list the first time it is seen."""
+        if room not in self.room_index:
+            self.room_index[room] = len(self.rooms)
+            self.rooms.append(room)
+            temporary_path = os.path.join(self.path, 'rooms.json.tmp')
+            with open(temporary_path, 'w') as rooms_file:
+                json.dump(self.rooms, rooms_file)
+            os.replace(temporary_path, os.path.join(self.path, 'rooms.json'))
+        return self.room_index[room]
+
+    def encode_device(self, device):
+        devices = device if isinstance(device, (list, tuple)) else [device]
+        return sum(self.device_bits.get(device, 0) for device in devices)
+
+    def append(self, room, timestamp, sensor_data, scores, device, weight_score):
+        """Append one decision. scores maps device type -> score; device is a device type, a list of them or
+        None.
+        """
+        if not self.path:
+            return
+        segment = self.segment_for(timestamp)
+        columns, row = segment['columns'], segment['rows']
+        columns['timestamp'][row] = timestamp
+        columns['room'][row] = self.room_id(room)
+        columns['device'][row] = self.encode_device(device)
+        columns['weight_score'][row] = to_float(weight_score)
+        for metric in self.metrics:
+            columns[metric][row] = to_float(sensor_data.get(metric))
+        for device_type in self.devices:
+            columns[f'{device_type}_score'][row] = to_float(scores.get(device_type))
+        segment['rows'] += 1
+        self.stats['appended'] += 1
+
+    def segment_for(self, timestamp):
+        """The open segment if the timestamp falls in its window and it has room, otherwise a new one."""
+        start = int(timestamp // self.segment_seconds * self.segment_seconds)
+        segment = self.segment
+        if segment is not None and segment['start'] == start:
+            if segment['rows'] < self.segment_rows:
+                return segment
+            return self.open_segment(start, segment['sequence'] + 1)
+
+        # After a restart, continue the window's last segment if it still has room and the same columns
+        existing = [name for name in self.segment_names() if int(name.split('_')[0]) == start]
+        if existing:
+            sequence = int(existing[-1].split('_')[1])
+            columns, rows, schema = self.read_segment(existing[-1], mode='r+')
+            if rows < len(columns['timestamp']) and set(columns) == set(self.columns) and \
+                    tuple(schema['devices']) == self.devices:
+                self.flush()
+                self.segment = {'name': existing[-1], 'start': start, 'sequence': sequence, 'columns': columns,
+                                'rows': rows}
+                return self.segment
+            return self.open_segment(start, sequence + 1)
+        return self.open_segment(start, 0)
+
+    def open_segment(self, start, sequence):
+        self.flush()
+        name = f'{start:012d}_{sequence:04d}'
+        directory = os.path.join(self.path, name)
+        os.makedirs(directory, exist_ok=True)
+        columns = {
+            column: np.lib.format.open_memmap(
+                os.path.join(directory, f'{column}.npy'), mode='w+', dtype=dtype, shape=(self.segment_rows,)
+            )
+            for column, dtype in self.columns.items()
+        }
+        columns['timestamp'][:] = np.nan  # Marks unwritten rows, so a reopened segment knows its row count
+        with open(os.path.join(directory, 'schema.json'), 'w') as schema_file:
+            json.dump({'start': start, 'devices': self.devices}, schema_file)
+
+        self.segment = {'name': name, 'start': start, 'sequence': sequence, 'columns': columns, 'rows': 0}
+        self.stats['segments'] += 1
+        self.expire(start)
+        return self.segment
+
+    def segment_names(self):
+        """Segment directory names in chronological order."""
+        if not self.path or not os.path.isdir(self.path):
+            return []
+        return sorted(
+            name for name in os.listdir(self.path)
+            if os.path.exists(os.path.join(self.path, name, 'schema.json'))
+        )
+
+    def read_segment(self, name, mode='r'):
+        """({column: memmap}, rows written, schema) of a segment on disk."""
+        directory = os.path.join(self.path, name)
+        with open(os.path.join(directory, 'schema.json')) as schema_file:
+            schema = json.load(schema_file)
+        columns = {
+            file_name[:-len('.npy')]: np.load(os.path.join(directory, file_name), mmap_mode=mode)
+            for file_name in os.listdir(directory)
+            if file_name.endswith('.npy')
+        }
+        unwritten = np.flatnonzero(np.isnan(columns['timestamp']))
+        rows = int(unwritten[0]) if len(unwritten) else len(columns['timestamp'])
+        return columns, rows, schema
+
+    def expire(self, now):
+        """Delete segments whose window ended before the retention period."""
+        for name in self.segment_names():
+            if self.segment is not None and name == self.segment['name']:
+                continue
+            if int(name.split('_')[0]) + self.segment_seconds <= now - self.retention_seconds:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+                self.stats['expired'] += 1
+
+    def flush(self):
+        if self.segment is not None:
+            for column in self.segment['columns'].values():
+                column.flush()
+
+    def query(self, start, end, rooms=None, columns=None):
+        """Rows with start <= timestamp < end as {column: array}, in segment order.
+
+        columns selects metrics and ``<device>_score`` columns (all of them by default). 'timestamp', 'room' and
+        'device' are always included, with rooms as names and devices as tuples of device types. Columns a segment
+        does not have read as NaN.
+        """
+        selected = list(columns) if columns is not None else [
+            column for column in self.columns if column not in ('timestamp', 'room', 'device')
+        ]
+        room_ids = None if rooms is None else [self.room_index[room] for room in rooms if room in self.room_index]
+        parts = {column: [] for column in ['timestamp', 'room', 'device', *selected]}
+
+        for name in self.segment_names():
+            segment_start = int(name.split('_')[0])
+            if segment_start >= end or segment_start + self.segment_seconds <= start:
+                continue
+            if self.segment is not None and name == self.segment['name']:
+                data, rows = self.segment['columns'], self.segment['rows']
+                devices = self.devices
+            else:
+                data, rows, schema = self.read_segment(name)
+                devices = tuple(schema['devices'])
+
+            timestamps = data['timestamp'][:rows]
+            mask = (timestamps >= start) & (timestamps < end)
+            if room_ids is not None:
+                mask &= np.isin(data['room'][:rows], room_ids)
+
+            parts['timestamp'].append(timestamps[mask])
+            parts['room'].append(np.array(self.rooms, dtype=object)[data['room'][:rows][mask]])
+            parts['device'].append(decode_devices(data['device'][:rows][mask], devices))
+            for column in selected:
+                if column in data:
+                    parts[column].append(np.asarray(data[column][:rows][mask], dtype=float))
+                else:
+                    parts[column].append(np.full(int(mask.sum()), np.nan))
+
+        return {
+            column: np.concatenate(arrays) if arrays else np.empty(0, dtype=object if column in ('room', 'device')
+                                                                    else float)
+            for column, arrays in parts.items()
+        }
@@ -0,0 +1,78 @@
+"""Device inactivity tracking for the Air Quality app.
+
+Every tracked fan, humidifier, purifier and diffuser has a slot in a compact
+timestamp array recording when it last turned off. State-change events update
+the slot, so time-weighted scoring reads inactive durations without querying HA.
+"""
+import numpy as np
+
+SECONDS_PER_HOUR = 3600
+
+
+class InactivityTracker:
+    """Off-since timestamps per entity. NaN marks an entity that is not currently off."""
+
+    def __init__(self, capacity=64):
+        self.entity_index = {}
+        self.entities = []
+        self.room_names = []
+        self.room_index = {}
+        self.seeded = set()
+        self.off_since = np.full(capacity, np.nan)
+        self.rooms = np.zeros(capacity, dtype=np.intp)
+        self.devices = np.zeros(capacity, dtype=np.intp)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def track(self, entity_id, room, device_index, off_since=np.nan):
+        """Start tracking an entity. Returns False if it is already tracked."""
+        if entity_id in self.entity_index:
+            return False
+
+        i = len(self.entities)
+        if i == len(self.off_since):
+            self._grow()
+        if room not in self.room_index:
+            self.room_index[room] = len(self.room_names)
+            self.room_names.append(room)
+
+        self.entity_index[entity_id] = i
+        self.entities.append(entity_id)
+        self.off_since[i] = off_since
+        self.rooms[i] = self.room_index[room]
+        self.devices[i] = device_index
+        return True
+
+    def transition(self, entity_id, is_off, timestamp):
+        """Record a state change. Only the first 'off' of a streak sets the timestamp."""
+        i = self.entity_index.get(entity_id)
+        if i is None:
+            return
+        if not is_off:
+            self.off_since[i] = np.nan
+        elif np.isnan(self.off_since[i]):
+            self.off_since[i] = timestamp
+
+    def time_inputs(self, rooms, now):
+        """(hours, device_index, room_index) for every entity in the given rooms, ready for
+        ``PriorityEngine.time_scores``. room_index refers to positions in ``rooms``.
+        """
+        n = len(self.entities)
+        positions = np.full(len(self.room_names), -1, dtype=np.intp)
+        for position, room in enumerate(rooms):
+            i = self.room_index.get(room)
+            if i is not None:
+                positions[i] = position
+
+        room_positions = positions[self.rooms[:n]]
+        selected = room_positions >= 0
+        off_since = self.off_since[:n][selected]
+        hours = np.where(np.isnan(off_since), 0.0, (now - off_since) / SECONDS_PER_HOUR)
+        return hours, self.devices[:n][selected], room_positions[selected]
+
+    def _grow(self):
+        capacity = len(self.off_since) * 2
+        self.off_since = np.concatenate([self.off_since, np.full(capacity - len(self.off_since), np.nan)])
+        self.rooms = np.concatenate([self.rooms, np.zeros(capacity - len(self.rooms), dtype=np.intp)])
+        self.devices = np.concatenate([self.devices, np.zeros(capacity - len(self.devices), dtype=np.intp)])
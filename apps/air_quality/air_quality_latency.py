@@ -0,0 +1,119 @@
+"""Per-stage latency histograms for the Air Quality app.
+
+Every stage of the master on/off pipeline is timed with a monotonic clock into
+a fixed-bucket histogram per room. Percentiles are estimated from the buckets,
+and the histograms can be rendered in the OpenMetrics text format.
+"""
+import bisect
+import functools
+from time import perf_counter
+
+import numpy as np
+
+# Upper bounds in seconds. A final +Inf bucket is implied.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRIC_NAME = 'air_quality_stage_latency_seconds'
+
+
+class LatencyHistograms:
+    """Fixed-bucket histograms keyed by (room, stage)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(float(bound) for bound in buckets)
+        self.counts = {}  # (room, stage) -> bucket counts, one more than bounds for +Inf
+        self.sums = {}
+
+    def observe(self, room, stage, seconds):
+        key = (room, stage)
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = self.counts[key] = np.zeros(len(self.bounds) + 1, dtype=np.int64)
+            self.sums[key] = 0.0
+        counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.sums[key] += seconds
+
+    def stage(self, room, stage):
+        """Context manager that times a block into the (room, stage) histogram."""
+        return _StageTimer(self, room, stage)
+
+    def stages(self, room):
+        return [stage for key_room, stage in self.counts if key_room == room]
+
+    def count(self, room, stage):
+        counts = self.counts.get((room, stage))
+        return 0 if counts is None else int(counts.sum())
+
+    def percentile(self, room, stage, q):
+        """Estimate the q-th percentile (0-100) by interpolating linearly inside the bucket that holds it."""
+        counts = self.counts.get((room, stage))
+        if counts is None or not counts.sum():
+            return None
+
+        cumulative = np.cumsum(counts)
+        rank = q / 100 * cumulative[-1]
+        i = int(np.searchsorted(cumulative, rank))
+        if i >= len(self.bounds):
+            return self.bounds[-1]  # Nothing better than the last finite bound is known
+        lower = self.bounds[i - 1] if i else 0.0
+        below = cumulative[i - 1] if i else 0
+        fraction = (rank - below) / counts[i] if counts[i] else 1.0
+        return lower + (self.bounds[i] - lower) * fraction
+
+    def summary(self, room):
+        """{stage: {'p50': s, 'p99': s, 'count': n}} for every stage recorded for the room."""
+        return {
+            stage: {
+                'p50': self.percentile(room, stage, 50),
+                'p99': self.percentile(room, stage, 99),
+                'count': self.count(room, stage),
+            }
+            for stage in self.stages(room)
+        }
+
+    def openmetrics(self):
+        """Render every histogram in the OpenMetrics text exposition format."""
+        lines = [
+            f'# TYPE {METRIC_NAME} histogram',
+            f'# UNIT {METRIC_NAME} seconds',
+            f'# HELP {METRIC_NAME} Air Quality pipeline stage latency.',
+        ]
+        for (room, stage), counts in sorted(self.counts.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+            labels = f'room="{room}",stage="{stage}"'
+            cumulative = np.cumsum(counts)
+            for bound, total in zip(self.bounds, cumulative):
+                lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound:g}"}} {total}')
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {cumulative[-1]}')
+            lines.append(f'{METRIC_NAME}_count{{{labels}}} {cumulative[-1]}')
+            lines.append(f'{METRIC_NAME}_sum{{{labels}}} {self.sums[(room, stage)]:.6f}')
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+class _StageTimer:
+    def __init__(self, histograms, room, stage):
+        self.histograms = histograms
+        self.room = room
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histograms.observe(self.room, self.stage, perf_counter() - self.start)
+        return False
+
+
+def timed_stage(stage):
+    """Decorator timing an app method into self.latency_histograms. The room is read from the 'room' keyword
+    argument or the first positional argument.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            room = kwargs.get('room', args[0] if args else None)
+            with self.latency_histograms.stage(room, stage):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
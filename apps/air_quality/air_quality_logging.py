@@ -0,0 +1,55 @@
+"""Level gating for the Air Quality app's log messages.
+
+The gate decides from the ``logging:`` config whether a message could be
+emitted before anything is formatted. Only debug levels are gated. INFO and
+above always reach ``log_info``, which applies its own rules.
+"""
+
+LOG_LEVELS = {
+    'CRITICAL': 50,
+    'ERROR': 40,
+    'WARNING': 30,
+    'INFO': 20,
+    'DEBUG': 10,
+    'DEBUG_1': 9,
+    'DEBUG_2': 8,
+    'DEBUG_3': 7,
+}
+
+ALL = 'all'
+
+
+def _as_set(value):
+    if value is None:
+        return {ALL}
+    return set(value) if isinstance(value, (list, tuple, set)) else {value}
+
+
+class LogGate:
+    """Per room and per function level check with cached decisions and suppression counters."""
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.level = LOG_LEVELS.get(str(config.get('level', 'INFO')).upper(), LOG_LEVELS['INFO'])
+        self.rooms = _as_set(config.get('room'))
+        self.functions = _as_set(config.get('function'))
+        self.decisions = {}  # (level, room, function) -> bool
+        self.stats = {'emitted': 0, 'suppressed': 0}
+
+    def enabled(self, level, room=None, function_name=None):
+        key = (level, room, function_name)
+        decision = self.decisions.get(key)
+        if decision is None:
+            decision = self.decisions[key] = self._decide(level, room, function_name)
+        self.stats['emitted' if decision else 'suppressed'] += 1
+        return decision
+
+    def _decide(self, level, room, function_name):
+        numeric_level = LOG_LEVELS.get(str(level).upper())
+        if numeric_level is None or numeric_level >= LOG_LEVELS['INFO']:
+            return True
+        if numeric_level < self.level:
+            return False
+        room_match = ALL in self.rooms or room is None or room in self.rooms
+        function_match = ALL in self.functions or function_name is None or function_name in self.functions
+        return room_match and function_match
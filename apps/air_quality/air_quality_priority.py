@@ -0,0 +1,326 @@
+"""Vectorized priority scoring for the Air Quality app.
+
+The engine scores every room in one pass. Sensor readings arrive as a
+rooms x metrics matrix, and each device type owns a row in a devices x metrics
+weight mask. The per-metric scoring mirrors ``calculate_individual_score``.
+"""
+import numpy as np
+
+CONDITION_LOWER = 0
+CONDITION_GREATER = 1
+CONDITION_RANGE = 2
+
+CONDITION_CODES = {
+    'lower': CONDITION_LOWER,
+    'greater': CONDITION_GREATER,
+    'range': CONDITION_RANGE,
+}
+
+WEIGHTING_MODES = ('sum', 'mean', 'weighted')
+
+DEFAULT_DEVICES = ('purifier', 'humidifier', 'oil_diffuser', 'fan')
+
+DEFAULT_BASE_PRIORITIES = {'purifier': 0, 'humidifier': 0, 'oil_diffuser': 0.5, 'fan': 0}
+
+DEFAULT_DEVICE_METRICS = {
+    'purifier': [
+        'pm2_5',
+        'co2',
+        'voc',
+        'methane',
+        'carbon_monoxide',
+        'nitrogen_dioxide',
+        'ammonia'
+    ],
+    'humidifier': [
+        'humidity'
+    ],
+    'fan': [
+        'temperature',
+        'co2',
+        'voc',
+        'carbon_monoxide',
+    ],
+    'oil_diffuser': []  # Assuming oil diffuser doesn't depend on air quality metrics
+}
+
+DEFAULT_OPTIMAL_VALUES = {
+    'pm2_5': 50,
+    'co2': 1000,
+    'voc': 500,
+    'methane': 5,
+    'carbon_monoxide': 9,
+    'nitrogen_dioxide': 0.053,
+    'ammonia': 0.25,
+    'humidity': (40, 60),  # Optimal humidity range
+    'temperature': (35, 80),  # Optimal temperature range in Fahrenheit
+}
+
+DEFAULT_CONDITIONS = {
+    'pm2_5': 'lower',
+    'co2': 'lower',
+    'voc': 'lower',
+    'methane': 'lower',
+    'carbon_monoxide': 'lower',
+    'nitrogen_dioxide': 'lower',
+    'ammonia': 'lower',
+    'humidity': 'range',
+    'temperature': 'range',
+}
+
+# Time since a device was last active is scored against one hour
+TIME_OPTIMAL_VALUE = 1
+TIME_WEIGHT = 0.4
+SENSOR_WEIGHT = 0.6
+
+
+def to_float(value):
+    """Convert a sensor reading to float, mapping missing or unparsable values to NaN."""
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def individual_scores(values, optimal_low, optimal_high, conditions):
+    """Vectorized ``calculate_individual_score``.
+
+    ``optimal_low``, ``optimal_high`` and ``conditions`` broadcast against ``values``. For 'lower' and
+    'greater' metrics both bounds hold the same optimal value. NaN readings stay NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        above = np.maximum(values - optimal_high, 0) / optimal_high
+        below = np.maximum(optimal_low - values, 0) / optimal_low
+
+    scores = np.where(conditions == CONDITION_GREATER, below, above)
+    scores = np.where((conditions == CONDITION_RANGE) & (values < optimal_low), below, scores)
+    return np.where(np.isnan(values), np.nan, scores)
+
+
+class ScoringSpec:
+    """Immutable, array-backed scoring tables compiled once from the app config.
+
+    Every room gets a row in each table, and one extra default row covers rooms without overrides. The tables
+    are read-only, so the decision path can only index into them.
+
+    Config layout (all keys optional, defaults as in ``DEFAULT_*``)::
+
+        scoring:
+          time_weight: 0.4
+          sensor_weight: 0.6
+          base_priorities: {oil_diffuser: 0.5}
+          device_metrics: {purifier: [pm2_5, co2], fan: {temperature: 2, co2: 1}}
+          optimal_values: {pm2_5: 50, humidity: [40, 60]}
+          conditions: {pm2_5: lower, humidity: range}
+          rooms:
+            office:
+              optimal_values: {pm2_5: 35}
+    """
+
+    def __init__(self, rooms, metrics, devices, optimal_low, optimal_high, conditions, weights, base_priorities,
+                 time_weight, sensor_weight):
+        self.rooms = tuple(rooms)
+        self.metrics = tuple(metrics)
+        self.devices = tuple(devices)
+        self.room_index = {room: i for i, room in enumerate(self.rooms)}
+        self.metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+        self.device_index = {device: i for i, device in enumerate(self.devices)}
+        self.default_row = len(self.rooms)
+
+        # rows x metrics, rows x metrics, rows x metrics, rows x devices x metrics, rows x devices, rows, rows
+        self.optimal_low = _frozen(optimal_low, float)
+        self.optimal_high = _frozen(optimal_high, float)
+        self.conditions = _frozen(conditions, np.int8)
+        self.weights = _frozen(weights, float)
+        self.base_priorities = _frozen(base_priorities, float)
+        self.time_weight = _frozen(time_weight, float)
+        self.sensor_weight = _frozen(sensor_weight, float)
+
+    def __setattr__(self, key, value):
+        if key in self.__dict__:
+            raise AttributeError(f"ScoringSpec is immutable. Cannot reassign '{key}'")
+        super().__setattr__(key, value)
+
+    @classmethod
+    def compile(cls, config=None, rooms=(), devices=DEFAULT_DEVICES):
+        """Compile the ``scoring`` config section into lookup tables for the given rooms."""
+        config = config or {}
+        room_overrides = config.get('rooms') or {}
+        rooms = list(dict.fromkeys([*rooms, *room_overrides]))
+        default = _merge_scoring_config(_default_scoring_config(), config)
+        row_configs = [_merge_scoring_config(default, room_overrides.get(room) or {}) for room in rooms]
+        row_configs.append(default)
+
+        # Only metrics with both an optimal value and a condition can be scored
+        metrics = list(dict.fromkeys(
+            metric
+            for row in row_configs
+            for metric in row['optimal_values']
+            if metric in row['conditions']
+        ))
+
+        shape = (len(row_configs), len(metrics))
+        optimal_low = np.full(shape, np.nan)
+        optimal_high = np.full(shape, np.nan)
+        conditions = np.zeros(shape, dtype=np.int8)
+        weights = np.zeros((len(row_configs), len(devices), len(metrics)))
+        base_priorities = np.zeros((len(row_configs), len(devices)))
+        time_weight = np.zeros(len(row_configs))
+        sensor_weight = np.zeros(len(row_configs))
+
+        for r, row in enumerate(row_configs):
+            for m, metric in enumerate(metrics):
+                if metric not in row['optimal_values'] or metric not in row['conditions']:
+                    continue  # NaN optimal values leave the metric unscored for this room
+                condition = row['conditions'][metric]
+                if condition not in CONDITION_CODES:
+                    raise ValueError(f"Unknown condition '{condition}' for {metric}. "
+                                     f"Expected one of {list(CONDITION_CODES)}")
+                value = row['optimal_values'][metric]
+                low, high = value if isinstance(value, (list, tuple)) else (value, value)
+                optimal_low[r, m] = float(low)
+                optimal_high[r, m] = float(high)
+                conditions[r, m] = CONDITION_CODES[condition]
+
+            for d, device in enumerate(devices):
+                device_metrics = row['device_metrics'].get(device) or []
+                if not isinstance(device_metrics, dict):
+                    device_metrics = {metric: 1 for metric in device_metrics}
+                for metric, weight in device_metrics.items():
+                    if metric in metrics:
+                        weights[r, d, metrics.index(metric)] = float(weight)
+                base_priorities[r, d] = float(row['base_priorities'].get(device, 0))
+
+            time_weight[r] = float(row['time_weight'])
+            sensor_weight[r] = float(row['sensor_weight'])
+
+        return cls(
+            rooms=rooms,
+            metrics=metrics,
+            devices=devices,
+            optimal_low=optimal_low,
+            optimal_high=optimal_high,
+            conditions=conditions,
+            weights=weights,
+            base_priorities=base_priorities,
+            time_weight=time_weight,
+            sensor_weight=sensor_weight,
+        )
+
+    def row(self, room):
+        """Table row for a room, falling back to the default row."""
+        return self.room_index.get(room, self.default_row)
+
+    def rows(self, rooms):
+        return np.fromiter((self.row(room) for room in rooms), dtype=np.intp, count=len(rooms))
+
+
+class PriorityEngine:
+    """Scores all rooms for every device type in a single pass."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.devices = spec.devices
+        self.metrics = spec.metrics
+        self.device_index = spec.device_index
+        self.metric_index = spec.metric_index
+
+    def sensor_matrix(self, sensor_data):
+        """Build a rooms x metrics matrix from a list of sensor data dicts."""
+        values = np.full((len(sensor_data), len(self.metrics)), np.nan)
+        for r, data in enumerate(sensor_data):
+            for metric, value in data.items():
+                m = self.metric_index.get(metric)
+                if m is not None:
+                    values[r, m] = to_float(value)
+        return values
+
+    def time_scores(self, hours, device_index, room_index, n_rooms):
+        """Sum the time-since-off scores of individual entities into a rooms x devices matrix.
+
+        ``hours``, ``device_index`` and ``room_index`` hold one entry per entity. Entities that are no longer
+        off should be passed with 0 hours.
+        """
+        scores = individual_scores(
+            np.asarray(hours, dtype=float),
+            TIME_OPTIMAL_VALUE,
+            TIME_OPTIMAL_VALUE,
+            CONDITION_GREATER
+        )
+        totals = np.zeros((n_rooms, len(self.devices)))
+        np.add.at(totals, (np.asarray(room_index, dtype=int), np.asarray(device_index, dtype=int)), scores)
+        return totals
+
+    def sensor_scores(self, values, rows):
+        """Mean metric score per device, counting only metrics with a reading. Returns rooms x devices."""
+        spec = self.spec
+        scores = individual_scores(values, spec.optimal_low[rows], spec.optimal_high[rows], spec.conditions[rows])
+        present = ~np.isnan(scores)
+        weights = spec.weights[rows]
+        totals = np.einsum('rm,rdm->rd', np.where(present, scores, 0), weights)
+        counts = np.einsum('rm,rdm->rd', present.astype(float), weights)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(counts > 0, totals / counts, 0)
+
+    def priorities(self, values, rows, time_scores=None, weighting='sum'):
+        """Combine time and sensor scores. Returns (priorities, time scores, sensor scores), each rooms x devices.
+
+        ``rows`` holds the scoring table row of each room (see ``ScoringSpec.rows``). Priorities are inverted so
+        that the highest value wins, matching ``calculate_dynamic_priority``.
+        """
+        if weighting not in WEIGHTING_MODES:
+            raise ValueError(f"Unknown weighting '{weighting}'. Expected one of {WEIGHTING_MODES}")
+
+        spec = self.spec
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        time_scores = np.zeros((values.shape[0], len(self.devices))) if time_scores is None else time_scores
+        time_scores = time_scores + spec.base_priorities[rows]
+        sensor_scores = self.sensor_scores(values, rows)
+
+        if weighting == 'sum':
+            priorities = time_scores + sensor_scores
+        elif weighting == 'mean':
+            priorities = (time_scores + sensor_scores) / 2
+        else:
+            priorities = (time_scores * spec.time_weight[rows, None]
+                          + sensor_scores * spec.sensor_weight[rows, None])
+
+        return -priorities, time_scores, sensor_scores
+
+    def to_dicts(self, matrix):
+        """Convert a rooms x devices matrix to one ``{device: score}`` dict per room."""
+        return [dict(zip(self.devices, row.tolist())) for row in matrix]
+
+
+def _frozen(values, dtype):
+    array = np.array(values, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+def _default_scoring_config():
+    return {
+        'time_weight': TIME_WEIGHT,
+        'sensor_weight': SENSOR_WEIGHT,
+        'base_priorities': DEFAULT_BASE_PRIORITIES,
+        'device_metrics': DEFAULT_DEVICE_METRICS,
+        'optimal_values': DEFAULT_OPTIMAL_VALUES,
+        'conditions': DEFAULT_CONDITIONS,
+    }
+
+
+def _merge_scoring_config(base, overrides):
+    """Overlay a scoring config section on top of another. Mapping sections are merged key by key."""
+    merged = {}
+    for key, value in base.items():
+        override = overrides.get(key)
+        if override is None:
+            merged[key] = value
+        elif isinstance(value, dict):
+            merged[key] = {**value, **override}
+        else:
+            merged[key] = override
+    return merged
@@ -0,0 +1,67 @@
+"""Startup entity provisioning for the Air Quality app.
+
+Every entity definition the app sends to pyscript is collected into a
+manifest and hashed. Definitions whose hash matches the manifest persisted by
+the previous start, and whose entity still exists, are not sent again.
+"""
+import hashlib
+import json
+import os
+
+
+class Provisioner:
+    """Entity definitions of this start, diffed against the persisted manifest of the previous one."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.manifest = self.load()  # key -> digest sent by the previous start
+        self.definitions = {}  # key -> (service, entity_id, service kwargs)
+        self.stats = {'definitions': 0, 'sent': 0, 'unchanged': 0, 'removed': 0}
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return {}  # An unreadable manifest only means everything is sent again
+
+    @staticmethod
+    def digest(service, kwargs):
+        definition = json.dumps({'service': service, 'kwargs': kwargs}, sort_keys=True, default=str)
+        return hashlib.sha256(definition.encode()).hexdigest()
+
+    def add(self, key, service, entity_id=None, **kwargs):
+        """Register a definition. entity_id, if given, is checked for existence before skipping it."""
+        self.definitions[key] = (service, entity_id, kwargs)
+
+    def pending(self, exists):
+        """[(key, service, kwargs)] that are new, changed, or whose entity is missing according to exists()."""
+        pending = []
+        for key, (service, entity_id, kwargs) in self.definitions.items():
+            if (self.manifest.get(key) != self.digest(service, kwargs)
+                    or (entity_id is not None and not exists(entity_id))):
+                pending.append((key, service, kwargs))
+        return pending
+
+    def commit(self, sent):
+        """Record the definitions of this start as the manifest and persist it."""
+        manifest = {
+            key: self.digest(service, kwargs)
+            for key, (service, entity_id, kwargs) in self.definitions.items()
+        }
+        self.stats = {
+            'definitions': len(manifest),
+            'sent': len(sent),
+            'unchanged': len(manifest) - len(sent),
+            'removed': len(set(self.manifest) - set(manifest)),
+        }
+        self.manifest = manifest
+        if not self.path:
+            return
+
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, sort_keys=True)
+        os.replace(temporary_path, self.path)
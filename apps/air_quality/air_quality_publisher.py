@@ -0,0 +1,97 @@
+"""Write-behind, diff-only state publishing for the Air Quality app.
+
+The publisher remembers the last state sent for each entity. A write that
+matches it, or that stays within the entity's tolerance, is dropped. Everything
+else is queued, repeated writes to the same entity are coalesced, and the app
+flushes the queue in one timer callback.
+"""
+import math
+import re
+
+from air_quality_priority import to_float
+
+RESTART_EVENTS = (
+    'plugin_started',  # AppDaemon reconnected to Home Assistant
+    'homeassistant_start',
+)
+
+
+class StatePublisher:
+    """Tracks sent and pending entity states.
+
+    tolerances maps a regex (searched in the entity_id) to the largest numeric change that is not worth a
+    write. The first matching pattern wins.
+    """
+
+    def __init__(self, tolerances=None):
+        self.tolerance_patterns = [(re.compile(pattern), float(tolerance))
+                                   for pattern, tolerance in (tolerances or {}).items()]
+        self.tolerances = {}  # entity_id -> tolerance, resolved once per entity
+        self.sent = {}  # entity_id -> (state, attributes)
+        self.pending = {}  # entity_id -> (state, attributes)
+        self.stats = {'published': 0, 'written': 0, 'suppressed': 0, 'coalesced': 0, 'flushes': 0}
+
+    def tolerance(self, entity_id):
+        tolerance = self.tolerances.get(entity_id)
+        if tolerance is None:
+            tolerance = next((tolerance for pattern, tolerance in self.tolerance_patterns
+                              if pattern.search(entity_id)), 0.0)
+            self.tolerances[entity_id] = tolerance
+        return tolerance
+
+    def is_unchanged(self, entity_id, state, attributes, tolerance=None):
+        last = self.sent.get(entity_id)
+        if last is None:
+            return False
+        last_state, last_attributes = last
+        if attributes != last_attributes:
+            return False
+        if state == last_state:
+            return True
+
+        tolerance = self.tolerance(entity_id) if tolerance is None else tolerance
+        if tolerance <= 0:
+            return False
+        new_value, last_value = to_float(state), to_float(last_state)
+        if math.isnan(new_value) or math.isnan(last_value):
+            return False
+        return abs(new_value - last_value) <= tolerance
+
+    def publish(self, entity_id, state, attributes=None, tolerance=None):
+        """Queue a write. Returns True if the entity has a write pending afterwards."""
+        self.stats['published'] += 1
+        if self.is_unchanged(entity_id, state, attributes, tolerance):
+            self.stats['suppressed'] += 1
+            # A newer value that matches what HA already has cancels any queued write
+            if self.pending.pop(entity_id, None) is not None:
+                self.stats['coalesced'] += 1
+            return False
+
+        if entity_id in self.pending:
+            self.stats['coalesced'] += 1
+        self.pending[entity_id] = (state, attributes)
+        return True
+
+    def drain(self):
+        """Take every pending write and record it as sent. Returns [(entity_id, state, attributes), ...]."""
+        writes = [(entity_id, state, attributes) for entity_id, (state, attributes) in self.pending.items()]
+        self.sent.update(self.pending)
+        self.pending = {}
+        self.stats['written'] += len(writes)
+        self.stats['flushes'] += 1
+        return writes
+
+    def invalidate(self, entity_id=None, resend=False):
+        """Forget what was sent, so the next write goes through. Clears every entity if none is given.
+
+        With resend, the forgotten states are queued again unless a newer write is already pending. Returns True if
+        a write is pending afterwards.
+        """
+        if entity_id is None:
+            forgotten, self.sent = self.sent, {}
+        else:
+            forgotten = {entity_id: self.sent.pop(entity_id)} if entity_id in self.sent else {}
+        if resend:
+            for forgotten_id, write in forgotten.items():
+                self.pending.setdefault(forgotten_id, write)
+        return bool(self.pending)
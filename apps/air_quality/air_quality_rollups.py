@@ -0,0 +1,81 @@
+"""Time-bucket rollups for the Air Quality app's dashboard charts.
+
+Each room keeps min/mean/max buckets of every metric at a few fixed
+resolutions. Buckets live in time-indexed rings, so a sample updates one
+bucket per resolution in O(1) and a ring always covers the last
+``slots x seconds`` without any compaction.
+"""
+import numpy as np
+
+from air_quality_sensors import SENSOR_METRICS
+
+ROLLUP_RESOLUTIONS = {
+    '1m': (60, 60),  # name -> (bucket seconds, buckets kept)
+    '5m': (300, 288),
+    '1h': (3600, 24),
+}
+
+
+class SensorRollups:
+    """Min/sum/count/max buckets per resolution, as metrics x slots arrays indexed by bucket number modulo slots."""
+
+    def __init__(self, metrics=SENSOR_METRICS, resolutions=None):
+        self.metrics = tuple(metrics)
+        self.metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+        self.resolutions = dict(ROLLUP_RESOLUTIONS if resolutions is None else resolutions)
+        self.buckets = {}
+        for name, (seconds, slots) in self.resolutions.items():
+            shape = (len(self.metrics), slots)
+            self.buckets[name] = {
+                'number': np.full(shape, -1, dtype=np.int64),  # Bucket number held by each slot
+                'count': np.zeros(shape, dtype=np.int64),
+                'sum': np.zeros(shape),
+                'min': np.full(shape, np.nan),
+                'max': np.full(shape, np.nan),
+            }
+
+    def add(self, metric, value, timestamp):
+        m = self.metric_index[metric]
+        for name, (seconds, slots) in self.resolutions.items():
+            buckets = self.buckets[name]
+            number = int(timestamp // seconds)
+            slot = number % slots
+            if buckets['number'][m, slot] != number:  # The slot still holds a bucket from a previous lap
+                buckets['number'][m, slot] = number
+                buckets['count'][m, slot] = 0
+                buckets['sum'][m, slot] = 0.0
+                buckets['min'][m, slot] = value
+                buckets['max'][m, slot] = value
+            buckets['count'][m, slot] += 1
+            buckets['sum'][m, slot] += value
+            buckets['min'][m, slot] = min(buckets['min'][m, slot], value)
+            buckets['max'][m, slot] = max(buckets['max'][m, slot], value)
+
+    def has_samples(self, metric):
+        return any(np.any(buckets['count'][self.metric_index[metric]]) for buckets in self.buckets.values())
+
+    def series(self, metric, name, now, decimals=2):
+        """Chronological buckets of one resolution ending with the current one, as {'start', 'step', 'min', 'mean',
+        'max'}. start is the first bucket's timestamp and buckets without samples are None.
+        """
+        seconds, slots = self.resolutions[name]
+        buckets = self.buckets[name]
+        m = self.metric_index[metric]
+        numbers = np.arange(int(now // seconds) - slots + 1, int(now // seconds) + 1)
+        order = numbers % slots
+        filled = buckets['number'][m, order] == numbers
+
+        counts = np.where(filled, buckets['count'][m, order], 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = buckets['sum'][m, order] / counts
+
+        def compact(values):
+            return [round(value, decimals) if keep else None for value, keep in zip(values.tolist(), filled.tolist())]
+
+        return {
+            'start': int(numbers[0] * seconds),
+            'step': seconds,
+            'min': compact(buckets['min'][m, order]),
+            'mean': compact(means),
+            'max': compact(buckets['max'][m, order]),
+        }
@@ -0,0 +1,73 @@
+"""In-memory sensor history for the Air Quality app.
+
+Each room owns one preallocated ring buffer holding the most recent samples of
+every metric, fed from state-change events. Reading the latest value is O(1),
+and windowed reads return the last N samples or the last T seconds.
+"""
+import numpy as np
+
+SENSOR_METRICS = (
+    'pm2_5',
+    'pm10',
+    'pm1',
+    'pm4',
+    'humidity',
+    'temperature',
+    'air_pressure',
+    'co2',
+    'voc',
+    'nox',
+    'methane',
+    'carbon_monoxide',
+    'nitrogen_dioxide',
+    'ethanol',
+    'hydrogen',
+    'ammonia',
+)
+
+DEFAULT_CAPACITY = 720
+
+
+class SensorRingBuffer:
+    """Fixed-size ring buffer of (timestamp, value) samples per metric."""
+
+    def __init__(self, metrics=SENSOR_METRICS, capacity=DEFAULT_CAPACITY):
+        self.metrics = tuple(metrics)
+        self.metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+        self.capacity = capacity
+        self.values = np.full((len(self.metrics), capacity), np.nan)
+        self.timestamps = np.full((len(self.metrics), capacity), np.nan)
+        self.heads = np.zeros(len(self.metrics), dtype=np.intp)  # Next slot to write
+        self.counts = np.zeros(len(self.metrics), dtype=np.intp)
+        self.last = np.full(len(self.metrics), np.nan)  # Latest value per metric
+
+    def append(self, metric, value, timestamp):
+        m = self.metric_index[metric]
+        head = self.heads[m]
+        self.values[m, head] = value
+        self.timestamps[m, head] = timestamp
+        self.last[m] = value
+        self.heads[m] = (head + 1) % self.capacity
+        self.counts[m] = min(self.counts[m] + 1, self.capacity)
+
+    def has_samples(self, metric):
+        return self.counts[self.metric_index[metric]] > 0
+
+    def latest(self, metric):
+        """Most recent value of a metric, NaN if it has no samples."""
+        return self.last[self.metric_index[metric]].item()
+
+    def window(self, metric, samples=None, seconds=None, now=None):
+        """Chronological (timestamps, values) of the last ``samples`` samples and/or the last ``seconds``."""
+        m = self.metric_index[metric]
+        count = self.counts[m]
+        if samples is not None:
+            count = min(count, samples)
+        order = (self.heads[m] - count + np.arange(count)) % self.capacity
+        timestamps, values = self.timestamps[m, order], self.values[m, order]
+
+        if seconds is not None and count:
+            now = timestamps[-1] if now is None else now
+            recent = timestamps >= now - seconds
+            timestamps, values = timestamps[recent], values[recent]
+        return timestamps, values
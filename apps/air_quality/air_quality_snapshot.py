@@ -0,0 +1,79 @@
+"""Warm-restart snapshots for the Air Quality app.
+
+Per-room decision state (priority devices, cached decisions and diffuser duty
+cycle phases) is written to a small versioned JSON file, so a restarted
+instance picks up where the previous one stopped instead of re-deciding every
+room from scratch.
+"""
+import json
+import math
+import os
+from datetime import datetime
+
+import numpy as np
+
+SNAPSHOT_VERSION = 2  # 2: decision cache entries carry the warning bitmask
+
+
+def to_jsonable(value):
+    """Encode tuples, datetimes, NumPy arrays and NaN so from_jsonable restores them exactly."""
+    if isinstance(value, tuple):
+        return {'__tuple__': [to_jsonable(item) for item in value]}
+    if isinstance(value, list):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, np.ndarray):
+        return {'__array__': [None if math.isnan(item) else item for item in value.tolist()]}
+    if isinstance(value, float) and math.isnan(value):
+        return {'__nan__': True}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def from_jsonable(value):
+    if isinstance(value, list):
+        return [from_jsonable(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if '__tuple__' in value:
+        return tuple(from_jsonable(item) for item in value['__tuple__'])
+    if '__datetime__' in value:
+        return datetime.fromisoformat(value['__datetime__'])
+    if '__array__' in value:
+        return np.array([np.nan if item is None else item for item in value['__array__']], dtype=float)
+    if '__nan__' in value:
+        return math.nan
+    return {key: from_jsonable(item) for key, item in value.items()}
+
+
+class SnapshotStore:
+    """Versioned snapshot file. Unreadable, foreign or outdated snapshots load as None."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, state, saved_at):
+        if not self.path:
+            return
+        snapshot = {'version': SNAPSHOT_VERSION, 'saved_at': saved_at, 'state': to_jsonable(state)}
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file, separators=(',', ':'))
+        os.replace(temporary_path, self.path)
+
+    def load(self):
+        """Return (state, saved_at) or (None, None)."""
+        if not self.path or not os.path.exists(self.path):
+            return None, None
+        try:
+            with open(self.path) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            return None, None
+        if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+            return None, None
+        return from_jsonable(snapshot.get('state', {})), snapshot.get('saved_at')
@@ -0,0 +1,42 @@
+"""Startup timing for the Air Quality app.
+
+Import, setup and provisioning are recorded as durations. The first decision is
+recorded as the time since the module started importing, i.e. how long a
+cold start takes before the app is actually deciding.
+
+The app module imports this module before anything else, so the time it is
+imported is when the app's imports began. An AppDaemon reload re-runs the app
+module but not this one, so that time is only handed out once.
+"""
+from time import perf_counter
+
+STARTUP_PHASES = ('import', 'setup', 'provisioning', 'first_decision')
+
+_import_started = [perf_counter()]
+
+
+def take_import_started():
+    """perf_counter() when the app's imports began, or None if it was already taken by an earlier import."""
+    return _import_started.pop() if _import_started else None
+
+
+class StartupReport:
+    """Seconds per startup phase."""
+
+    def __init__(self, started):
+        self.started = started  # perf_counter() when the app module started importing
+        self.timings = {}
+
+    def record(self, phase, seconds):
+        self.timings[phase] = seconds
+
+    def mark(self, phase):
+        """Record the time since startup began the first time a phase is reached. Returns True that first time."""
+        if phase in self.timings:
+            return False
+        self.timings[phase] = perf_counter() - self.started
+        return True
+
+    def summary(self):
+        return {phase: round(self.timings[phase], 4) for phase in STARTUP_PHASES if phase in self.timings}
+
@@ -0,0 +1,61 @@
+"""Scheduled callback registry for the Air Quality app.
+
+Every run_in the app makes is registered under a (job, room) key. Scheduling
+a key again cancels the timers it supersedes, fired timers remove themselves,
+and keys scheduled without superseding whose live timer count keeps growing
+are reported as leaks.
+"""
+import itertools
+
+DEFAULT_MAX_PER_KEY = 8
+
+
+class TimerRegistry:
+    """Live run_in handles per (job, room) key."""
+
+    def __init__(self, max_per_key=DEFAULT_MAX_PER_KEY):
+        self.max_per_key = max_per_key
+        self.live = {}  # key -> {token: handle}
+        self.high_water = {}  # key -> count that last triggered a leak warning
+        self.tokens = itertools.count()
+        self.stats = {'scheduled': 0, 'fired': 0, 'cancelled': 0, 'leak_warnings': 0}
+
+    def __len__(self):
+        return sum(len(handles) for handles in self.live.values())
+
+    def token(self):
+        return next(self.tokens)
+
+    def add(self, key, token, handle):
+        """Register a handle. Returns True when the key's live count crosses a new leak threshold: max_per_key,
+        then every doubling after it.
+        """
+        handles = self.live.setdefault(key, {})
+        handles[token] = handle
+        self.stats['scheduled'] += 1
+
+        threshold = self.high_water.get(key, self.max_per_key)
+        if len(handles) > threshold:
+            self.high_water[key] = threshold * 2
+            self.stats['leak_warnings'] += 1
+            return True
+        return False
+
+    def supersede(self, key):
+        """Remove and return every live handle of the key so the caller can cancel them."""
+        handles = list(self.live.pop(key, {}).values())
+        self.stats['cancelled'] += len(handles)
+        return handles
+
+    def fired(self, key, token):
+        handles = self.live.get(key)
+        if handles is None or handles.pop(token, None) is None:
+            return
+        self.stats['fired'] += 1
+        if not handles:
+            del self.live[key]
+            self.high_water.pop(key, None)
+
+    def counts(self):
+        """{'job:room': live timers} for every key with a live timer."""
+        return {f'{job}:{room}': len(handles) for (job, room), handles in self.live.items()}
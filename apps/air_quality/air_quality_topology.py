@@ -0,0 +1,92 @@
+"""Room topology index for the Air Quality app.
+
+Entity matching used to run a regex pass over the entity registry on every
+decision. The index is built once instead: each room's controllable devices
+per device type, each room's entities per domain and every device type's
+patterns with their regexes compiled, so a lookup is a dict hit and a match
+only scans the few entities of one room and domain. The index holds registry
+data only and is dropped when Home Assistant reports an entity, device or area
+registry change.
+"""
+import re
+
+REGISTRY_EVENTS = (
+    'entity_registry_updated',
+    'device_registry_updated',
+    'area_registry_updated',
+)
+
+
+def entity_domain(entity_id):
+    return entity_id.split('.', 1)[0]
+
+
+class RoomTopology:
+    """Per-room, per-domain and per-device-type entity index, filled on first use.
+
+    load_devices(room) returns {device_type: [entity_id, ...]}, load_patterns(device_type) returns the device type's
+    (include patterns, flag) and load_domain(room, domain) returns the entity_ids of a domain in a room, or in the
+    whole house for room None.
+    """
+
+    def __init__(self, load_devices, load_patterns, load_domain):
+        self.load_devices = load_devices
+        self.load_patterns = load_patterns
+        self.load_domain = load_domain
+        self.room_devices = {}  # room -> {device_type: [entity_id, ...]}
+        self.patterns = {}  # device_type -> (include patterns, flag)
+        self.domains = {}  # (room, domain) -> [entity_id, ...]
+        self.device_rooms = {}  # device_type -> {entity_id: room}
+        self.regexes = {}  # pattern -> compiled regex, kept across invalidations
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _lookup(self, index, key, loader):
+        try:
+            value = index[key]
+        except KeyError:
+            value = index[key] = loader()
+            self.stats['misses'] += 1
+        else:
+            self.stats['hits'] += 1
+        return value
+
+    def devices(self, room):
+        """{device_type: [entity_id, ...]} of the room's controllable devices."""
+        return self._lookup(self.room_devices, room, lambda: self.load_devices(room))
+
+    def device_patterns(self, device_type):
+        return self._lookup(self.patterns, device_type, lambda: self.load_patterns(device_type))
+
+    def domain_entities(self, room, domain):
+        return self._lookup(self.domains, (room, domain), lambda: list(self.load_domain(room, domain)))
+
+    def rooms_of(self, device_type, rooms):
+        """{entity_id: room} of the device type's entities in the given rooms."""
+        return self._lookup(self.device_rooms, device_type, lambda: {
+            entity_id: room
+            for room in rooms
+            for entity_id in self.devices(room).get(device_type) or []
+        })
+
+    def regex(self, pattern):
+        compiled = self.regexes.get(pattern)
+        if compiled is None:
+            compiled = self.regexes[pattern] = re.compile(pattern)
+        return compiled
+
+    def match(self, room, domain, pattern=None):
+        """Entities of the domain in the room whose entity_id matches any of the patterns (a str or a list of
+        them). Every entity matches without patterns.
+        """
+        entities = self.domain_entities(room, domain)
+        if not pattern:
+            return list(entities)
+        regexes = [self.regex(item) for item in ([pattern] if isinstance(pattern, str) else pattern)]
+        return [entity_id for entity_id in entities if any(regex.search(entity_id) for regex in regexes)]
+
+    def invalidate(self):
+        self.room_devices.clear()
+        self.patterns.clear()
+        self.domains.clear()
+        self.device_rooms.clear()
+        self.stats['invalidations'] += 1
@@ -0,0 +1,81 @@
+"""Vectorized warning threshold evaluation for the Air Quality app.
+
+Low and high thresholds live in two NumPy vectors that are only updated when a
+threshold entity changes. Readings are compared in one operation and packed into
+a bitmask per room: bit ``2 * i`` flags sensor ``i`` below its low threshold and
+bit ``2 * i + 1`` flags it at or above its high threshold.
+"""
+import numpy as np
+
+from air_quality_priority import to_float
+
+THRESHOLDS = ('low', 'high')
+
+
+class WarningThresholds:
+    """Warning thresholds for every sensor type, held as low and high vectors."""
+
+    def __init__(self, defaults):
+        self.sensors = tuple(defaults)
+        self.sensor_index = {sensor: i for i, sensor in enumerate(self.sensors)}
+        self.low = np.array([float(defaults[sensor]['low']) for sensor in self.sensors])
+        self.high = np.array([float(defaults[sensor]['high']) for sensor in self.sensors])
+        self.low_bits = np.array([1 << (2 * i) for i in range(len(self.sensors))], dtype=np.int64)
+        self.high_bits = self.low_bits << 1
+        self.entities = {
+            f'input_number.warning_thresholds_{sensor}_{threshold}': (sensor, threshold)
+            for sensor in self.sensors
+            for threshold in THRESHOLDS
+        }
+
+    def set_threshold(self, sensor, threshold, value):
+        """Update one threshold. Returns False if the value is not numeric."""
+        value = to_float(value)
+        if np.isnan(value):
+            return False
+        vector = self.low if threshold == 'low' else self.high
+        vector[self.sensor_index[sensor]] = value
+        return True
+
+    def threshold(self, sensor, threshold):
+        vector = self.low if threshold == 'low' else self.high
+        return vector[self.sensor_index[sensor]].item()
+
+    def sensor_vector(self, sensor_data):
+        """Readings ordered like the threshold vectors. Missing sensors are NaN and never raise a warning."""
+        values = np.full(len(self.sensors), np.nan)
+        for sensor, value in sensor_data.items():
+            i = self.sensor_index.get(sensor)
+            if i is not None:
+                values[i] = to_float(value)
+        return values
+
+    def bitmask(self, values):
+        """Violation bitmask for a vector of readings, or one bitmask per row of a rooms x sensors matrix."""
+        with np.errstate(invalid='ignore'):
+            below = values < self.low
+            above = values >= self.high
+        return below.astype(np.int64) @ self.low_bits | above.astype(np.int64) @ self.high_bits
+
+    def violations(self, bitmask):
+        """Yield (sensor, threshold) for every bit set in a bitmask."""
+        bitmask = int(bitmask)
+        while bitmask:
+            bit = bitmask & -bitmask
+            position = bit.bit_length() - 1
+            yield self.sensors[position // 2], THRESHOLDS[position % 2]
+            bitmask ^= bit
+
+    def warnings(self, bitmask, values):
+        """Build the ``check_warnings`` dict, only for sensors in violation."""
+        warnings = {}
+        for sensor, threshold in self.violations(bitmask):
+            direction = 'above' if threshold == 'high' else 'below'
+            warning = warnings.setdefault(sensor, {
+                'high': False,
+                'low': False,
+                'value': values[self.sensor_index[sensor]].item()
+            })
+            warning[threshold] = True
+            warning['msg'] = f"{sensor.title()} is {direction} {threshold} threshold of {self.threshold(sensor, threshold)}."
+        return warnings
@@ -0,0 +1,520 @@
+"""Trace replay benchmark for the Air Quality app.
+
+Runs ``AirQuality`` against an in-process stand-in for AppDaemon's hassapi and
+the shared ``smarthome_global_v2`` layer, replays a recorded or synthetic sensor
+and occupancy trace through master_on, master_off and decide_device_activation,
+and reports decision throughput, latency and HA calls per decision. No Home
+Assistant instance is needed. Timers and the app's clock (``AirQuality.now``)
+both run on a virtual clock that follows the trace's timestamps.
+
+Usage:
+    python benchmarks/air_quality_replay.py --rooms 40 --steps 200
+    python benchmarks/air_quality_replay.py --trace trace.csv
+
+A recorded trace is a CSV with the columns ``timestamp,room,metric,value``.
+Timestamps are seconds. Use the metric ``occupancy`` with the value on/off for
+occupancy changes.
+"""
+import argparse
+import csv
+import heapq
+import itertools
+import os
+import random
+import sys
+import time
+import types
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apps', 'air_quality')
+
+DEVICES = {
+    # device type: (domain, entity suffix)
+    'purifier': ('fan', 'purifier'),
+    'humidifier': ('humidifier', 'humidifier'),
+    'fan': ('fan', 'fan'),
+    'oil_diffuser': ('humidifier', 'oil_diffuser'),
+}
+
+SENSORS = {
+    # metric: (entity suffix, initial value, random walk step)
+    'pm2_5': ('purifier_pm2_5', 20, 4),
+    'humidity': ('humidifier_current_humidity', 45, 1.5),
+    'temperature': ('temperature', 72, 0.3),
+    'co2': ('co2', 700, 40),
+    'voc': ('voc', 150, 15),
+}
+
+VIRTUAL_EPOCH = datetime(2024, 1, 1, tzinfo=pytz.utc).timestamp()  # Wall-clock time of virtual clock 0
+
+DATA_METRICS = (
+    'pm2_5', 'humidity', 'temperature', 'air_pressure', 'co2', 'voc', 'methane', 'carbon_monoxide',
+    'nitrogen_dioxide', 'ethanol', 'hydrogen', 'ammonia',
+)
+
+
+def pluralize(word):
+    return word if word.endswith('s') else f'{word}s'
+
+
+def calculate_individual_score(current_value, optimal_value, condition):
+    """smarthome_global_v2's scalar scorer. The app scores through PriorityEngine, which tests/test_priority.py
+    checks against this function.
+    """
+    if condition == 'lower':
+        return max(0, (current_value - optimal_value) / optimal_value)
+    if condition == 'greater':
+        return max(0, (optimal_value - current_value) / optimal_value)
+    low, high = optimal_value
+    if current_value < low:
+        return (low - current_value) / low
+    if current_value > high:
+        return (current_value - high) / high
+    return 0
+
+
+class FakeHass:
+    """In-process stand-in for the hassapi calls the app makes, with call counters and a virtual clock."""
+
+    def __init__(self, args, states):
+        self.args = args
+        self.states = states  # entity_id -> {'state': ..., 'attributes': {...}, 'last_changed': float}
+        self.clock = 0.0
+        self.calls = Counter()
+        self.timers = []  # heap of (due, sequence, handle, callback, kwargs)
+        self.cancelled = set()
+        self.handles = itertools.count()
+        self.state_listeners = defaultdict(list)  # entity_id -> [(handle, callback, kwargs)]
+        self.event_listeners = defaultdict(list)
+
+    # --- State ---
+    def get_state(self, entity_id=None, attribute=None, **kwargs):
+        self.calls['get_state'] += 1
+        if entity_id is not None and '.' not in entity_id:
+            return {key: value for key, value in self.states.items() if key.startswith(f'{entity_id}.')}
+        entity = self.states.get(entity_id)
+        if entity is None:
+            return None
+        if attribute == 'last_changed':
+            return entity['last_changed']
+        if attribute is not None:
+            return entity['attributes'].get(attribute)
+        return entity['state']
+
+    def set_state(self, entity_id, state=None, attributes=None, **kwargs):
+        self.calls['set_state'] += 1
+        self.update_state(entity_id, state, attributes)
+
+    def update_state(self, entity_id, state, attributes=None):
+        """Change a state and fire its listeners, like an HA state_changed event."""
+        entity = self.states.setdefault(entity_id, {'state': None, 'attributes': {}, 'last_changed': self.clock})
+        old = entity['state']
+        old_entity = {'state': old, 'attributes': dict(entity['attributes'])}
+        entity['attributes'].update(attributes or {})
+        if old != state:
+            entity['state'] = state
+            entity['last_changed'] = self.clock
+        if old_entity != {'state': state, 'attributes': entity['attributes']}:
+            new_entity = {'state': state, 'attributes': dict(entity['attributes'])}
+            for handle, callback, kwargs in list(self.state_listeners.get(entity_id.split('.', 1)[0], [])):
+                callback(entity_id, kwargs.get('attribute'), old_entity, new_entity, **{
+                    key: value for key, value in kwargs.items() if key != 'attribute'
+                })
+        if old == state:
+            return
+        for handle, callback, kwargs in list(self.state_listeners.get(entity_id, [])):
+            if not self._matches(kwargs.get('new'), state) or not self._matches(kwargs.get('old'), old):
+                continue
+            callback_kwargs = {key: value for key, value in kwargs.items() if key not in ('new', 'old', 'oneshot')}
+            if kwargs.get('oneshot'):
+                self.cancel_listen_state(handle)
+            callback(entity_id, 'state', old, state, **callback_kwargs)
+
+    @staticmethod
+    def _matches(expected, value):
+        if expected is None:
+            return True
+        return expected(value) if callable(expected) else expected == value
+
+    def call_service(self, service, **kwargs):
+        self.calls['call_service'] += 1
+        domain, action = service.split('/', 1)
+        entity_ids = kwargs.get('entity_id') or []
+        entity_ids = entity_ids if isinstance(entity_ids, list) else [entity_ids]
+        for entity_id in entity_ids:
+            if action == 'turn_on':
+                self.update_state(entity_id, 'on')
+            elif action == 'turn_off':
+                self.update_state(entity_id, 'off')
+
+    # --- Scheduler ---
+    def run_in(self, callback, delay=0, *args, **kwargs):
+        handle = next(self.handles)
+        heapq.heappush(self.timers, (self.clock + delay, handle, handle, callback, kwargs))
+        return handle
+
+    def run_every(self, callback, start='now', interval=60, **kwargs):
+        delay = int(start.split('+', 1)[1]) if isinstance(start, str) and '+' in start else 0
+
+        def repeat(**callback_kwargs):
+            self.run_in(repeat, delay=interval, **callback_kwargs)
+            callback(**callback_kwargs)
+
+        return self.run_in(repeat, delay=delay, **kwargs)
+
+    def cancel_timer(self, handle, *args, **kwargs):
+        self.cancelled.add(handle)
+
+    def run_due(self, until):
+        """Run every timer due up to the given virtual time."""
+        while self.timers and self.timers[0][0] <= until:
+            due, sequence, handle, callback, kwargs = heapq.heappop(self.timers)
+            if handle in self.cancelled:
+                self.cancelled.discard(handle)
+                continue
+            self.clock = max(self.clock, due)
+            callback(**kwargs)
+        self.clock = until
+
+    def run_sequence(self, sequence, **kwargs):
+        for step in sequence:
+            for service, service_kwargs in step.items():
+                if service != 'sleep':
+                    self.call_service(service, **service_kwargs)
+        return next(self.handles)
+
+    def cancel_sequence(self, handle):
+        pass
+
+    # --- Listeners ---
+    def listen_state(self, callback, entity_id=None, **kwargs):
+        handle = next(self.handles)
+        self.state_listeners[entity_id].append((handle, callback, kwargs))
+        return handle
+
+    def cancel_listen_state(self, handle):
+        for entity_id, listeners in self.state_listeners.items():
+            listeners[:] = [listener for listener in listeners if listener[0] != handle]
+
+    def listen_event(self, callback, event=None, **kwargs):
+        handle = next(self.handles)
+        self.event_listeners[event].append((handle, callback, kwargs))
+        return handle
+
+    def fire_event(self, event, **kwargs):
+        self.calls['fire_event'] += 1
+        for handle, callback, listener_kwargs in list(self.event_listeners.get(event, [])):
+            callback(event, kwargs, **listener_kwargs)
+
+    def log(self, *args, **kwargs):
+        pass
+
+
+class FakeController:
+    """Stand-in for the regex entity matching controller."""
+
+    def __init__(self, hass):
+        self.hass = hass
+
+    def _entities(self, area=None, domain=None, pattern=None, include_manual_entities=None, include_only=False,
+                  **kwargs):
+        if include_only:
+            return list(include_manual_entities or [])
+        patterns = pattern if isinstance(pattern, list) else [pattern] if pattern else []
+        patterns = [p.strip('$') for p in patterns]
+        return [
+            entity_id for entity_id in self.hass.states
+            if (domain is None or entity_id.startswith(f'{domain}.'))
+            and (area is None or entity_id.split('.', 1)[1].startswith(f'{area}_'))
+            and (not patterns or any(p in entity_id.split('.', 1)[1] for p in patterns))
+        ]
+
+    def get_matching_entities(self, get_attribute=None, device_state=None, persist=False, **kwargs):
+        self.hass.calls['controller_query'] += 1
+        matches = {}
+        for entity_id in self._entities(**kwargs):
+            entity = self.hass.states[entity_id]
+            self.hass.calls['get_state'] += 1
+            details = {'state': entity['state']}
+            if get_attribute == 'timedelta':
+                details['timedelta'] = timedelta(seconds=self.hass.clock - entity['last_changed'])
+                details['persist'] = device_state is None or entity['state'] == device_state
+            elif get_attribute:
+                details[get_attribute] = entity['attributes'].get(get_attribute)
+            matches[entity_id] = details
+        return matches
+
+    def command_matching_entities(self, hacs_commands, domain=None, device_state=None, identity_kwargs=None,
+                                  **kwargs):
+        entities = self._entities(domain=domain, **kwargs)
+        if isinstance(device_state, list):
+            entities = [entity_id for entity_id in entities if self.hass.states[entity_id]['state'] in device_state]
+        if not entities:
+            return {}
+        commands = hacs_commands if isinstance(hacs_commands, dict) else {hacs_commands: {}}
+        for command, command_kwargs in commands.items():
+            self.hass.call_service(f'{domain}/{command}', entity_id=entities, **command_kwargs)
+        return {domain: {'entities': entities}}
+
+
+class FakeManager:
+    def __init__(self, hass):
+        self.hass = hass
+
+    def is_room_occupied(self, room):
+        return self.hass.states.get(f'binary_sensor.{room}_occupancies', {}).get('state') == 'on'
+
+
+class FakeBase(FakeHass):
+    """Stand-in for smarthome_global_v2.Base: room discovery, overrides, debouncing and logging."""
+
+    def __init__(self, args, states, rooms):
+        super().__init__(args, states)
+        self.rooms = rooms
+        self.debounce = {}
+
+    def initialize(self):
+        self.app_name_short = 'air_quality'
+        self.timezone = pytz.timezone(self.args.get('timezone', 'America/Chicago'))
+        self.time_to_delay_start = 0
+        self.started = datetime.fromtimestamp(VIRTUAL_EPOCH + self.clock, self.timezone)
+        self.setup()
+
+    def setup(self):
+        self.controller = FakeController(self)
+        self.manager = FakeManager(self)
+        self.areas = [{'area_id': room, 'name': room, 'floor_id': 'main'} for room in self.rooms]
+        self.device_types = [pluralize(device) for device in DEVICES] + ['switches']
+        self.controllable = {
+            room: {
+                pluralize(device): {'all': {f'{domain}.{room}_{suffix}': {}}}
+                for device, (domain, suffix) in DEVICES.items()
+            }
+            for room in self.rooms
+        }
+        self.room_sensor_entities = {
+            room: {
+                **{metric: [f'sensor.{room}_{suffix}'] for metric, (suffix, start, step) in SENSORS.items()},
+                'occupancy': [f'binary_sensor.{room}_occupancies'],
+            }
+            for room in self.rooms
+        }
+
+    def get_entities(self, room):
+        return {
+            device: self.controllable[room][pluralize(device)]['all']
+            for device in DEVICES
+        }
+
+    def get_patterns(self, device_type, kind):
+        return {'pattern': [f"{device_type.rstrip('s')}$"]}, False
+
+    def _get_sensor_data(self, room):
+        data = dict.fromkeys(DATA_METRICS, np.nan)
+        for metric, entities in self.room_sensor_entities[room].items():
+            if metric in data:
+                data[metric] = float(self.get_state(entities[0]))
+        return data
+
+    def get_user_overrides(self):
+        return {
+            device: {
+                f'input_boolean.{room}_{device}_auto': {'state': self.get_state(f'input_boolean.{room}_{device}_auto')}
+                for room in self.rooms
+            }
+            for device in DEVICES
+        }
+
+    def get_master_overrides(self):
+        return {
+            device: {
+                f'input_boolean.automatic_{pluralize(device)}': {
+                    'state': self.get_state(f'input_boolean.automatic_{pluralize(device)}')
+                }
+            }
+            for device in DEVICES
+        }
+
+    def get_master_conditions(self, room, master_onoff='on'):
+        return {f'{pluralize(device)}_{master_onoff}': 'on' for device in DEVICES}
+
+    def get_time_until_ready(self):
+        return self.started
+
+    def get_current_app_settings(self):
+        return {}
+
+    def get_delay_off(self, room):
+        return 0
+
+    def should_debounce(self, key, seconds=1):
+        last = self.debounce.get(key)
+        self.debounce[key] = self.clock
+        return last is not None and self.clock - last < seconds
+
+    def log_info(self, message='', level='INFO', log_room=None, function_name=None, **kwargs):
+        self.calls['log_info'] += 1
+
+    def log_success_block(self, booleans, room, success, master_on_off, **kwargs):
+        self.set_state(f'sensor.{room}_{self.app_name_short}_{master_on_off}_last_triggered', state=str(success))
+
+    def master_automation_logic(self, commands=(), final_commands=(), **kwargs):
+        for command in commands:
+            self.controller.command_matching_entities(**command)
+
+    def _master_off(self, *args, **kwargs):
+        kwargs.setdefault('master_conditions', self.get_master_conditions(kwargs.get('room'), 'off'))
+        return self.master_off(**kwargs)
+
+
+def install_stand_ins():
+    """Register the stand-in modules so air_quality.py imports against them."""
+    hassapi = types.ModuleType('appdaemon.plugins.hass.hassapi')
+    hassapi.Hass = FakeHass
+    for name in ('appdaemon', 'appdaemon.plugins', 'appdaemon.plugins.hass'):
+        sys.modules.setdefault(name, types.ModuleType(name))
+    sys.modules['appdaemon.plugins.hass.hassapi'] = hassapi
+
+    smarthome = types.ModuleType('smarthome_global_v2')
+    smarthome.Base = FakeBase
+    smarthome.defaultdict = defaultdict
+    smarthome.pluralize = pluralize
+    smarthome.calculate_individual_score = calculate_individual_score
+    smarthome.__all__ = ['Base', 'defaultdict', 'pluralize', 'calculate_individual_score']
+    sys.modules['smarthome_global_v2'] = smarthome
+
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+
+
+def initial_states(rooms):
+    states = {}
+
+    def add(entity_id, state):
+        states[entity_id] = {'state': state, 'attributes': {}, 'last_changed': 0.0}
+
+    for room in rooms:
+        for device, (domain, suffix) in DEVICES.items():
+            add(f'{domain}.{room}_{suffix}', 'off')
+            add(f'input_boolean.{room}_{device}_auto', 'on')
+        for metric, (suffix, start, step) in SENSORS.items():
+            add(f'sensor.{room}_{suffix}', str(start))
+        add(f'binary_sensor.{room}_occupancies', 'off')
+    for device in DEVICES:
+        add(f'input_boolean.automatic_{pluralize(device)}', 'on')
+    return states
+
+
+def synthetic_trace(rooms, steps, interval=5.0, seed=0):
+    """Random-walk sensor readings and occupancy changes: [(timestamp, room, metric, value), ...]."""
+    rng = random.Random(seed)
+    values = {(room, metric): start for room in rooms for metric, (suffix, start, step) in SENSORS.items()}
+    trace = [(0.0, room, 'occupancy', 'on') for room in rooms[::2]]  # Half the house starts occupied
+    for i in range(steps):
+        timestamp = i * interval
+        for room in rooms:
+            for metric, (suffix, start, step) in SENSORS.items():
+                values[room, metric] = max(0.0, values[room, metric] + rng.gauss(0, step))
+                trace.append((timestamp, room, metric, round(values[room, metric], 1)))
+            if rng.random() < 0.05:
+                trace.append((timestamp, room, 'occupancy', rng.choice(['on', 'off'])))
+    return trace
+
+
+def load_trace(path):
+    with open(path, newline='') as handle:
+        return [
+            (float(row['timestamp']), row['room'], row['metric'], row['value'])
+            for row in csv.DictReader(handle)
+        ]
+
+
+def replay(rooms, trace, args=None):
+    """Replay a trace and return the benchmark report."""
+    install_stand_ins()
+    from air_quality import AirQuality
+
+    class ReplayAirQuality(AirQuality):
+        def now(self):
+            """The virtual clock as the app's local time, so timestamps advance with the replayed trace."""
+            return datetime.fromtimestamp(VIRTUAL_EPOCH + self.clock, self.timezone)
+
+    args = dict(args or {})
+    args.setdefault('latency_metrics', {'path': None})  # Don't write the OpenMetrics file from a benchmark
+    args.setdefault('provisioning', {'manifest': None})
+    args.setdefault('snapshot', {'path': None})
+    args.setdefault('history_store', {'path': None})
+    app = ReplayAirQuality(args, initial_states(rooms), rooms)
+    app.initialize()
+    app.run_due(app.clock)
+
+    latencies = []
+    per_decision = Counter()
+    occupancy = dict.fromkeys(rooms, 'off')
+    start = time.perf_counter()
+
+    for timestamp, steps in itertools.groupby(trace, key=lambda event: event[0]):
+        app.run_due(timestamp)
+        touched = set()
+        for _, room, metric, value in steps:
+            if metric == 'occupancy':
+                occupancy[room] = value
+                app.update_state(f'binary_sensor.{room}_occupancies', value)
+            else:
+                app.update_state(f"sensor.{room}_{SENSORS[metric][0]}", str(value))
+            touched.add(room)
+
+        for room in sorted(touched):
+            before = Counter(app.calls)
+            began = time.perf_counter()
+            if occupancy[room] == 'on':
+                app.master_on(room=room, master_conditions=app.get_master_conditions(room, 'on'))
+            else:
+                app.master_off(room=room, master_conditions=app.get_master_conditions(room, 'off'))
+            app.run_due(app.clock)  # Callbacks scheduled with delay=0 are part of the decision
+            latencies.append(time.perf_counter() - began)
+            per_decision.update(Counter(app.calls) - before)
+
+    elapsed = time.perf_counter() - start
+    decisions = len(latencies)
+    latencies = np.array(latencies) * 1000
+    return {
+        'rooms': len(rooms),
+        'decisions': decisions,
+        'decisions_per_second': decisions / elapsed if elapsed else 0.0,
+        'latency_p50_ms': float(np.percentile(latencies, 50)) if decisions else 0.0,
+        'latency_p99_ms': float(np.percentile(latencies, 99)) if decisions else 0.0,
+        **{
+            f'{call}_per_decision': per_decision[call] / decisions if decisions else 0.0
+            for call in ('get_state', 'set_state', 'call_service', 'controller_query')
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rooms', type=int, default=10, help='Number of synthetic rooms')
+    parser.add_argument('--steps', type=int, default=100, help='Number of synthetic trace steps')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace', help='Replay a recorded CSV trace instead of a synthetic one')
+    options = parser.parse_args(argv)
+
+    if options.trace:
+        trace = load_trace(options.trace)
+        rooms = sorted({room for _, room, _, _ in trace})
+    else:
+        rooms = [f'room_{i}' for i in range(options.rooms)]
+        trace = synthetic_trace(rooms, options.steps, seed=options.seed)
+
+    report = replay(rooms, trace, args={'timezone': 'America/Chicago'})
+    width = max(len(key) for key in report)
+    for key, value in report.items():
+        print(f'{key:<{width}}  {value:.3f}' if isinstance(value, float) else f'{key:<{width}}  {value}')
+
+
+if __name__ == '__main__':
+    main()
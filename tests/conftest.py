@@ -0,0 +1,26 @@
+"""Runs the Air Quality app against the replay benchmark's AppDaemon and smarthome_global_v2 stand-ins."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import air_quality_replay as replay  # noqa: E402
+
+replay.install_stand_ins()
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build and initialize an app for the given rooms, with its data files under tmp_path."""
+    def make(rooms=('room_0',), **args):
+        from air_quality import AirQuality
+
+        args.setdefault('data_dir', str(tmp_path))
+        app = AirQuality(args, replay.initial_states(list(rooms)), list(rooms))
+        app.initialize()
+        app.run_due(app.clock)
+        return app
+
+    return make
@@ -0,0 +1,110 @@
+"""Co2Trigger hysteresis, re-arm interval and the app's re-arm timer."""
+from datetime import datetime
+
+import air_quality_replay as replay
+import pytest
+
+from air_quality import AirQuality
+from air_quality_co2 import Co2Trigger
+
+
+@pytest.fixture
+def trigger():
+    trigger = Co2Trigger(rising=1100, falling=1000, rearm_interval=1800)
+    trigger.add_sensor('sensor.room_0_co2s', 'room_0', 800)
+    return trigger
+
+
+def test_fires_once_on_rising_crossing(trigger):
+    assert trigger.update('sensor.room_0_co2s', 1050, 0) is None
+    assert trigger.update('sensor.room_0_co2s', 1150, 10) == 'room_0'
+    assert trigger.update('sensor.room_0_co2s', 1300, 20) is None
+    assert trigger.update('sensor.room_0_co2s', 1050, 3000) is None  # Above falling, still high
+    assert trigger.stats['fired'] == 1
+
+
+def test_rearms_after_falling_threshold(trigger):
+    assert trigger.update('sensor.room_0_co2s', 1150, 0) == 'room_0'
+    assert trigger.update('sensor.room_0_co2s', 950, 100) is None
+    assert trigger.update('sensor.room_0_co2s', 1150, 2000) == 'room_0'
+
+
+def test_rate_limited_crossing_fires_when_interval_expires(trigger):
+    assert trigger.update('sensor.room_0_co2s', 1150, 0) == 'room_0'
+    trigger.update('sensor.room_0_co2s', 950, 100)
+    assert trigger.update('sensor.room_0_co2s', 1150, 200) is None
+    assert trigger.rearm_at('room_0') == 1800
+    assert trigger.stats['rate_limited'] == 1
+
+    assert trigger.update('sensor.room_0_co2s', 1160, 1000) is None
+    assert trigger.fire_pending('room_0', 1000) is False
+    assert trigger.stats['rate_limited'] == 1  # Counted once per crossing
+
+    assert trigger.fire_pending('room_0', 1800) is True
+    assert trigger.rearm_at('room_0') is None
+    assert trigger.fire_pending('room_0', 5000) is False
+
+
+def test_pending_fire_also_fires_on_a_later_reading(trigger):
+    trigger.update('sensor.room_0_co2s', 1150, 0)
+    trigger.update('sensor.room_0_co2s', 950, 100)
+    trigger.update('sensor.room_0_co2s', 1150, 200)
+    assert trigger.update('sensor.room_0_co2s', 1170, 1900) == 'room_0'
+
+
+def test_falling_clears_pending_fire(trigger):
+    trigger.update('sensor.room_0_co2s', 1150, 0)
+    trigger.update('sensor.room_0_co2s', 950, 100)
+    trigger.update('sensor.room_0_co2s', 1150, 200)
+    trigger.update('sensor.room_0_co2s', 950, 300)
+    assert trigger.rearm_at('room_0') is None
+    assert trigger.fire_pending('room_0', 1800) is False
+
+
+def test_highest_sensor_sets_the_level(trigger):
+    trigger.add_sensor('sensor.room_0_desk_co2s', 'room_0', 900)
+    assert trigger.update('sensor.room_0_desk_co2s', 1200, 0) == 'room_0'
+    assert trigger.update('sensor.room_0_desk_co2s', 900, 10) is None  # room_0_co2s reads 800
+    assert trigger.update('sensor.room_0_co2s', 1200, 20) is None  # Re-armed, but inside the interval
+    assert trigger.rearm_at('room_0') == 1800
+
+
+def test_fire_high_at_startup():
+    trigger = Co2Trigger(rising=1100, falling=1000, rearm_interval=1800)
+    trigger.add_sensor('sensor.room_0_co2s', 'room_0', 1200)
+    trigger.add_sensor('sensor.room_1_co2s', 'room_1', 800)
+    assert trigger.fire_high(0) == ['room_0']
+    assert trigger.fire_high(10) == []
+    assert trigger.rearm_at('room_0') == 1800
+
+
+def test_falling_above_rising_is_rejected():
+    with pytest.raises(ValueError):
+        Co2Trigger(rising=1000, falling=1100)
+
+
+def test_app_circulates_when_rearm_interval_expires(tmp_path):
+    states = replay.initial_states(['room_0'])
+    states['sensor.room_0_co2s'] = {'state': '800', 'attributes': {}, 'last_changed': 0.0}
+    app = AirQuality(
+        {'data_dir': str(tmp_path), 'co2_trigger': {'scope': 'room', 'rearm_interval': 600}},
+        states,
+        ['room_0'],
+    )
+    app.now = lambda: datetime.fromtimestamp(replay.VIRTUAL_EPOCH + app.clock, app.timezone)
+    circulated = []
+    app.circulate_air_logic = lambda **kwargs: circulated.append((app.clock, kwargs.get('target')))
+    app.initialize()
+    app.run_due(app.clock)
+    start = app.clock
+
+    app.update_state('sensor.room_0_co2s', '1150')
+    app.update_state('sensor.room_0_co2s', '950')
+    app.run_due(start + 60)
+    app.update_state('sensor.room_0_co2s', '1150')  # Rate limited, and the reading then holds steady
+    assert circulated == [(start, 'room_0')]
+
+    app.run_due(start + 599)
+    assert len(circulated) == 1
+    app.run_due(start + 600)
+    assert circulated == [(start, 'room_0'), (start + 600, 'room_0')]
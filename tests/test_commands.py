@@ -0,0 +1,72 @@
+"""CommandPlan merging, opposite-command cancellation and per-entity ordering."""
+from air_quality_commands import CommandPlan
+
+
+def calls(plan):
+    return [(domain, service, entity_ids, params) for domain, service, entity_ids, params, _ in plan.service_calls()]
+
+
+def test_same_service_merges_into_one_call():
+    plan = CommandPlan()
+    plan.add('fan', 'turn_on', 'fan.a')
+    plan.add('fan', 'turn_on', ['fan.b', 'fan.a'])
+    assert calls(plan) == [('fan', 'turn_on', ['fan.a', 'fan.b'], {})]
+    assert plan.planned == 2
+
+
+def test_params_and_identity_keep_calls_apart():
+    plan = CommandPlan()
+    plan.add('fan', 'set_percentage', 'fan.a', percentage=50)
+    plan.add('fan', 'set_percentage', 'fan.b', percentage=75)
+    plan.add('fan', 'set_percentage', 'fan.c', identity_kwargs='manual', percentage=50)
+    assert [(service, entity_ids, params) for _, service, entity_ids, params, _ in plan.service_calls()] == [
+        ('set_percentage', ['fan.a'], {'percentage': 50}),
+        ('set_percentage', ['fan.b'], {'percentage': 75}),
+        ('set_percentage', ['fan.c'], {'percentage': 50}),
+    ]
+
+
+def test_later_opposite_command_cancels_earlier_one():
+    plan = CommandPlan()
+    plan.add('humidifier', 'turn_on', ['humidifier.a', 'humidifier.b'])
+    plan.add('humidifier', 'turn_off', 'humidifier.a')
+    assert calls(plan) == [
+        ('humidifier', 'turn_on', ['humidifier.b'], {}),
+        ('humidifier', 'turn_off', ['humidifier.a'], {}),
+    ]
+    assert plan.planned_state('humidifier.a') == 'off'
+    assert plan.planned_state('humidifier.b') == 'on'
+    assert plan.planned_state('humidifier.c') is None
+
+
+def test_emptied_calls_are_skipped():
+    plan = CommandPlan()
+    plan.add('light', 'turn_on', 'light.a')
+    plan.add('light', 'turn_off', 'light.a')
+    plan.add('light', 'turn_on', 'light.a')
+    assert calls(plan) == [('light', 'turn_on', ['light.a'], {})]
+
+
+def test_merge_never_moves_a_command_before_an_earlier_one_for_the_entity():
+    plan = CommandPlan()
+    plan.add('fan', 'set_percentage', 'fan.a', percentage=50)
+    plan.add('fan', 'oscillate', 'fan.a', oscillating=True)
+    plan.add('fan', 'set_percentage', 'fan.a', percentage=50)  # Can't merge past the oscillate call
+    plan.add('fan', 'set_percentage', 'fan.b', percentage=50)  # Merges into the latest matching call
+    assert calls(plan) == [
+        ('fan', 'set_percentage', ['fan.a'], {'percentage': 50}),
+        ('fan', 'oscillate', ['fan.a'], {'oscillating': True}),
+        ('fan', 'set_percentage', ['fan.a', 'fan.b'], {'percentage': 50}),
+    ]
+
+
+def test_unrelated_entities_merge_past_other_calls():
+    plan = CommandPlan()
+    plan.add('fan', 'turn_on', 'fan.a')
+    plan.add('fan', 'set_percentage', 'fan.a', percentage=50)
+    plan.add('fan', 'turn_on', 'fan.b')
+    assert calls(plan) == [
+        ('fan', 'turn_on', ['fan.a', 'fan.b'], {}),
+        ('fan', 'set_percentage', ['fan.a'], {'percentage': 50}),
+    ]
+    assert len(plan) == 2
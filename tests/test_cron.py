@@ -0,0 +1,67 @@
+import pytest
+
+
+@pytest.fixture
+def deodorize_app(make_app):
+    app = make_app()
+    app.states['input_boolean.automatic_deodorize_and_refresh'] = {'state': 'on', 'attributes': {}, 'last_changed': 0}
+    app.service_calls = []
+    call_service = app.call_service
+
+    def record(service, **kwargs):
+        app.service_calls.append((service, kwargs.get('entity_id')))
+        return call_service(service, **kwargs)
+
+    app.call_service = record
+    return app
+
+
+def diffuser_commands(app):
+    return [service for service, entity_ids in app.service_calls if entity_ids == ['humidifier.room_0_oil_diffuser']]
+
+
+def test_deodorize_starts_the_diffusers_it_runs(deodorize_app):
+    app = deodorize_app
+    app.deodorize_and_refresh_logic()
+    app.run_due(app.clock + app.state_flush_interval)
+
+    assert diffuser_commands(app)[-2:] == ['humidifier/turn_on', 'humidifier/set_humidity']
+    assert app.get_state('humidifier.room_0_oil_diffuser') == 'on'
+    assert app.get_state('sensor.room_0_air_quality_deodorize_and_refresh') == 'Running'
+
+
+def test_deodorize_during_a_diffuser_on_phase_keeps_the_diffuser_on(deodorize_app):
+    app = deodorize_app
+    app.priority_devices['room_0'] = {'device': 'oil_diffuser', 'time': app.now()}
+    app.start_diffuser('room_0')
+    assert app.get_state('humidifier.room_0_oil_diffuser') == 'on'
+    app.service_calls.clear()
+
+    app.deodorize_and_refresh_logic()
+    app.run_due(app.clock)
+
+    assert diffuser_commands(app)[-2:] == ['humidifier/turn_on', 'humidifier/set_humidity']
+    assert app.get_state('humidifier.room_0_oil_diffuser') == 'on'
+
+
+def test_deodorize_final_commands_turn_the_diffusers_off(deodorize_app):
+    app = deodorize_app
+    app.deodorize_and_refresh_logic()
+    app.run_due(app.clock + 15 * 60 + app.state_flush_interval)
+
+    assert diffuser_commands(app)[-1] == 'humidifier/turn_off'
+    assert app.get_state('humidifier.room_0_oil_diffuser') == 'off'
+    assert app.get_state('sensor.room_0_air_quality_deodorize_and_refresh') == 'Not Running'
+    assert app.cron_job_runs['deodorize_and_refresh'].finished
+
+
+def test_replacing_an_unfinished_run_keeps_its_final_commands(deodorize_app):
+    app = deodorize_app
+    app.deodorize_and_refresh_logic()
+    app.run_due(app.clock + 60)
+    app.states['input_boolean.automatic_deodorize_and_refresh']['state'] = 'off'
+    app.debounce.clear()
+    app.deodorize_and_refresh_logic()  # Fails its checks, so it has no final commands of its own
+    app.run_due(app.clock + 15 * 60)
+
+    assert app.get_state('humidifier.room_0_oil_diffuser') == 'off'
@@ -0,0 +1,32 @@
+from air_quality_commands import CommandPlan
+
+DIFFUSER = 'humidifier.room_0_oil_diffuser'
+
+
+def start_duty_cycle(app):
+    app.priority_devices['room_0'] = {'device': 'oil_diffuser', 'time': app.now()}
+    app.start_diffuser('room_0')
+    assert app.diffuser_scheduler.phase(app.diffuser_scheduler.group('room_0')) == 'on'
+
+
+def test_off_phase_switches_the_diffuser_off(make_app):
+    app = make_app()
+    start_duty_cycle(app)
+    plan = CommandPlan()
+
+    app.turn_off_diffuser('room_0', plan=plan)
+
+    assert plan.planned_state(DIFFUSER) == 'off'
+    assert app.diffuser_scheduler.group('room_0') is None
+
+
+def test_off_phase_leaves_diffusers_the_plan_turns_on(make_app):
+    app = make_app()
+    start_duty_cycle(app)
+    plan = CommandPlan()
+    plan.add('humidifier', 'turn_on', [DIFFUSER])
+
+    app.turn_off_diffuser('room_0', plan=plan)
+
+    assert plan.planned_state(DIFFUSER) == 'on'
+    assert list(plan.service_calls()) == [('humidifier', 'turn_on', [DIFFUSER], {}, None)]
@@ -0,0 +1,88 @@
+"""HistoryStore rows, segment rotation, restarts and retention."""
+import os
+
+import numpy as np
+import pytest
+
+from air_quality_history import HistoryStore
+
+METRICS = ('pm2_5', 'co2')
+DEVICES = ('fan', 'purifier', 'humidifier')
+DAY = 86400
+
+
+def make_store(path, **kwargs):
+    kwargs.setdefault('segment_seconds', DAY)
+    kwargs.setdefault('retention_seconds', 3 * DAY)
+    kwargs.setdefault('segment_rows', 16)
+    return HistoryStore(str(path), METRICS, DEVICES, **kwargs)
+
+
+def append(store, room, timestamp, pm2_5=10.0, device='fan'):
+    store.append(room, timestamp, {'pm2_5': pm2_5, 'co2': 600}, {'fan': 1.5, 'purifier': 0.5}, device, 2.0)
+
+
+def test_rows_round_trip(tmp_path):
+    store = make_store(tmp_path)
+    append(store, 'room_0', 100, pm2_5=12.0, device=['fan', 'purifier'])
+    append(store, 'room_1', 200, device=None)
+
+    rows = store.query(0, 1000)
+    assert rows['timestamp'].tolist() == [100, 200]
+    assert rows['room'].tolist() == ['room_0', 'room_1']
+    assert rows['device'].tolist() == [('fan', 'purifier'), ()]
+    assert rows['pm2_5'].tolist() == [12.0, 10.0]
+    assert rows['fan_score'].tolist() == [1.5, 1.5]
+    assert np.isnan(rows['humidifier_score']).all()
+
+    only = store.query(0, 1000, rooms=['room_1'], columns=['co2'])
+    assert set(only) == {'timestamp', 'room', 'device', 'co2'}
+    assert only['room'].tolist() == ['room_1']
+
+
+def test_segments_rotate_by_window_and_size(tmp_path):
+    store = make_store(tmp_path, segment_rows=2)
+    for timestamp in (10, 20, 30):
+        append(store, 'room_0', timestamp)
+    append(store, 'room_0', DAY + 10)
+
+    assert store.segment_names() == [f'{0:012d}_0000', f'{0:012d}_0001', f'{DAY:012d}_0000']
+    assert store.query(0, 2 * DAY)['timestamp'].tolist() == [10, 20, 30, DAY + 10]
+    assert store.query(15, DAY)['timestamp'].tolist() == [20, 30]
+
+
+def test_restart_continues_the_open_segment(tmp_path):
+    store = make_store(tmp_path)
+    append(store, 'room_0', 10)
+    store.flush()
+
+    reopened = make_store(tmp_path)
+    append(reopened, 'room_1', 20)
+    assert reopened.segment_names() == [f'{0:012d}_0000']
+    rows = reopened.query(0, DAY)
+    assert rows['timestamp'].tolist() == [10, 20]
+    assert rows['room'].tolist() == ['room_0', 'room_1']
+
+
+def test_segments_past_retention_are_deleted(tmp_path):
+    store = make_store(tmp_path)
+    for day in range(6):
+        append(store, 'room_0', day * DAY + 10)
+
+    # Opening day 5 keeps windows ending after 5 * DAY - 3 * DAY
+    assert store.segment_names() == [f'{day * DAY:012d}_0000' for day in (2, 3, 4, 5)]
+    assert store.stats['expired'] == 2
+    assert store.query(0, 6 * DAY)['timestamp'].tolist() == [day * DAY + 10 for day in (2, 3, 4, 5)]
+
+
+def test_no_path_disables_the_store(tmp_path):
+    store = HistoryStore(None, METRICS, DEVICES)
+    append(store, 'room_0', 10)
+    assert store.stats['appended'] == 0
+    assert store.segment_names() == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_too_many_device_types_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        HistoryStore(str(tmp_path), METRICS, [f'device_{i}' for i in range(17)])
@@ -0,0 +1,19 @@
+"""Latency percentiles go to their own sensors; per-stage histograms only to the OpenMetrics file."""
+
+
+def test_publish_latency_leaves_provisioned_sensors_alone(make_app, tmp_path):
+    metrics_path = tmp_path / 'latency.prom'
+    app = make_app(latency_metrics={'path': str(metrics_path)})
+    app.states['sensor.room_0_air_quality_on_latency'] = {'state': '0.25', 'attributes': {}, 'last_changed': 0.0}
+    app.update_state('binary_sensor.room_0_occupancies', 'on')
+    app.master_on(room='room_0', master_conditions=app.get_master_conditions('room_0', 'on'))
+    app.run_due(app.clock)
+
+    app.publish_latency()
+    app.run_due(app.clock + app.state_flush_interval)
+
+    assert app.states['sensor.room_0_air_quality_on_latency']['state'] == '0.25'
+    percentiles = app.states['sensor.room_0_air_quality_on_latency_percentiles']
+    assert set(percentiles['attributes']) == {'unit_of_measurement', 'p99', 'count'}
+    assert percentiles['attributes']['count'] >= 1
+    assert 'room="room_0",stage="sensor_fetch"' in metrics_path.read_text()
@@ -0,0 +1,108 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from air_quality_priority import (CONDITION_CODES, DEFAULT_BASE_PRIORITIES, DEFAULT_CONDITIONS, DEFAULT_DEVICE_METRICS,
+                                  DEFAULT_OPTIMAL_VALUES, PriorityEngine, ScoringSpec, individual_scores)
+from air_quality_replay import calculate_individual_score  # smarthome_global_v2's scalar scorer
+
+
+def scalar_priority(sensor_data, inactive_hours, weighting):
+    """The per-room, per-metric loop calculate_dynamic_priority ran before the engine, given each device type's
+    hours since off.
+    """
+    priorities = dict(DEFAULT_BASE_PRIORITIES)
+    for device, hours in inactive_hours:
+        priorities[device] += calculate_individual_score(current_value=hours, optimal_value=1, condition='greater')
+
+    device_sensor_scores = {}
+    for device, metrics in DEFAULT_DEVICE_METRICS.items():
+        scores = []
+        for metric in metrics:
+            current_value = sensor_data.get(metric)
+            if current_value is not None and not math.isnan(current_value):
+                scores.append(calculate_individual_score(
+                    current_value=current_value,
+                    optimal_value=DEFAULT_OPTIMAL_VALUES[metric],
+                    condition=DEFAULT_CONDITIONS[metric]
+                ))
+        device_sensor_scores[device] = sum(scores) / len(scores) if scores else 0
+
+    for device in priorities:
+        sensor_score = device_sensor_scores.get(device, 0)
+        time_score = priorities[device]
+        if weighting == 'sum':
+            priorities[device] += sensor_score
+        elif weighting == 'mean':
+            priorities[device] = (time_score + sensor_score) / 2
+        elif weighting == 'weighted':
+            priorities[device] = time_score * 0.4 + sensor_score * 0.6
+        priorities[device] *= -1
+    return priorities
+
+
+def random_room(rng):
+    sensor_data = {}
+    for metric, optimal in DEFAULT_OPTIMAL_VALUES.items():
+        if rng.random() < 0.2:
+            continue  # Metric without a sensor
+        high = optimal[1] if isinstance(optimal, tuple) else optimal
+        sensor_data[metric] = math.nan if rng.random() < 0.1 else rng.uniform(0, 2.5 * high)
+    inactive_hours = [(device, rng.choice([0, rng.uniform(0, 5)])) for device in DEFAULT_BASE_PRIORITIES
+                      for _ in range(rng.randint(0, 2))]
+    return sensor_data, inactive_hours
+
+
+@pytest.mark.parametrize('condition', sorted(CONDITION_CODES))
+def test_individual_scores_match_the_scalar_score(condition):
+    optimal = (40, 60) if condition == 'range' else 50
+    low, high = optimal if condition == 'range' else (optimal, optimal)
+    values = np.linspace(0, 150, 301)
+    expected = [calculate_individual_score(value, optimal, condition) for value in values.tolist()]
+    np.testing.assert_allclose(individual_scores(values, low, high, CONDITION_CODES[condition]), expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize('weighting', ['sum', 'mean', 'weighted'])
+def test_engine_matches_the_scalar_path_for_every_room(weighting):
+    rng = random.Random(weighting)
+    rooms = {f'room_{i}': random_room(rng) for i in range(40)}
+    spec = ScoringSpec.compile(rooms=list(rooms))
+    engine = PriorityEngine(spec)
+
+    hours, device_index, room_index = [], [], []
+    for r, (sensor_data, inactive_hours) in enumerate(rooms.values()):
+        for device, device_hours in inactive_hours:
+            hours.append(device_hours)
+            device_index.append(engine.device_index[device])
+            room_index.append(r)
+    values = engine.sensor_matrix([sensor_data for sensor_data, _ in rooms.values()])
+    time_scores = engine.time_scores(hours, device_index, room_index, len(rooms))
+    priorities, _, _ = engine.priorities(values, spec.rows(list(rooms)), time_scores, weighting)
+
+    for room, batched in zip(rooms, engine.to_dicts(priorities)):
+        expected = scalar_priority(*rooms[room], weighting)
+        assert batched == pytest.approx(expected, rel=1e-12, abs=1e-12)
+
+
+def test_mode_change_scores_every_occupied_room_in_one_pass(make_app):
+    rooms = ['room_0', 'room_1', 'room_2', 'room_3']
+    app = make_app(rooms)
+    for room in rooms[:3]:
+        app.update_state(f'binary_sensor.{room}_occupancies', 'on')
+    passes = []
+    calculate_dynamic_priorities = app.calculate_dynamic_priorities
+
+    def record(sensor_data=None, weighting='sum'):
+        passes.append(sorted(sensor_data))
+        return calculate_dynamic_priorities(sensor_data, weighting=weighting)
+
+    app.calculate_dynamic_priorities = record
+    app.update_state('input_select.house_mode', 'Night')
+    app.update_state('input_select.house_mode', 'Eco')  # Coalesced with the first change
+    app.run_due(app.clock + 1)
+
+    assert passes == [rooms[:3]]
+    assert app.priority_batch is None
+    assert set(app.decision_cache.entries) >= set(rooms[:3])
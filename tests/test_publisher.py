@@ -0,0 +1,33 @@
+from air_quality_publisher import RESTART_EVENTS, StatePublisher
+
+
+def test_drain_suppresses_unchanged_writes():
+    publisher = StatePublisher()
+    assert publisher.publish('sensor.a', 1)
+    assert publisher.drain() == [('sensor.a', 1, None)]
+    assert not publisher.publish('sensor.a', 1)
+    assert publisher.drain() == []
+
+
+def test_invalidate_resend_queues_sent_states_without_overwriting_pending():
+    publisher = StatePublisher()
+    publisher.publish('sensor.a', 1)
+    publisher.publish('sensor.b', 2)
+    publisher.drain()
+    publisher.publish('sensor.b', 3)
+
+    assert publisher.invalidate(resend=True)
+    assert publisher.drain() == [('sensor.b', 3, None), ('sensor.a', 1, None)]
+
+
+def test_restart_events_rewrite_published_states(make_app):
+    app = make_app()
+    app.run_due(app.clock + 30)
+    written = dict(app.state_publisher.sent)
+    assert written
+
+    for event in RESTART_EVENTS:
+        app.calls.clear()
+        app.fire_event(event)
+        app.run_due(app.clock + app.state_flush_interval)
+        assert app.calls['set_state'] >= len(written)
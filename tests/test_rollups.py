@@ -0,0 +1,54 @@
+"""SensorRollups bucketing and ring wraparound."""
+import pytest
+
+from air_quality_rollups import SensorRollups
+
+
+@pytest.fixture
+def rollups():
+    return SensorRollups(metrics=('pm2_5', 'co2'), resolutions={'10s': (10, 3), '30s': (30, 2)})
+
+
+def test_samples_in_one_bucket_aggregate(rollups):
+    for timestamp, value in [(100, 4.0), (103, 8.0), (109, 6.0)]:
+        rollups.add('pm2_5', value, timestamp)
+    series = rollups.series('pm2_5', '10s', now=109)
+    assert series['start'] == 80
+    assert series['step'] == 10
+    assert series['min'] == [None, None, 4.0]
+    assert series['mean'] == [None, None, 6.0]
+    assert series['max'] == [None, None, 8.0]
+
+
+def test_series_is_chronological_with_gaps(rollups):
+    rollups.add('pm2_5', 1.0, 100)
+    rollups.add('pm2_5', 3.0, 125)
+    series = rollups.series('pm2_5', '10s', now=125)
+    assert series['start'] == 100
+    assert series['mean'] == [1.0, None, 3.0]
+
+    coarse = rollups.series('pm2_5', '30s', now=125)
+    assert coarse['start'] == 90
+    assert coarse['mean'] == [1.0, 3.0]
+
+
+def test_slot_from_a_previous_lap_is_reset(rollups):
+    rollups.add('pm2_5', 50.0, 100)
+    rollups.add('pm2_5', 2.0, 130)  # Same slot as 100 one lap later
+    series = rollups.series('pm2_5', '10s', now=130)
+    assert series['min'] == [None, None, 2.0]
+    assert series['max'] == [None, None, 2.0]
+
+
+def test_stale_buckets_are_not_reported(rollups):
+    rollups.add('pm2_5', 5.0, 100)
+    series = rollups.series('pm2_5', '10s', now=200)
+    assert series['mean'] == [None, None, None]
+
+
+def test_metrics_are_kept_apart(rollups):
+    assert not rollups.has_samples('co2')
+    rollups.add('co2', 800.0, 100)
+    assert rollups.has_samples('co2')
+    assert not rollups.has_samples('pm2_5')
+    assert rollups.series('pm2_5', '10s', now=100)['mean'] == [None, None, None]
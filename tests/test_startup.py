@@ -0,0 +1,20 @@
+"""Startup report timing across a cold import and an AppDaemon-style reload."""
+import importlib
+
+import air_quality
+import air_quality_startup
+
+
+def test_cold_import_is_timed():
+    assert air_quality.IMPORT_SECONDS is not None and air_quality.IMPORT_SECONDS > 0
+    assert air_quality_startup.take_import_started() is None  # Already taken by the app module
+
+
+def test_reload_times_from_setup(make_app):
+    reloaded = importlib.reload(air_quality)
+    assert reloaded.IMPORT_STARTED is None
+
+    app = make_app()
+    summary = app.startup_report.summary()
+    assert 'import' not in summary
+    assert 0 <= summary['setup'] < 60
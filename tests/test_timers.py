@@ -0,0 +1,37 @@
+"""Every timer goes through the registry, and keys that pile up are reported."""
+from air_quality_timers import TimerRegistry
+
+
+def test_startup_one_shots_are_registered(make_app):
+    app = make_app()
+    assert app.timer_registry.stats['scheduled'] > 0
+    assert ('provision_entities', None) not in app.timer_registry.live  # Fired and removed
+    assert app.timer_registry.stats['fired'] > 0
+
+
+def test_state_flushes_coalesce_into_one_timer(make_app):
+    app = make_app()
+    app.run_due(app.clock + app.state_flush_interval)
+    for value in range(5):
+        app.publish_state('sensor.room_0_test', state=value)
+    assert app.timer_registry.counts().get('flush_states:None') == 1
+
+    app.run_due(app.clock + app.state_flush_interval)
+    assert ('flush_states', None) not in app.timer_registry.live
+    assert app.states['sensor.room_0_test']['state'] == 4
+
+
+def test_non_superseding_key_is_reported_as_leak(make_app):
+    app = make_app()
+    for _ in range(app.timer_registry.max_per_key + 1):
+        app.schedule(('stuck', 'room_0'), lambda **kwargs: None, delay=60, supersede=False)
+    assert app.timer_registry.stats['leak_warnings'] == 1
+
+    app.schedule(('stuck', 'room_0'), lambda **kwargs: None, delay=60)
+    assert app.timer_registry.counts()['stuck:room_0'] == 1
+
+
+def test_leak_threshold_doubles():
+    registry = TimerRegistry(max_per_key=2)
+    warned = [registry.add(('job', None), registry.token(), handle) for handle in range(9)]
+    assert [index for index, warning in enumerate(warned) if warning] == [2, 4, 8]
@@ -0,0 +1,57 @@
+from air_quality_commands import CommandPlan
+from air_quality_topology import RoomTopology
+
+ENTITIES = {
+    ('kitchen', 'fan'): ['fan.kitchen_purifier', 'fan.kitchen_fan', 'fan.kitchen_hvac_fan'],
+    ('kitchen', 'light'): ['light.kitchen_ceiling', 'light.kitchen_oil_diffuser'],
+}
+
+
+def make_topology(loads):
+    def load_domain(room, domain):
+        loads.append((room, domain))
+        return ENTITIES.get((room, domain), [])
+
+    return RoomTopology(
+        load_devices=lambda room: {'purifiers': ['fan.kitchen_purifier']},
+        load_patterns=lambda device_type: ({'pattern': [f"{device_type.rstrip('s')}$"]}, False),
+        load_domain=load_domain,
+    )
+
+
+def test_match_filters_the_room_domain_with_compiled_patterns():
+    topology = make_topology([])
+    assert topology.match('kitchen', 'fan', ['purifier$']) == ['fan.kitchen_purifier']
+    assert topology.match('kitchen', 'fan', 'fan$') == ['fan.kitchen_fan', 'fan.kitchen_hvac_fan']
+    assert topology.match('kitchen', 'light', 'oil_diffuser') == ['light.kitchen_oil_diffuser']
+    assert topology.match('kitchen', 'light') == ENTITIES['kitchen', 'light']
+    assert topology.match('office', 'fan', 'fan$') == []
+
+
+def test_each_room_domain_is_loaded_once_until_invalidated():
+    loads = []
+    topology = make_topology(loads)
+    for _ in range(3):
+        topology.match('kitchen', 'fan', 'purifier$')
+        topology.match('kitchen', 'fan', 'fan$')
+    assert loads == [('kitchen', 'fan')]
+    assert len(topology.regexes) == 2
+
+    topology.invalidate()
+    topology.match('kitchen', 'fan', 'purifier$')
+    assert loads == [('kitchen', 'fan'), ('kitchen', 'fan')]
+
+
+def test_devices_and_rooms_of_come_from_the_loaders():
+    topology = make_topology([])
+    assert topology.devices('kitchen') == {'purifiers': ['fan.kitchen_purifier']}
+    assert topology.device_patterns('fans') == ({'pattern': ['fan$']}, False)
+    assert topology.rooms_of('purifiers', ['kitchen']) == {'fan.kitchen_purifier': 'kitchen'}
+
+
+def test_planned_commands_match_through_the_index(make_app):
+    app = make_app()
+    app.calls.clear()
+    for _ in range(3):
+        app.turn_on_purifier(room='room_0', plan=CommandPlan())
+    assert app.calls['controller_query'] <= 1